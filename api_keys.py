@@ -0,0 +1,180 @@
+"""API Key 索引：启动/变更时一次性构建的不可变索引，请求路径 O(1) 查找 + 常量时间比较。
+
+- 索引以 SHA-256(key) 为键，映射到 `KeyEntry`（kid、租户元数据、原始密钥用于签名 URL）。
+  查找只对候选值做一次摘要与一次字典查找，再用 `hmac.compare_digest` 确认。
+- 来源：`internal_api_key`、`internal_api_keys`、`api_keys`，以及可选的密钥文件
+  `api_keys_file`（JSON：`{"kid": "key"}` 或 `{"kid": {"key": "...", "tenant": "..."}}`，
+  适配 k8s Secret 挂载）。
+- `ApiKeyRegistry` 在配置对象被替换或密钥文件 mtime 变化时重建索引并原子替换引用，
+  轮换密钥无需重启；文件读取或解析失败（如写入中途）时沿用上次成功解析的文件密钥。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("app.api_keys")
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+@dataclass(frozen=True)
+class KeyEntry:
+    secret: str
+    digest: bytes
+    kid: Optional[str] = None
+    tenant: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class ApiKeyIndex:
+    """不可变索引；构建后不再修改，可被多个请求无锁并发读取。"""
+
+    def __init__(self, entries: List[KeyEntry]):
+        by_digest: Dict[bytes, KeyEntry] = {}
+        by_kid: Dict[str, KeyEntry] = {}
+        for e in entries:
+            # 同一密钥多处出现时保留首个（带 kid 的条目优先于匿名条目）
+            prev = by_digest.get(e.digest)
+            if prev is None or (prev.kid is None and e.kid is not None):
+                by_digest[e.digest] = e
+            if e.kid is not None:
+                by_kid[e.kid] = e
+        self.by_digest = by_digest
+        self.by_kid = by_kid
+        self.single: Optional[KeyEntry] = next(iter(by_digest.values())) if len(by_digest) == 1 else None
+
+    def __len__(self) -> int:
+        return len(self.by_digest)
+
+    def lookup(self, candidate: Optional[str]) -> Optional[KeyEntry]:
+        if not candidate:
+            return None
+        d = _digest(candidate)
+        entry = self.by_digest.get(d)
+        if entry is None or not hmac.compare_digest(entry.digest, d):
+            return None
+        return entry
+
+    def for_kid(self, kid: Optional[str]) -> Optional[KeyEntry]:
+        """按 kid 取密钥；未提供 kid 时仅当全局唯一密钥时可用。"""
+        if kid:
+            return self.by_kid.get(kid)
+        return self.single
+
+    @classmethod
+    def from_sources(
+        cls,
+        internal_api_key: Optional[str],
+        internal_api_keys: List[str],
+        api_keys: Dict[str, Any],
+    ) -> "ApiKeyIndex":
+        entries: List[KeyEntry] = []
+        if internal_api_key:
+            entries.append(KeyEntry(internal_api_key, _digest(internal_api_key)))
+        for k in internal_api_keys or []:
+            if k:
+                entries.append(KeyEntry(k, _digest(k)))
+        for kid, value in (api_keys or {}).items():
+            meta: Dict[str, Any] = {}
+            if isinstance(value, dict):
+                meta = {k: v for k, v in value.items() if k != "key"}
+                value = value.get("key")
+            if not value:
+                continue
+            entries.append(
+                KeyEntry(value, _digest(value), kid=kid, tenant=meta.get("tenant", kid), metadata=meta)
+            )
+        return cls(entries)
+
+
+class ApiKeyRegistry:
+    """持有当前索引；检测到配置或密钥文件变化时重建并原子替换。"""
+
+    def __init__(self, settings, check_interval_s: float = 5.0):
+        self.settings = settings
+        self.check_interval_s = check_interval_s
+        self._index = ApiKeyIndex([])
+        self._fingerprint: Optional[Tuple] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._file_keys: Tuple[Optional[str], Dict[str, Any]] = (None, {})  # (路径, 上次成功解析的内容)
+        self.reloads = 0
+        self.errors = 0
+        self.reload()
+
+    def _config_fingerprint(self) -> Tuple:
+        s = self.settings
+        # 配置字段被整体替换（如热更新/测试中 setattr）时对象标识会变化
+        return (
+            s.internal_api_key,
+            id(s.internal_api_keys),
+            id(s.api_keys),
+            s.api_keys_file,
+        )
+
+    def _file_mtime(self) -> Optional[float]:
+        path = self.settings.api_keys_file
+        if not path:
+            return None
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_file(self) -> Dict[str, Any]:
+        path = self.settings.api_keys_file
+        if not path:
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("api keys file must contain a JSON object")
+        return data
+
+    def _file_sourced_keys(self) -> Dict[str, Any]:
+        """读取密钥文件；读取或解析失败（如写入中途）时沿用同一路径上次成功解析的密钥。"""
+        path = self.settings.api_keys_file
+        try:
+            data = self._load_file()
+        except (OSError, ValueError) as e:
+            prev_path, prev = self._file_keys
+            keep = prev if prev_path == path else {}
+            self.errors += 1
+            logger.warning("load api keys file failed, keeping previous %d file keys: %s", len(keep), e)
+            return keep
+        self._file_keys = (path, data)
+        return data
+
+    def reload(self) -> ApiKeyIndex:
+        with self._lock:
+            s = self.settings
+            fingerprint = (self._config_fingerprint(), self._file_mtime())
+            api_keys: Dict[str, Any] = dict(s.api_keys or {})
+            api_keys.update(self._file_sourced_keys())
+            self._index = ApiKeyIndex.from_sources(s.internal_api_key, s.internal_api_keys, api_keys)
+            self._fingerprint = fingerprint
+            self.reloads += 1
+            return self._index
+
+    def current(self) -> ApiKeyIndex:
+        """返回当前索引；配置字段变化立即重建，文件变化按 `check_interval_s` 节流检测。"""
+        now = time.monotonic()
+        fp = self._fingerprint
+        if fp is not None and fp[0] == self._config_fingerprint():
+            if now < self._next_check:
+                return self._index
+            self._next_check = now + self.check_interval_s
+            if fp[1] == self._file_mtime():
+                return self._index
+        return self.reload()
@@ -6,12 +6,12 @@ FastAPI 集成多维数组会话管理的示例
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from session_manager import SessionManager
+from indexed_session_manager import IndexedSessionManager
 
 app = FastAPI(title="AI API with Multidimensional Array Session Management", version="2.0.0")
 
 # 全局会话管理器
-session_manager = SessionManager(max_history_length=100, session_timeout_minutes=30)
+session_manager = IndexedSessionManager(max_history_length=100, session_timeout_minutes=30)
 
 
 class ChatRequest(BaseModel):
@@ -1,53 +1,161 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langchain_community.llms import Tongyi
-from typing import List, Dict, Any, AsyncIterator
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import logging
+import socket
 import dotenv
 from config import settings
+from tracing import langchain_callbacks
+from rolling_summary import turns_after
+from profiles import Profile, ProfileIndex
 
 dotenv.load_dotenv()
+logger = logging.getLogger("app.chain")
+
+# 预热用的样例输入：覆盖知识库参考、滚动摘要、长期记忆召回与最近历史四类消息
+_WARMUP_INPUT = {
+    "message": "预热",
+    "raw_history": [{"seq": 1, "user_message": "你好", "bot_message": "您好，请问有什么可以帮您？"}],
+    "summary": {"text": "用户咨询退货流程，已提供订单号 123。", "upto_seq": 0, "turns": 1},
+    "recalled": [{"user_message": "订单号是多少", "bot_message": "您的订单号是 123"}],
+    "knowledge": [{"question": "如何退货", "answer": "七天内可申请退货"}],
+}
+
+_SUMMARY_SYSTEM_PROMPT = """你负责压缩客服对话的上下文。请把“已有摘要”与“新增对话”合并为一份新的摘要：
+保留用户的身份信息、诉求、已确认的事实（订单号、时间、数量等）、助手已给出的结论和尚未解决的问题，
+省略寒暄与重复内容。用中文书写，不超过 {max_chars} 字，只输出摘要正文。"""
+
+_DEFAULT_SYSTEM_PROMPT = """你是一个专业的智能客服助手，请遵循以下规则：
+            1. 友好，专业地回答客户问题
+            2. 如果不知道答案，请礼貌地告知客户不知道
+            3. 保持回答简洁明了
+            4. 根据对话历史提供连贯回复
+            5. 用中文回答"""
 
 class ChatChain:
     def __init__(self):
-        self.llms = None
+        self.llms: Dict[Tuple[str, float], Tongyi] = {}  # (模型, 温度) -> 客户端，画像间共享
         self.chain = None
+        self.profile_chains: Dict[Profile, Runnable] = {}  # 画像 -> 已编译链路，整体替换不原地修改
         self.parser = StrOutputParser()
 
     async def initialize(self):
+        if self.chain is not None:
+            return  # 提示模板与链路只构建一次
         # 使用集中配置
-        self.llm = Tongyi(model=settings.model_name, temperature=settings.temperature)
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    """你是一个专业的智能客服助手，请遵循以下规则：
-            1. 友好，专业地回答客户问题
-            2. 如果不知道答案，请礼貌地告知客户不知道
-            3. 保持回答简洁明了
-            4. 根据对话历史提供连贯回复
-            5. 用中文回答""",
-                ),
-                MessagesPlaceholder(variable_name="history"),
-                ("human", "{message}"),
-            ]
+        self.llm = self._llm_for(None, None)
+        self.prompt = self._prompt(None)
+        # LLM 之前的部分（历史格式化 + 提示渲染），可单独空跑预热
+        self.render = RunnablePassthrough.assign(history=RunnableLambda(self._format_history)) | self.prompt
+        self.chain = self.render | self.llm | self.parser
+        # 滚动摘要：把早期轮次折叠进会话摘要（后台执行，不在请求路径上）
+        self.summary_prompt = ChatPromptTemplate.from_messages(
+            [("system", _SUMMARY_SYSTEM_PROMPT), ("human", "已有摘要：\n{summary}\n\n新增对话：\n{dialogue}")]
         )
-        self.chain = (
-            RunnablePassthrough.assign(history=RunnableLambda(self._format_history))
-            | self.prompt
-            | self.llm
-            | self.parser
+        self.summary_chain = self.summary_prompt | self.llm | self.parser
+        await self.warmup()
+
+    def _llm_for(self, model_name: Optional[str], temperature: Optional[float]) -> Tongyi:
+        """按 (模型, 温度) 复用 Tongyi 客户端；None 沿用默认配置。"""
+        key = (model_name or settings.model_name, settings.temperature if temperature is None else temperature)
+        llm = self.llms.get(key)
+        if llm is None:
+            llm = self.llms[key] = Tongyi(model=key[0], temperature=key[1])
+        return llm
+
+    @staticmethod
+    def _prompt(system_prompt: Optional[str]) -> ChatPromptTemplate:
+        # 租户提示词作为字面消息，其中的花括号不会被当作模板变量
+        system = SystemMessage(content=system_prompt) if system_prompt else ("system", _DEFAULT_SYSTEM_PROMPT)
+        return ChatPromptTemplate.from_messages(
+            [system, MessagesPlaceholder(variable_name="history"), ("human", "{message}")]
+        )
+
+    def _compile(self, profile: Profile) -> Runnable:
+        render = RunnablePassthrough.assign(history=RunnableLambda(self._format_history)) | self._prompt(
+            profile.system_prompt
+        )
+        return render | self._llm_for(profile.model_name, profile.temperature) | self.parser
+
+    def chain_for(self, profile: Optional[Profile]) -> Runnable:
+        """画像对应的已编译链路（字典查找）；未预编译的画像首次使用时编译。"""
+        if profile is None:
+            return self.chain
+        chain = self.profile_chains.get(profile)
+        if chain is None:
+            chain = self._compile(profile)
+            self.profile_chains = {**self.profile_chains, profile: chain}
+        return chain
+
+    def compile_profiles(self, index: ProfileIndex) -> None:
+        """画像重载时预编译：内容未变的画像沿用原链路，新表构建完成后整体替换。
+
+        在途请求已持有旧链路引用，替换不影响其继续输出。
+        """
+        current = self.profile_chains
+        self.profile_chains = {p: current.get(p) or self._compile(p) for p in index.profiles()}
+
+    async def warmup(self):
+        """空跑一次历史格式化与提示渲染（不调用 LLM），提前完成模板解析、消息校验等首次调用开销。"""
+        await self.render.ainvoke(_WARMUP_INPUT)
+        await self.summary_prompt.ainvoke(self._summary_input(None, _WARMUP_INPUT["raw_history"], 600))
+
+    async def prewarm_upstream(self, timeout_s: float = 2.0) -> bool:
+        """预解析上游域名并启动默认线程池（Tongyi 的异步接口在线程池中执行同步 SDK 调用）。
+
+        dashscope SDK 每次调用新建 HTTP 会话，预先建立的连接无法复用，这里只提前完成 DNS 解析与线程创建；
+        失败不影响启动。
+        """
+        import dashscope
+
+        host = urlparse(dashscope.base_http_api_url).hostname
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(loop.run_in_executor(None, socket.getaddrinfo, host, 443), timeout_s)
+            return True
+        except Exception as e:
+            logger.warning("prewarm upstream %s failed: %s", host, e)
+            return False
+
+    @staticmethod
+    def _summary_input(summary: Optional[str], turns: List[Dict], max_chars: int) -> Dict[str, Any]:
+        dialogue = "\n".join(f"用户：{m['user_message']}\n助手：{m['bot_message']}" for m in turns)
+        return {"summary": summary or "（无）", "dialogue": dialogue, "max_chars": max_chars}
+
+    async def summarize(self, summary: Optional[str], turns: List[Dict], max_chars: int = 600) -> str:
+        """把 `turns` 合并进已有摘要 `summary`，返回新摘要；失败时抛出异常，由调用方保留原摘要。"""
+        result = await self.summary_chain.ainvoke(
+            self._summary_input(summary, turns, max_chars), config={"callbacks": langchain_callbacks()}
         )
+        return result.strip()
 
-    async def process_message(self, message: str, history: List[Dict]) -> str:
-        """处理消息"""
+    async def process_message(
+        self,
+        message: str,
+        history: List[Dict],
+        recalled: Optional[List[Dict]] = None,
+        knowledge: Optional[List[Dict]] = None,
+        summary: Optional[Dict] = None,
+        profile: Optional[Profile] = None,
+    ) -> str:
+        """处理消息；`recalled` 为长期记忆召回的早期轮次，`knowledge` 为知识库检索到的参考问答，
+        `summary` 为会话的滚动摘要（提示词只带摘要之后的轮次），`profile` 为租户画像（None 使用默认链路）"""
         try:
             input_data = {
                 "message": message,
                 "raw_history": history,
+                "recalled": recalled,
+                "knowledge": knowledge,
+                "summary": summary,
             }
-            response = await self.chain.ainvoke(input_data)
+            response = await self.chain_for(profile).ainvoke(
+                input_data, config={"callbacks": langchain_callbacks()}
+            )
             return response.strip()
         except Exception as e:
             print(f"处理消息失败: {e}")
@@ -57,11 +165,26 @@ class ChatChain:
         """格式化对话历史 为langchain 消息格式"""
 
         history = input_data.get("raw_history", [])
-        if not history:
+        recalled = input_data.get("recalled")
+        knowledge = input_data.get("knowledge")
+        summary = input_data.get("summary")
+        if not history and not recalled and not knowledge and not summary:
             return []
 
         messages: List[BaseMessage] = []
-        recent_history = history[-10:] if len(history) > 10 else history
+        if knowledge:
+            lines = [f"问：{k['question']}\n答：{k['answer']}" for k in knowledge]
+            messages.append(SystemMessage(content="以下是知识库中可能相关的参考资料，仅在相关时使用：\n" + "\n".join(lines)))
+        if summary:
+            # 摘要覆盖的早期轮次不再逐条带入
+            messages.append(SystemMessage(content="以下是本会话较早对话的摘要：\n" + summary["text"]))
+            history = turns_after(history, summary)
+        if recalled:
+            # 早期相关轮次作为补充背景，放在最近窗口之前
+            lines = [f"用户：{m['user_message']}\n助手：{m['bot_message']}" for m in recalled]
+            messages.append(SystemMessage(content="以下是本会话中与当前问题相关的早期对话：\n" + "\n".join(lines)))
+        turns = settings.prompt_history_turns
+        recent_history = history[-turns:] if turns else []
         for msg in recent_history:
             if msg["user_message"]:
                 messages.append(HumanMessage(content=msg["user_message"]))
@@ -69,14 +192,32 @@ class ChatChain:
                 messages.append(AIMessage(content=msg["bot_message"]))
         return messages
 
-    async def stream_message(self, message: str, history: List[Dict]) -> AsyncIterator[str]:
+    async def stream_message(
+        self,
+        message: str,
+        history: List[Dict],
+        recalled: Optional[List[Dict]] = None,
+        knowledge: Optional[List[Dict]] = None,
+        summary: Optional[Dict] = None,
+        profile: Optional[Profile] = None,
+    ) -> AsyncIterator[str]:
         """流式处理消息，逐块产出文本片段。
 
         说明：依赖 LangChain 的 astream 能力，将解析后字符串片段逐步返回。
         """
-        input_data = {"message": message, "raw_history": history}
+        input_data = {
+            "message": message,
+            "raw_history": history,
+            "recalled": recalled,
+            "knowledge": knowledge,
+            "summary": summary,
+        }
+        # 开始时取定链路，流式过程中画像重载不影响本次输出
+        chain = self.chain_for(profile)
         try:
-            async for chunk in self.chain.astream(input_data):
+            async for chunk in chain.astream(
+                input_data, config={"callbacks": langchain_callbacks()}
+            ):
                 # chunk 通常为 str 片段
                 if chunk:
                     yield str(chunk)
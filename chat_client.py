@@ -1,47 +1,358 @@
-"""聊天客户端模块 - 用于测试智能对话服务API"""
+"""聊天客户端模块 - 用于测试智能对话服务API
 
-import requests
-import json
+- `AsyncChatClient`：基于共享连接池的 `httpx.AsyncClient`，同一进程内的多个会话复用连接（keep-alive）；
+  `session()` 返回绑定会话 id 的 `ChatSession`，可用 `asyncio.gather` 并发驱动大量会话。
+- 流式：`stream()` 消费 `/chat/stream` 的 SSE，逐片段产出；`signed=True` 时以签名 URL 走 GET（不发送 API Key 头）。
+- 重试：连接错误、超时与 429/502/503/504 按指数退避（全抖动，优先采用 `Retry-After`）重试。
+  每次调用带幂等键（未指定时自动生成），服务端据此去重：重试不会重复生成或计费；
+  流式中途断开时以同一幂等键重连：响应带 `Idempotent-Replayed: true`（服务端回放同一次生成）时跳过已收到的部分后继续；
+  否则（重连到其他副本、服务端重启或幂等记录已过期，服务端重新生成）不拼接，抛出 `ChatError`。
+- `ChatClient`：同步外观，供已有脚本使用（内部在私有事件循环上驱动异步客户端）。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import random
+import secrets
 import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+
+RETRY_STATUS = frozenset({429, 502, 503, 504})
+
+
+class ChatError(Exception):
+    """请求失败（HTTP 错误状态、重试耗尽或流内 error 事件）。"""
+
+    def __init__(
+        self,
+        detail: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[str] = None,
+    ):
+        super().__init__(detail if status_code is None else f"{status_code}: {detail}")
+        self.detail = detail
+        self.status_code = status_code
+        self.retryable = retryable  # 连接错误或可重试状态码
+        self.retry_after = retry_after
+
+
+async def iter_sse(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    """按 SSE 规范增量解析行流，逐个产出 `(event, data)`；多行 data 以换行连接，缺省事件名为 message。"""
+    event, data = "", []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event or "message", "\n".join(data)
+            event, data = "", []
+            continue
+        if line.startswith(":"):
+            continue  # 注释 / 心跳
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event or "message", "\n".join(data)
+
+
+def sign_stream_url(
+    base_url: str, key: str, session_id: str, message: str, ttl_s: int = 300, kid: Optional[str] = None
+) -> str:
+    """生成 GET /chat/stream 的签名 URL：HMAC-SHA256-HEX(method, path, session_id, message, exp, nonce)。"""
+    path = "/chat/stream"
+    exp = int(time.time()) + int(ttl_s)
+    nonce = secrets.token_hex(8)
+    to_sign = "\n".join(["GET", path, session_id, message, str(exp), nonce])
+    sig = hmac.new(key.encode("utf-8"), to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    qs = {"session_id": session_id, "message": message, "exp": str(exp), "nonce": nonce, "sig": sig}
+    if kid:
+        qs["kid"] = kid
+    return base_url.rstrip("/") + path + "?" + urlencode(qs, safe="")
+
+
+def _detail(response: httpx.Response) -> str:
+    try:
+        return str(response.json().get("detail", response.text))
+    except (ValueError, AttributeError):
+        return response.text
+
+
+class AsyncChatClient:
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        api_key: Optional[str] = None,
+        kid: Optional[str] = None,
+        timeout_s: float = 60.0,
+        max_connections: int = 100,
+        max_keepalive_connections: Optional[int] = None,
+        retries: int = 3,
+        backoff_s: float = 0.2,
+        backoff_max_s: float = 5.0,
+        signed_url_ttl_s: int = 300,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.kid = kid  # 签名 URL 的密钥 ID（服务端配置多密钥时需要）
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+        self.signed_url_ttl_s = signed_url_ttl_s
+        self.retried = 0
+        # 在途请求数以信号量限制为连接上限：超出的会话在客户端排队，不进入 httpx 连接池的等待队列
+        # （排队请求多时池内分配开销大，且会关闭刚归还的连接）；保活上限默认等于连接上限
+        self._slots = asyncio.Semaphore(max_connections)
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"X-API-Key": api_key} if api_key else None,
+            timeout=httpx.Timeout(timeout_s),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections if max_keepalive_connections is None else max_keepalive_connections,
+            ),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncChatClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    def session(self, session_id: Optional[str] = None) -> "ChatSession":
+        return ChatSession(self, session_id or f"session_{uuid.uuid4().hex[:12]}")
+
+    # ---------- 重试 ----------
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), self.backoff_max_s)
+            except ValueError:
+                pass  # HTTP 日期格式按指数退避处理
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_s * 2**attempt))
+
+    async def _send_once(self, build: Callable[[], httpx.Request], stream: bool = False) -> httpx.Response:
+        """发送一次请求；连接错误或错误状态码抛出 ChatError（标明是否可重试）。"""
+        try:
+            if stream:  # 流式由调用方持有信号量直至读完
+                response = await self.http.send(build(), stream=True)
+            else:
+                async with self._slots:
+                    response = await self.http.send(build())
+        except httpx.TransportError as e:
+            raise ChatError(f"{type(e).__name__}: {e}", retryable=True) from e
+        if response.status_code < 400:
+            return response
+        if stream:
+            await response.aread()
+            await response.aclose()
+        raise ChatError(
+            _detail(response),
+            response.status_code,
+            retryable=response.status_code in RETRY_STATUS,
+            retry_after=response.headers.get("Retry-After"),
+        )
+
+    async def _send(self, build: Callable[[], httpx.Request]) -> httpx.Response:
+        """发送请求，对连接错误与可重试状态码退避重试；失败时抛出 ChatError。"""
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._send_once(build)
+            except ChatError as e:
+                if not e.retryable or attempt == self.retries:
+                    raise
+                delay = self._backoff(attempt, e.retry_after)
+            self.retried += 1
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    # ---------- 对话 ----------
+    async def chat(self, message: str, session_id: str, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        headers = {"Idempotency-Key": idempotency_key or uuid.uuid4().hex}
+        payload = {"message": message, "session_id": session_id}
+        response = await self._send(lambda: self.http.build_request("POST", "/chat", json=payload, headers=headers))
+        return response.json()
+
+    def _stream_request(self, message: str, session_id: str, headers: Dict[str, str], signed: bool) -> httpx.Request:
+        if not signed:
+            payload = {"message": message, "session_id": session_id}
+            return self.http.build_request("POST", "/chat/stream", json=payload, headers=headers)
+        if not self.api_key:
+            raise ChatError("signed stream requires api_key")
+        # nonce 一次性：每次尝试重新签名；签名 URL 不携带 API Key 头
+        url = sign_stream_url(self.base_url, self.api_key, session_id, message, self.signed_url_ttl_s, self.kid)
+        request = self.http.build_request("GET", url, headers=headers)
+        del request.headers["X-API-Key"]
+        return request
+
+    async def stream(
+        self, message: str, session_id: str, idempotency_key: Optional[str] = None, signed: bool = False
+    ) -> AsyncIterator[str]:
+        """流式对话，逐片段产出文本；流内 error 事件抛出 ChatError。
+
+        建立连接失败与中途断开共用同一重试次数（`retries`），不在 `_send` 中再重试。
+        """
+        headers = {"Idempotency-Key": idempotency_key or uuid.uuid4().hex}
+        received = 0
+        for attempt in range(self.retries + 1):
+            await self._slots.acquire()
+            try:
+                response = await self._send_once(
+                    lambda: self._stream_request(message, session_id, headers, signed), stream=True
+                )
+            except ChatError as e:
+                self._slots.release()
+                if not e.retryable or attempt == self.retries:
+                    raise
+                self.retried += 1
+                await asyncio.sleep(self._backoff(attempt, e.retry_after))
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+            if received and response.headers.get("Idempotent-Replayed") != "true":
+                # 服务端重新生成了回复（如重连到其他副本），与已产出的片段不是同一次生成，不能拼接
+                await response.aclose()
+                self._slots.release()
+                raise ChatError(f"stream interrupted after {received} chunks and the server did not replay it")
+            skip = received  # 服务端回放同一次生成（从头开始），跳过已产出的片段
+            ended = False
+            try:
+                # 读到响应体结束（而非 end 事件处即返回），连接才能归还连接池复用
+                async for event, data in iter_sse(response.aiter_lines()):
+                    if ended:
+                        continue
+                    if event == "end":
+                        ended = True
+                    elif event == "error":
+                        raise ChatError(data)
+                    elif skip:
+                        skip -= 1
+                    else:
+                        received += 1
+                        yield data
+                if ended:
+                    return
+                raise httpx.RemoteProtocolError("stream closed before end event")
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise ChatError(f"{type(e).__name__}: {e}") from e
+            finally:
+                await response.aclose()
+                self._slots.release()
+            self.retried += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    # ---------- 会话 ----------
+    async def history(self, session_id: str, before: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
+        params = {"limit": limit} if before is None else {"limit": limit, "before": before}
+        response = await self._send(
+            lambda: self.http.build_request("GET", f"/sessions/{session_id}/history", params=params)
+        )
+        return response.json()
+
+    async def delete_session(self, session_id: str) -> Dict[str, Any]:
+        response = await self._send(lambda: self.http.build_request("DELETE", f"/sessions/{session_id}"))
+        return response.json()
+
+
+class ChatSession:
+    """绑定会话 id 的轻量句柄，共享所属客户端的连接池。"""
+
+    def __init__(self, client: AsyncChatClient, session_id: str):
+        self.client = client
+        self.session_id = session_id
+
+    async def chat(self, message: str, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self.client.chat(message, self.session_id, idempotency_key)
+
+    def stream(self, message: str, idempotency_key: Optional[str] = None, signed: bool = False) -> AsyncIterator[str]:
+        return self.client.stream(message, self.session_id, idempotency_key, signed)
+
+    async def history(self, before: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
+        return await self.client.history(self.session_id, before, limit)
+
+    async def clear(self) -> Dict[str, Any]:
+        return await self.client.delete_session(self.session_id)
 
 
 class ChatClient:
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    """同步外观：与原接口一致，失败时返回 `{"error": ...}`；参数透传给 `AsyncChatClient`。"""
+
+    def __init__(self, base_url: str = "http://localhost:8000", **kwargs: Any):
         self.base_url = base_url
         self.session_id = f"test_user_{int(time.time())}"
+        self._loop = asyncio.new_event_loop()
+        self.client = AsyncChatClient(base_url, **kwargs)
 
-    def send_message(self, message: str) -> dict:
-        url = f"{self.base_url}/chat"
-        payload = {"message": message, "session_id": self.session_id}
+    def __enter__(self) -> "ChatClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self.client.aclose())
+            self._loop.close()
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+    def _call(self, what: str, coro) -> dict:
         try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"发送消息失败: {e}")
+            return self._run(coro)
+        except ChatError as e:
+            print(f"{what}失败: {e}")
             return {"error": str(e)}
 
+    def send_message(self, message: str) -> dict:
+        return self._call("发送消息", self.client.chat(message, self.session_id))
+
+    def stream_message(self, message: str, signed: bool = False) -> Iterator[str]:
+        """流式发送，逐片段返回文本；失败时抛出 ChatError。"""
+        chunks = self.client.stream(message, self.session_id, signed=signed)
+        try:
+            while True:
+                try:
+                    yield self._run(chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(chunks.aclose())
+
     def get_history(self) -> dict:
         """获取历史记录"""
-        url = f"{self.base_url}/sessions/{self.session_id}/history"
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"获取历史记录失败: {e}")
-            return {"error": str(e)}
+        return self._call("获取历史记录", self.client.history(self.session_id))
 
     def clear_session(self) -> dict:
         """清空会话"""
-        url = f"{self.base_url}/sessions/{self.session_id}"
-        try:
-            response = requests.delete(url)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"清空会话失败: {e}")
-            return {"error": str(e)}
+        return self._call("清空会话", self.client.delete_session(self.session_id))
+
+
+async def run_sessions(client: AsyncChatClient, conversations: List[List[str]]) -> List[List[str]]:
+    """并发驱动多个会话（每个会话内按顺序流式发送），返回各会话的完整回复。"""
+
+    async def converse(messages: List[str]) -> List[str]:
+        session = client.session()
+        replies = []
+        for msg in messages:
+            replies.append("".join([chunk async for chunk in session.stream(msg)]))
+        return replies
+
+    return await asyncio.gather(*[converse(messages) for messages in conversations])
 
 
 def main():
@@ -72,6 +383,14 @@ def main():
         print("-" * 30)
         time.sleep(1)
 
+    print("\n 流式发送")
+    try:
+        for chunk in client.stream_message("用一句话总结我们的对话"):
+            print(chunk, end="", flush=True)
+        print()
+    except ChatError as e:
+        print(f"流式发送失败: {e}")
+
     print("\n 获取会话历史")
     history = client.get_history()
     if "error" not in history:
@@ -84,6 +403,7 @@ def main():
     result = client.clear_session()
     if "error" not in result:
         print(f"清楚会话 {result}")
+    client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""异步对话任务：提交后立即返回任务 id，由有界 worker 池执行，结果可稍后查询或订阅。
+
+- 同一会话的任务严格按提交顺序执行（会话级串行），不同会话并行，并发度为 worker 数。
+- 排队任务数有上限，超出时拒绝提交（`JobQueueFull`）。
+- 已完成任务的结果保留 `result_ttl_s` 秒；任务表总数有上限，超出时淘汰最早完成的任务。
+- 订阅：先回放已产出的片段，再等待新片段直至任务结束；任务执行不依赖订阅方连接。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger("app.jobs")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """可向调用方展示原因的失败（如配额不足）；其他异常只记录日志，对外显示通用错误。"""
+
+
+@dataclass
+class ChatJob:
+    id: str
+    session_id: str
+    message: str
+    usage_key: str
+    status: str = QUEUED
+    chunks: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    @property
+    def reply(self) -> str:
+        return "".join(self.chunks).strip()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "reply": self.reply,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# 执行函数：按任务产出回复片段；抛出异常视为失败
+JobRunner = Callable[[ChatJob], AsyncIterator[str]]
+
+
+class JobManager:
+    def __init__(
+        self,
+        runner: JobRunner,
+        workers: int = 4,
+        max_queued: int = 1000,
+        result_ttl_s: float = 3600,
+        max_jobs: int = 10_000,
+    ):
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl_s = result_ttl_s
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, ChatJob]" = OrderedDict()
+        self.finished: "OrderedDict[str, float]" = OrderedDict()  # 按完成顺序，用于过期与淘汰
+        self.pending: Dict[str, Deque[ChatJob]] = {}
+        self.scheduled: Set[str] = set()  # 已在就绪队列中或正在执行的会话
+        self.queued = 0
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---------- 生命周期 ----------
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._ready = asyncio.Queue()
+        # 事件循环更换（如测试）时，尚未执行的会话重新入队
+        self.pending = {sid: q for sid, q in self.pending.items() if q}
+        self.scheduled = set(self.pending)
+        for session_id in self.pending:
+            self._ready.put_nowait(session_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- 提交与查询 ----------
+    def submit(self, session_id: str, message: str, usage_key: str) -> ChatJob:
+        self.start()  # 首次提交时在当前事件循环中启动 worker
+        self._expire(time.time())
+        if self.queued >= self.max_queued:
+            raise JobQueueFull()
+        job = ChatJob(secrets.token_urlsafe(16), session_id, message, usage_key)
+        self.jobs[job.id] = job
+        self.pending.setdefault(session_id, deque()).append(job)
+        self.queued += 1
+        if session_id not in self.scheduled:
+            self.scheduled.add(session_id)
+            self._ready.put_nowait(session_id)
+        return job
+
+    def get(self, job_id: str) -> Optional[ChatJob]:
+        self._expire(time.time())
+        return self.jobs.get(job_id)
+
+    async def subscribe(self, job: ChatJob) -> AsyncIterator[str]:
+        """回放已产出的片段并跟随后续输出，直至任务结束。"""
+        sent = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: len(job.chunks) > sent or job.done)
+                fresh = job.chunks[sent:]
+                done = job.done
+            for text in fresh:
+                yield text
+            sent += len(fresh)
+            if done and sent >= len(job.chunks):
+                return
+
+    def stats(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"jobs": len(self.jobs), "queued": self.queued, "workers": len(self._tasks), "by_status": counts}
+
+    # ---------- 内部 ----------
+    def _expire(self, now: float) -> None:
+        finished = self.finished
+        while finished:
+            job_id, finished_at = next(iter(finished.items()))
+            if finished_at > now - self.result_ttl_s and len(self.jobs) <= self.max_jobs:
+                break
+            del finished[job_id]
+            self.jobs.pop(job_id, None)
+
+    async def _worker(self) -> None:
+        while True:
+            session_id = await self._ready.get()
+            job = self.pending[session_id].popleft()
+            self.queued -= 1
+            try:
+                await self._run(job)
+            finally:
+                # 同一会话的下一个任务在本任务结束后才重新入队，保证会话内顺序
+                if self.pending[session_id]:
+                    self._ready.put_nowait(session_id)
+                else:
+                    del self.pending[session_id]
+                    self.scheduled.discard(session_id)
+
+    async def _run(self, job: ChatJob) -> None:
+        job.status = RUNNING
+        status, error = FAILED, "interrupted"
+        try:
+            async for text in self.runner(job):
+                async with job.changed:
+                    job.chunks.append(text)
+                    job.changed.notify_all()
+            status, error = SUCCEEDED, None
+        except asyncio.CancelledError:
+            status, error = FAILED, "cancelled"
+            raise
+        except JobFailed as e:
+            status, error = FAILED, str(e)
+        except Exception as e:
+            logger.warning("chat job %s failed: %s", job.id, e)
+            status, error = FAILED, "服务器处理异常"
+        finally:
+            async with job.changed:
+                job.status, job.error = status, error
+                job.finished_at = time.time()
+                job.changed.notify_all()
+            self.finished[job.id] = job.finished_at
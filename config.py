@@ -1,4 +1,4 @@
-from typing import Optional, List, Literal, Dict
+from typing import Any, Optional, List, Literal, Dict
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -19,9 +19,19 @@ class Settings(BaseSettings):
     # LLM 设置
     model_name: str = Field(default="qwen-turbo")
     temperature: float = Field(default=0.7, ge=0.0, le=1.0)
+    startup_prewarm_upstream: bool = Field(default=True)  # 启动时预解析上游域名、启动线程池
 
     # 会话/历史
     history_limit: int = Field(default=10, ge=1)
+    prompt_history_turns: int = Field(default=10, ge=0)  # 每次调用带入提示词的最近轮数
+    # 会话分层存储：热（对象）-> 温（内存压缩）-> 冷（本地 SQLite），再次访问时提升回热层
+    session_hot_idle_s: int = Field(default=0, ge=0)  # 空闲超过该秒数下沉到温层，0 表示不分层
+    session_warm_idle_s: int = Field(default=3600, ge=0)  # 空闲超过该秒数下沉到冷层（需 session_cold_store_path）
+    session_cold_store_path: Optional[str] = None  # 如 data/sessions.db
+    session_compression: Literal["zlib", "zstd"] = Field(default="zlib")  # zstd 需 pip install zstandard
+    session_tier_sweep_interval_s: float = Field(default=30.0, gt=0)
+    session_tier_sweep_batch: int = Field(default=10_000, ge=0)  # 每次每层最多下沉的会话数，限制单次阻塞时长
+    history_cache_max_sessions: int = Field(default=10_000, ge=1)  # 历史接口已编码消息缓存的会话数上限
 
     # 模型key
     dashscope_api_key: str = Field(default="")
@@ -40,12 +50,29 @@ class Settings(BaseSettings):
     internal_api_key: Optional[str] = None  # 从环境变量 INTERNAL_API_KEY 读取（若启用鉴权）
     internal_api_keys: List[str] = Field(default_factory=list)  # 可选：多密钥支持（JSON 数组或逗号分隔需按 JSON）
     api_keys: Dict[str, str] = Field(default_factory=dict)  # KID->KEY（JSON 对象）
+    api_keys_file: Optional[str] = None  # 可选：密钥文件（JSON，KID->KEY 或 KID->{key, tenant}），变更后热加载
+    api_keys_reload_interval_s: float = Field(default=5.0, gt=0)  # 密钥文件变更检测间隔
 
-    # 速率限制（内存级，轻量）
+    # 速率限制（内存级，GCRA）
     rate_limit_enabled: bool = Field(default=False)
     rate_limit_requests: int = Field(default=60, ge=1)  # 窗口内允许的最大请求数
     rate_limit_window_s: int = Field(default=60, ge=1)  # 窗口大小（秒）
     rate_limit_by: Literal["ip", "api_key"] = Field(default="ip")
+    rate_limit_ip_requests: Optional[int] = Field(default=None, ge=1)  # 可选：额外的按 IP 限额
+    rate_limit_global_requests: Optional[int] = Field(default=None, ge=1)  # 可选：进程级全局限额
+    rate_limit_max_keys: int = Field(default=100_000, ge=1)  # 键表上限（LRU 淘汰，过期键随时回收）
+    rate_limit_mode: Literal["local", "cluster"] = Field(default="local")  # cluster：多副本共享计数
+    rate_limit_sync_interval_s: float = Field(default=1.0, gt=0)  # 集群模式批量同步周期
+    rate_limit_store_url: Optional[str] = None  # 集群模式共享存储，如 redis://redis:6379/0
+
+    # LLM token 配额与计费（按 API Key 的滑动窗口预算；用量统计始终开启）
+    token_quota_enabled: bool = Field(default=False)
+    token_quota_limit: int = Field(default=200_000, ge=1)  # 每个 Key 窗口内 token 预算
+    token_quota_window_s: int = Field(default=3600, ge=60)
+    token_quota_limits: Dict[str, int] = Field(default_factory=dict)  # 覆盖：用量键（如 kid:tenant-a）-> 预算
+    token_price_prompt_per_1k: float = Field(default=0.0, ge=0.0)  # 成本核算单价（每千 token）
+    token_price_completion_per_1k: float = Field(default=0.0, ge=0.0)
+    token_usage_max_sessions: int = Field(default=100_000, ge=1)  # 会话用量表上限（LRU）
 
     # 请求体大小限制（字节）
     request_max_body_bytes: int = Field(default=1_000_000, ge=1)  # 约 1MB
@@ -59,6 +86,96 @@ class Settings(BaseSettings):
     signed_url_ttl_s: int = Field(default=300, ge=30)
     signed_url_clock_skew_s: int = Field(default=30, ge=0)
 
+    # 签名 URL 防重放（nonce 在有效期内仅可使用一次）
+    replay_protection_enabled: bool = Field(default=True)
+    replay_cache_backend: Literal["sets", "bloom", "redis"] = Field(default="sets")
+    replay_cache_bucket_s: int = Field(default=30, ge=1)  # 时间桶宽度，整桶过期
+    replay_cache_max_entries: int = Field(default=1_000_000, ge=1)  # sets：总条目上限，超限拒绝
+    replay_cache_bloom_capacity: int = Field(default=1_000_000, ge=1)  # bloom：每个有效期窗口的预期签名 URL 数
+    replay_cache_bloom_fp_rate: float = Field(default=1e-6, gt=0, lt=1)  # bloom：误判率（新 nonce 被当作重放）
+    replay_cache_url: Optional[str] = None  # redis：所有副本共享，如 redis://redis:6379/0
+
+    # 异步对话任务（POST /chat/jobs）
+    chat_jobs_workers: int = Field(default=4, ge=1)  # 并发执行的任务数
+    chat_jobs_max_queued: int = Field(default=1000, ge=1)  # 排队任务上限，超出返回 503
+    chat_jobs_result_ttl_s: int = Field(default=3600, ge=1)  # 完成后结果保留时长
+    chat_jobs_max: int = Field(default=10_000, ge=1)  # 任务表上限，超出淘汰最早完成的任务
+
+    # 就绪探针与过载保护（GET /ready；超过阈值 load_shed_factor 倍时拒绝新对话，0 表示不限）
+    readiness_max_streams: int = Field(default=500, ge=0)  # 在途 SSE 流数
+    readiness_max_upstream: int = Field(default=100, ge=0)  # 在途生成数 + 排队的异步任务数
+    readiness_max_loop_lag_ms: float = Field(default=250, ge=0)  # 事件循环延迟
+    load_shed_factor: float = Field(default=1.5, ge=0)  # 0 表示只在排空时拒绝
+    loop_lag_interval_s: float = Field(default=0.5, gt=0)
+    drain_timeout_s: float = Field(default=25, ge=0)  # SIGTERM 后等待在途流结束的上限，应小于 Pod 的宽限期
+
+    # 幂等键（Idempotency-Key 头，/chat 与 /chat/stream）：重试附着到原请求或回放已存结果
+    idempotency_ttl_s: int = Field(default=3600, ge=1)  # 完成后结果保留时长
+    idempotency_max_entries: int = Field(default=10_000, ge=1)  # 条目上限，超出淘汰最早完成的
+    idempotency_key_max_length: int = Field(default=255, ge=1)
+
+    # 滚动摘要（长会话早期轮次在后台折叠为摘要，提示词带摘要 + 摘要之后的轮次）
+    summary_enabled: bool = Field(default=False)
+    summary_trigger_turns: int = Field(default=8, ge=2)  # 未摘要轮次达到该数时折叠，应小于 history_limit
+    summary_trigger_tokens: int = Field(default=0, ge=0)  # 未摘要轮次 token 估算达到该值也折叠，0 表示不启用
+    summary_keep_turns: int = Field(default=4, ge=0)  # 折叠时保留原文的最近轮次
+    summary_max_chars: int = Field(default=600, ge=50)  # 摘要字数上限（写入摘要提示词）
+
+    # 租户画像（按 api_keys 条目的 tenant 选择系统提示词与模型，链路预编译并缓存）
+    profiles: Dict[str, Dict[str, Any]] = Field(default_factory=dict)  # 租户->{system_prompt, model_name, temperature}（JSON 对象）
+    profiles_file: Optional[str] = None  # 可选：画像文件（同格式 JSON，覆盖同名租户），变更后热加载
+    profiles_reload_interval_s: float = Field(default=5.0, gt=0)  # 画像文件变更检测间隔
+
+    # 流式票据（POST /chat/stream/tickets 换取，GET /chat/stream?ticket= 使用，一次性）
+    stream_ticket_ttl_s: int = Field(default=60, ge=5)
+    stream_ticket_max: int = Field(default=100_000, ge=1)  # 进程内票据数上限，超出淘汰最早的
+    stream_ticket_store_url: Optional[str] = None  # 可选：redis://...，多副本共享票据
+
+    # 语义响应缓存（首轮/少历史的近似重复问题直接复用回复，不调用 LLM）
+    semantic_cache_enabled: bool = Field(default=False)
+    semantic_cache_threshold: float = Field(default=0.92, gt=0, le=1)  # 余弦相似度命中阈值
+    semantic_cache_max_entries: int = Field(default=10_000, ge=1)  # 槽位上限，满时淘汰最久未命中的
+    semantic_cache_dim: int = Field(default=512, ge=16)  # 哈希向量维度
+    semantic_cache_ttl_s: int = Field(default=86_400, ge=0)  # 条目有效期，0 表示不过期
+    semantic_cache_max_history: int = Field(default=0, ge=0)  # 仅当会话历史条数不超过该值时查/写缓存
+    semantic_cache_path: Optional[str] = None  # 可选：持久化路径前缀（<path>.f32 向量 + <path>.json 元数据）
+
+    # 会话长期记忆（早期轮次建向量索引，按相关度召回 top-k 带入提示词）
+    long_term_memory_enabled: bool = Field(default=False)
+    long_term_memory_top_k: int = Field(default=3, ge=1)
+    long_term_memory_min_score: float = Field(default=0.3, ge=-1, le=1)  # 余弦相似度下限，低于不召回
+    long_term_memory_max_turns: int = Field(default=5000, ge=1)  # 每会话索引轮次上限，超出覆盖最早的
+    long_term_memory_max_sessions: int = Field(default=10_000, ge=1)  # 会话数上限，超出淘汰最久未访问的
+    long_term_memory_dim: int = Field(default=512, ge=16)
+
+    # FAQ 知识库（高置信命中直接回复，中等置信作为检索上下文）
+    knowledge_base_enabled: bool = Field(default=False)
+    knowledge_base_path: Optional[str] = None  # JSON 数组或 JSONL：{"id","question","answer","aliases"}
+    knowledge_base_answer_threshold: float = Field(default=0.8, gt=0, le=1)  # 不低于该置信度直接回复
+    knowledge_base_context_threshold: float = Field(default=0.25, ge=0, le=1)  # 不低于该置信度作为上下文
+    knowledge_base_context_top_k: int = Field(default=3, ge=1)
+    knowledge_base_answer_template: str = Field(default="{answer}")  # 可用占位符：{question}、{answer}
+    knowledge_base_vector_enabled: bool = Field(default=False)  # 叠加哈希向量相似度
+    knowledge_base_vector_weight: float = Field(default=0.5, ge=0, le=1)
+    knowledge_base_vector_dim: int = Field(default=512, ge=16)
+    knowledge_base_reload_interval_s: float = Field(default=30.0, gt=0)  # 文件变化检测间隔，变化时增量重载
+
+    # 链路追踪（请求级 Span + 链路阶段子 Span）
+    tracing_enabled: bool = Field(default=False)
+    tracing_sample_ratio: float = Field(default=1.0, ge=0.0, le=1.0)  # 无上游 traceparent 时的采样率
+    tracing_exporter: Literal["file", "memory"] = Field(default="file")
+    tracing_file_path: str = Field(default="traces/spans.jsonl")  # JSONL，每行一个 Span
+    tracing_batch_size: int = Field(default=256, ge=1)
+    tracing_flush_interval_s: float = Field(default=5.0, gt=0)
+    tracing_max_queue: int = Field(default=10000, ge=1)  # 待导出队列上限，超出丢弃
+
+    # 按需剖析（管理员）：未启用时不注册中间件
+    profiling_enabled: bool = Field(default=False)
+    admin_api_key: Optional[str] = None  # 请求头 X-Admin-Key，从环境变量 ADMIN_API_KEY 读取
+    profiling_output_dir: str = Field(default="profiles")
+    profiling_max_duration_s: int = Field(default=60, ge=1)  # 栈采样最长时长
+    profiling_sample_interval_ms: int = Field(default=10, ge=1)  # 栈采样默认间隔
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,148 @@
+"""本地离线文本向量：字符 n-gram 哈希嵌入（无需模型与网络）。
+
+- `normalize_text`：NFKC 归一、转小写、去标点与空白，并做少量中文同义/语气词归一
+  （如“可以/能够”→“能”，去掉句末的“吗/呢/呀”；“吧/嘛”常作词尾（酒吧、干嘛），不去除），让“你能做什么”与“你可以做什么？”落到同一串。
+- `HashingEmbedder`：字符 1..3-gram 经 CRC32 哈希到固定维度（带符号，减少碰撞偏差），
+  L2 归一化后点积即余弦相似度。哈希与进程无关，向量可持久化复用。
+- `VectorIndex`：连续数组存储的向量索引，供长期记忆等按需增长的场景使用。
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_PUNCT_PAT = re.compile(r"[\s\W_]+", re.UNICODE)
+_PARTICLE_PAT = re.compile(r"[吗呢呀啊哦]+$")  # 只去句末语气词（标点已先去掉）
+_SYNONYMS: Tuple[Tuple[str, str], ...] = (
+    ("可不可以", "能"),
+    ("能够", "能"),
+    ("可以", "能"),
+    ("怎么样", "如何"),
+    ("怎样", "如何"),
+    ("怎么", "如何"),
+    ("啥", "什么"),
+    ("您", "你"),
+)
+
+
+def normalize_text(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text or "").lower()
+    t = _PUNCT_PAT.sub("", t)
+    for src, dst in _SYNONYMS:
+        t = t.replace(src, dst)
+    return _PARTICLE_PAT.sub("", t)
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = (1, 3)) -> List[str]:
+    lo, hi = ngram_range
+    out: List[str] = []
+    n_chars = len(text)
+    for n in range(lo, hi + 1):
+        out.extend(text[i : i + n] for i in range(n_chars - n + 1))
+    return out
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _indices(self, normalized: str) -> Tuple[np.ndarray, np.ndarray]:
+        grams = char_ngrams(normalized, self.ngram_range)
+        hashes = np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams)
+        )
+        idx = (hashes % self.dim).astype(np.intp)
+        # 取哈希最高位作为符号
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        return idx, signs
+
+    def embed_normalized(self, normalized: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        if normalized:
+            idx, signs = self._indices(normalized)
+            np.add.at(vec, idx, signs)
+            norm = float(np.linalg.norm(vec))
+            if norm > 0:
+                vec /= norm
+        return vec
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_normalized(normalize_text(text))
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i] = self.embed(t)
+        return out
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回得分最高的 k 个下标（按得分降序），使用 argpartition 避免全量排序。"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+    k = min(k, scores.size)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+
+class VectorIndex:
+    """紧凑的数组向量索引：单块 float32 矩阵按需倍增，达到上限后环形覆盖最早写入的条目。
+
+    每个槽位附带单调递增的序号 `seqs` 与任意载荷 `payloads`，检索为一次矩阵-向量乘。
+    """
+
+    def __init__(self, dim: int, capacity: int = 64, max_items: int = 0):
+        self.dim = dim
+        self.max_items = max_items  # 0 表示不限
+        capacity = max(1, min(capacity, max_items) if max_items else capacity)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.seqs = np.zeros(capacity, dtype=np.int64)
+        self.payloads: List[object] = [None] * capacity
+        self.size = 0
+        self._head = 0  # 环形覆盖时的下一个写入位置
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self) -> bool:
+        cap = self.vectors.shape[0]
+        new_cap = cap * 2 if not self.max_items else min(cap * 2, self.max_items)
+        if new_cap <= cap:
+            return False
+        vectors = np.zeros((new_cap, self.dim), dtype=np.float32)
+        vectors[:cap] = self.vectors
+        seqs = np.zeros(new_cap, dtype=np.int64)
+        seqs[:cap] = self.seqs
+        self.vectors, self.seqs = vectors, seqs
+        self.payloads.extend([None] * (new_cap - cap))
+        return True
+
+    def add(self, vec: np.ndarray, seq: int, payload: object = None) -> int:
+        if self.size < self.vectors.shape[0] or self._grow():
+            slot = self.size
+            self.size += 1
+        else:
+            slot = self._head
+            self._head = (slot + 1) % self.size
+        self.vectors[slot] = vec
+        self.seqs[slot] = seq
+        self.payloads[slot] = payload
+        return slot
+
+    def search(
+        self, q: np.ndarray, k: int, min_score: float = -1.0, max_seq: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """返回 `(slot, score)`，按得分降序；`max_seq` 限定只检索序号小于它的条目。"""
+        if self.size == 0 or k <= 0:
+            return []
+        scores = self.vectors[: self.size] @ q
+        if max_seq is not None:
+            scores[self.seqs[: self.size] >= max_seq] = -np.inf
+        return [(int(i), float(scores[i])) for i in top_k(scores, k) if scores[i] >= min_score]
@@ -0,0 +1,107 @@
+"""会话历史接口的编码缓存：每条消息只序列化一次，响应体按页拼接字节。
+
+- 消息记录追加后不再修改，按会话缓存每条消息的 JSON 字节；新消息追加时只编码新增部分，
+  历史被截断时丢弃头部。
+- 分页游标为消息序号 `seq`（会话内连续递增）：`before` 之前的最近 `limit` 条，按时间先后返回。
+- ETag 由页的首尾序号与末条消息时间戳构成，计算无需序列化；命中 `If-None-Match` 时直接 304。
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def _encode(message: Dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _seq(messages: List[Dict], i: int) -> int:
+    return messages[i].get("seq", i)
+
+
+class _EncodedHistory:
+    __slots__ = ("first_seq", "items", "stamps")
+
+    def __init__(self, first_seq: int):
+        self.first_seq = first_seq
+        self.items: List[bytes] = []
+        self.stamps: List[float] = []  # 各消息的 unix_timestamp，用于识别会话被清空后重建
+
+
+class HistoryPage:
+    __slots__ = ("start", "end", "etag")
+
+    def __init__(self, start: int, end: int, etag: str):
+        self.start = start  # 页在消息列表中的下标区间 [start, end)
+        self.end = end
+        self.etag = etag
+
+
+class EncodedHistoryCache:
+    def __init__(self, max_sessions: int = 10_000):
+        self.max_sessions = max_sessions
+        self.entries: "OrderedDict[str, _EncodedHistory]" = OrderedDict()
+        self.encoded = 0  # 累计编码的消息条数
+        self._lock = threading.Lock()
+
+    def page(self, messages: List[Dict], before: Optional[int], limit: int) -> HistoryPage:
+        """定位分页区间并计算 ETag（不做序列化）。"""
+        if not messages:
+            return HistoryPage(0, 0, '"empty"')
+        first = _seq(messages, 0)
+        end = len(messages) if before is None else max(0, min(len(messages), before - first))
+        start = max(0, end - limit)
+        if start == end:
+            return HistoryPage(start, end, f'"{first}-{before}-none"')
+        stamp = messages[end - 1].get("unix_timestamp", 0)
+        etag = f'"{_seq(messages, start)}-{_seq(messages, end - 1)}-{int(stamp * 1e6)}-{int(start > 0)}"'
+        return HistoryPage(start, end, etag)
+
+    def _sync(self, session_id: str, messages: List[Dict]) -> _EncodedHistory:
+        first = _seq(messages, 0)
+        enc = self.entries.get(session_id)
+        if enc is not None:
+            offset = first - enc.first_seq
+            if offset < 0 or (offset < len(enc.stamps) and enc.stamps[offset] != messages[0].get("unix_timestamp")):
+                enc = None  # 会话被清空后重建，缓存失效
+            elif offset:
+                del enc.items[:offset]
+                del enc.stamps[:offset]
+                enc.first_seq = first
+        if enc is None:
+            enc = self.entries[session_id] = _EncodedHistory(first)
+        self.entries.move_to_end(session_id)
+        for m in messages[len(enc.items):]:
+            enc.items.append(_encode(m))
+            enc.stamps.append(m.get("unix_timestamp"))
+            self.encoded += 1
+        while len(self.entries) > self.max_sessions:
+            self.entries.popitem(last=False)
+        return enc
+
+    def render(self, session_id: str, messages: List[Dict], page: HistoryPage) -> bytes:
+        """拼接响应体：`{"session_id", "history", "next_before"}`。"""
+        items: Tuple[bytes, ...] = ()
+        if page.end > page.start:
+            with self._lock:
+                enc = self._sync(session_id, messages)
+                items = tuple(enc.items[page.start : page.end])
+        next_before = _seq(messages, page.start) if page.start > 0 else None
+        return b"".join(
+            (
+                b'{"session_id":',
+                _encode(session_id),
+                b',"history":[',
+                b",".join(items),
+                b'],"next_before":',
+                b"null" if next_before is None else str(next_before).encode(),
+                b"}",
+            )
+        )
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self.entries.pop(session_id, None)
@@ -0,0 +1,142 @@
+"""幂等键（`Idempotency-Key`）：客户端重试不重复调用 LLM、不重复写入会话历史。
+
+- 首个请求登记条目并在后台任务中执行生成，片段逐个记录到条目；生成与客户端连接解耦，
+  网关超时断开后结果仍会完成。
+- 执行中的重试附着到同一条目（先回放已产出片段，再跟随实时输出）；已完成的重试直接回放结果。
+- 同一幂等键携带不同请求内容时拒绝（`IdempotencyConflict`）。
+- 可重试的失败（非 `keep_errors` 指定的异常）会移除条目，后续重试重新执行；
+  已完成条目保留 `ttl_s` 秒，总数超过 `max_entries` 时淘汰最早完成的条目（执行中的条目不淘汰）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type
+
+logger = logging.getLogger("app.idempotency")
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def request_fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class IdempotencyEntry:
+    __slots__ = ("key", "fingerprint", "chunks", "done", "error", "finished_at", "changed", "task")
+
+    def __init__(self, key: str, fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def reply(self) -> str:
+        return "".join(self.chunks).strip()
+
+    async def wait(self) -> None:
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.done)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """回放已产出的片段并跟随后续输出，直至完成。"""
+        sent = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.chunks) > sent or self.done)
+                fresh = self.chunks[sent:]
+                done = self.done
+            for text in fresh:
+                yield text
+            sent += len(fresh)
+            if done and sent >= len(self.chunks):
+                return
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_s: float = 3600, max_entries: int = 10_000):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+        self.finished: "OrderedDict[str, float]" = OrderedDict()  # 按完成顺序，用于过期与淘汰
+        self.replays = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self.entries), "finished": len(self.finished), "replays": self.replays}
+
+    def _expire(self, now: float) -> None:
+        finished = self.finished
+        while finished:
+            key, finished_at = next(iter(finished.items()))
+            if finished_at > now - self.ttl_s and len(self.entries) < self.max_entries:
+                break
+            del finished[key]
+            self.entries.pop(key, None)
+
+    def begin(self, key: str, fingerprint: str, now: Optional[float] = None) -> Tuple[IdempotencyEntry, bool]:
+        """返回 (条目, 是否新建)；新建方负责调用 `run` 或 `discard`。"""
+        self._expire(time.time() if now is None else now)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise IdempotencyConflict()
+            self.replays += 1
+            return entry, False
+        entry = self.entries[key] = IdempotencyEntry(key, fingerprint)
+        return entry, True
+
+    def discard(self, entry: IdempotencyEntry, error: Optional[BaseException] = None) -> None:
+        """执行前失败（如配额不足）时放弃条目，后续重试重新执行。"""
+        if self.entries.get(entry.key) is entry:
+            del self.entries[entry.key]
+        entry.error = error
+        entry.done = True
+        entry.finished_at = time.time()
+
+    def run(
+        self,
+        entry: IdempotencyEntry,
+        producer: AsyncIterator[str],
+        keep_errors: Tuple[Type[BaseException], ...] = (),
+    ) -> None:
+        """在后台任务中执行生成，片段写入条目。"""
+        entry.task = asyncio.create_task(self._drive(entry, producer, keep_errors))
+
+    async def _drive(self, entry: IdempotencyEntry, producer: AsyncIterator[str], keep_errors) -> None:
+        error: Optional[BaseException] = None
+        try:
+            async for text in producer:
+                async with entry.changed:
+                    entry.chunks.append(text)
+                    entry.changed.notify_all()
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            if error is not None and not isinstance(error, keep_errors):
+                logger.info("idempotent request %s failed, entry dropped: %r", entry.key, error)
+                if self.entries.get(entry.key) is entry:
+                    del self.entries[entry.key]
+            else:
+                self.finished[entry.key] = time.time()
+            async with entry.changed:
+                entry.error = error
+                entry.done = True
+                entry.finished_at = time.time()
+                entry.changed.notify_all()
@@ -0,0 +1,306 @@
+"""按整数槽位索引的会话管理（`api_with_session.py` 使用），列式存储。
+
+- 会话占用整数槽位，删除或清理后槽位进入空闲表，新会话优先复用；会话 id -> 槽位的字典用于按 id 查找。
+- 创建时间、最近活跃时间、有效标记为连续 numpy 数组：列举活跃会话、清理非活跃会话都是一次向量化扫描，
+  只有被清理的槽位需要逐个释放消息列表。
+- 每个槽位的消息以 `(role, content, timestamp)` 元组列表保存（按 `max_history_length` 截断），
+  读取接口返回 `{"role": "user"|"ai", "content", "timestamp"}` 字典。
+- 批量导出/导入为列式结构：`session_ids`、`created_at`、`last_activity`、`messages` 等长列表，
+  `messages` 的每项为 `[role, content, timestamp]` 三元组列表。
+"""
+
+from __future__ import annotations
+
+import secrets
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_ROLES = ("user", "ai")
+
+Message = Tuple[str, str, float]
+
+
+def _as_dict(m: Message) -> Dict:
+    return {"role": m[0], "content": m[1], "timestamp": m[2]}
+
+
+def _as_message(item: Any, now: float) -> Optional[Message]:
+    """校验并转换导入的消息（字典或三元组），无效时返回 None。"""
+    if isinstance(item, dict):
+        role, content, ts = item.get("role"), item.get("content"), item.get("timestamp", now)
+    elif isinstance(item, (list, tuple)) and len(item) == 3:
+        role, content, ts = item
+    else:
+        return None
+    if role not in _ROLES or not isinstance(content, str) or not isinstance(ts, (int, float)):
+        return None
+    return (role, content, float(ts))
+
+
+class IndexedSessionManager:
+    def __init__(self, max_history_length: int = 100, session_timeout_minutes: float = 30, capacity: int = 1024):
+        self.max_history_length = max_history_length
+        self.session_timeout_s = session_timeout_minutes * 60
+        self.sessions: List[Optional[List[Message]]] = []  # 槽位 -> 消息列表（空闲槽为 None），长度即已用槽位数
+        self.session_ids: List[Optional[str]] = []
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.last_activity = np.zeros(capacity, dtype=np.float64)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.free: List[int] = []
+        self.slot_of: Dict[str, int] = {}
+        self.total_messages = 0
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    @property
+    def capacity(self) -> int:
+        return self.valid.shape[0]
+
+    # ---------- 槽位分配 ----------
+    def _grow(self, need: int) -> None:
+        cap = max(self.capacity * 2, need)
+        size = len(self.sessions)
+        for name in ("created_at", "last_activity", "valid"):
+            old = getattr(self, name)
+            new = np.zeros(cap, dtype=old.dtype)
+            new[:size] = old[:size]
+            setattr(self, name, new)
+
+    def _alloc(self, count: int) -> List[int]:
+        """分配 `count` 个槽位：先取空闲表，不足时在末尾追加。"""
+        reuse = min(count, len(self.free))
+        slots = [self.free.pop() for _ in range(reuse)]
+        extra = count - reuse
+        if extra:
+            start = len(self.sessions)
+            if start + extra > self.capacity:
+                self._grow(start + extra)
+            self.sessions.extend([None] * extra)
+            self.session_ids.extend([None] * extra)
+            slots.extend(range(start, start + extra))
+        return slots
+
+    def _live(self, idx: int) -> bool:
+        return 0 <= idx < len(self.sessions) and bool(self.valid[idx])
+
+    def _release(self, slots: np.ndarray) -> None:
+        self.valid[slots] = False
+        self.created_at[slots] = 0
+        self.last_activity[slots] = 0
+        for i in slots.tolist():
+            self.slot_of.pop(self.session_ids[i], None)
+            self.total_messages -= len(self.sessions[i])
+            self.sessions[i] = None
+            self.session_ids[i] = None
+        self.free.extend(slots.tolist())
+
+    # ---------- 会话 ----------
+    def create_session(self, session_id: Optional[str] = None) -> int:
+        """创建会话并返回槽位；`session_id` 已存在时返回其槽位。"""
+        if session_id is not None and session_id in self.slot_of:
+            return self.slot_of[session_id]
+        session_id = session_id or secrets.token_hex(16)
+        slot = self.free.pop() if self.free else self._alloc(1)[0]
+        now = time.time()
+        self.sessions[slot] = []
+        self.session_ids[slot] = session_id
+        self.slot_of[session_id] = slot
+        self.created_at[slot] = now
+        self.last_activity[slot] = now
+        self.valid[slot] = True
+        return slot
+
+    def get_slot(self, session_id: str) -> Optional[int]:
+        return self.slot_of.get(session_id)
+
+    def _add(self, idx: int, role: str, content: str) -> bool:
+        if not self._live(idx):
+            return False
+        now = time.time()
+        messages = self.sessions[idx]
+        messages.append((role, content, now))
+        self.total_messages += 1
+        if len(messages) > self.max_history_length:
+            overflow = len(messages) - self.max_history_length
+            del messages[:overflow]
+            self.total_messages -= overflow
+        self.last_activity[idx] = now
+        return True
+
+    def add_user_message(self, idx: int, content: str) -> bool:
+        return self._add(idx, "user", content)
+
+    def add_ai_message(self, idx: int, content: str) -> bool:
+        return self._add(idx, "ai", content)
+
+    def get_session_history(self, idx: int) -> List[Dict]:
+        return [_as_dict(m) for m in self.sessions[idx]] if self._live(idx) else []
+
+    def get_langchain_messages(self, idx: int) -> List[Any]:
+        """转换为 LangChain 消息（按需导入 LangChain）。"""
+        if not self._live(idx):
+            return []
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        return [HumanMessage(content=c) if r == "user" else AIMessage(content=c) for r, c, _ in self.sessions[idx]]
+
+    def update_session_activity(self, idx: int) -> bool:
+        if not self._live(idx):
+            return False
+        self.last_activity[idx] = time.time()
+        return True
+
+    def clear_session(self, idx: int) -> bool:
+        """清空消息，保留会话与槽位。"""
+        if not self._live(idx):
+            return False
+        self.total_messages -= len(self.sessions[idx])
+        self.sessions[idx].clear()
+        self.last_activity[idx] = time.time()
+        return True
+
+    def delete_session(self, idx: int) -> bool:
+        if not self._live(idx):
+            return False
+        self._release(np.asarray([idx], dtype=np.intp))
+        return True
+
+    # ---------- 向量化扫描 ----------
+    def _active_mask(self, now: Optional[float]) -> np.ndarray:
+        n = len(self.sessions)
+        cutoff = (time.time() if now is None else now) - self.session_timeout_s
+        return self.valid[:n] & (self.last_activity[:n] >= cutoff)
+
+    def list_all_sessions(self) -> List[int]:
+        return np.flatnonzero(self.valid[: len(self.sessions)]).tolist()
+
+    def list_active_sessions(self, now: Optional[float] = None) -> List[int]:
+        return np.flatnonzero(self._active_mask(now)).tolist()
+
+    def cleanup_inactive_sessions(self, now: Optional[float] = None) -> int:
+        """释放超过 `session_timeout_minutes` 未活跃的会话，返回数量。"""
+        n = len(self.sessions)
+        idle = np.flatnonzero(self.valid[:n] & ~self._active_mask(now))
+        if idle.size:
+            self._release(idle)
+        return int(idle.size)
+
+    # ---------- 统计 ----------
+    def get_session_stats(self, idx: int, now: Optional[float] = None) -> Optional[Dict]:
+        if not self._live(idx):
+            return None
+        messages = self.sessions[idx]
+        user = sum(1 for m in messages if m[0] == "user")
+        now = time.time() if now is None else now
+        return {
+            "session_index": idx,
+            "session_id": self.session_ids[idx],
+            "total_messages": len(messages),
+            "user_messages": user,
+            "ai_messages": len(messages) - user,
+            "created_at": datetime.fromtimestamp(self.created_at[idx]).isoformat(),
+            "last_activity": datetime.fromtimestamp(self.last_activity[idx]).isoformat(),
+            "is_active": bool(self.last_activity[idx] >= now - self.session_timeout_s),
+        }
+
+    def get_all_sessions_stats(self, now: Optional[float] = None) -> Dict:
+        return {
+            "total_sessions": len(self),
+            "active_sessions": int(np.count_nonzero(self._active_mask(now))),
+            "total_messages": self.total_messages,
+            "slots": len(self.sessions),
+            "free_slots": len(self.free),
+        }
+
+    def get_sessions_array(self) -> List[Optional[List[Message]]]:
+        """按槽位排列的消息三元组列表（空闲槽为 None）。"""
+        return self.sessions
+
+    def get_last_activity_array(self) -> List[float]:
+        """按槽位排列的最近活跃时间（unix 秒，空闲槽为 0）。"""
+        return self.last_activity[: len(self.sessions)].tolist()
+
+    # ---------- 导出 / 导入 ----------
+    def export_session_data(self, idx: int) -> Optional[Dict]:
+        if not self._live(idx):
+            return None
+        return {
+            "session_index": idx,
+            "session_id": self.session_ids[idx],
+            "created_at": float(self.created_at[idx]),
+            "last_activity": float(self.last_activity[idx]),
+            "messages": self.get_session_history(idx),
+        }
+
+    def import_session_data(self, data: Dict[str, Any]) -> Optional[int]:
+        """导入单个会话（`export_session_data` 的格式）；数据无效时返回 None。"""
+        slots = self.import_sessions(
+            {
+                "session_ids": [data.get("session_id")],
+                "created_at": [data.get("created_at")],
+                "last_activity": [data.get("last_activity")],
+                "messages": [data.get("messages")],
+            }
+        )
+        return slots[0] if slots else None
+
+    def export_sessions(self, indices: Optional[Sequence[int]] = None) -> Dict[str, List]:
+        """批量导出为列式结构；默认导出全部有效会话。"""
+        if indices is None:
+            slots = np.flatnonzero(self.valid[: len(self.sessions)])
+        else:
+            slots = np.asarray([i for i in indices if self._live(i)], dtype=np.intp)
+        order = slots.tolist()
+        return {
+            "session_ids": [self.session_ids[i] for i in order],
+            "created_at": self.created_at[slots].tolist(),
+            "last_activity": self.last_activity[slots].tolist(),
+            "messages": [list(self.sessions[i]) for i in order],
+        }
+
+    def import_sessions(self, data: Dict[str, List]) -> List[int]:
+        """批量导入列式数据，返回各会话的槽位；已存在的会话 id 原位覆盖。
+
+        任一条无效时整体不导入，返回空列表。
+        """
+        now = time.time()
+        try:
+            ids, raw = list(data["session_ids"]), list(data["messages"])
+            count = len(ids)
+            columns = [data.get(name) or [None] * count for name in ("created_at", "last_activity")]
+            created, activity = (np.asarray([now if t is None else t for t in col], dtype=np.float64) for col in columns)
+        except (KeyError, TypeError, ValueError):
+            return []
+        if not (len(raw) == created.size == activity.size == count):
+            return []
+        ids = [sid if sid is not None else secrets.token_hex(16) for sid in ids]
+        if not all(isinstance(sid, str) for sid in ids) or len(set(ids)) != count:
+            return []
+        limit = self.max_history_length
+        sessions = []
+        for items in raw:
+            if not isinstance(items, list):
+                return []
+            messages = [_as_message(m, now) for m in items[-limit:]]
+            if None in messages:
+                return []
+            sessions.append(messages)
+
+        existing = [self.slot_of.get(sid) for sid in ids]
+        fresh = iter(self._alloc(existing.count(None)))
+        slots = [s if s is not None else next(fresh) for s in existing]
+        for slot, sid, messages in zip(slots, ids, sessions):
+            old = self.sessions[slot]
+            self.total_messages += len(messages) - (len(old) if old else 0)
+            self.sessions[slot] = messages
+            self.session_ids[slot] = sid
+            self.slot_of[sid] = slot
+        index = np.asarray(slots, dtype=np.intp)
+        self.created_at[index] = created
+        self.last_activity[index] = activity
+        self.valid[index] = True
+        return slots
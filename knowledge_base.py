@@ -0,0 +1,343 @@
+"""FAQ 知识库：高置信命中直接按模板回复（不调用 LLM），中等置信命中作为检索上下文。
+
+- `BM25Index`：字符 n-gram（中文无需分词）倒排索引，按槽位增删文档，支持增量更新；
+  查询时按词项 postings 向量化累加 BM25 得分。
+- 置信度：取两项的较小值。一是 BM25 得分除以“查询自身作为文档时的得分”（查询中索引未出现的
+  词项会拉低置信度）；二是条目问法的覆盖度，即条目各问法（标准问法与相似问法）中最佳一条的词项
+  被查询覆盖的 idf 加权比例，避免“如何”“密码”这类短查询因是问法的子串而得到接近 1 的置信度。
+  覆盖度只对按前者排序的候选计算。启用向量索引时，结果再与哈希向量余弦相似度按权重融合。
+- `FaqKnowledgeBase`：从 JSON / JSONL 文件加载 FAQ（`{"id", "question", "answer", "aliases"}`），
+  按条目内容摘要做增量重载，文件 mtime 变化时按 `check_interval_s` 节流检测。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from embeddings import HashingEmbedder, char_ngrams, normalize_text, top_k
+
+logger = logging.getLogger("app.knowledge")
+
+
+@dataclass(frozen=True)
+class FaqEntry:
+    id: str
+    question: str
+    answer: str
+    aliases: Tuple[str, ...] = field(default_factory=tuple)
+
+    @property
+    def text(self) -> str:
+        """参与检索的文本：标准问法 + 相似问法。"""
+        return " ".join((self.question,) + self.aliases)
+
+    @property
+    def digest(self) -> str:
+        raw = json.dumps([self.question, self.answer, list(self.aliases)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75, ngram_range: Tuple[int, int] = (1, 2), capacity: int = 64):
+        self.k1 = k1
+        self.b = b
+        self.ngram_range = ngram_range
+        self.postings: Dict[str, Dict[int, int]] = {}  # 词项 -> {槽位: 词频}
+        self.doc_terms: List[Optional[Counter]] = [None] * capacity
+        self.doc_len = np.zeros(capacity, dtype=np.float32)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.free: List[int] = []
+        self.size = 0  # 已使用的槽位数（含空闲槽）
+        self.n_docs = 0
+        self.total_len = 0
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # 词项 postings 的数组形式（惰性构建）
+        self._norm: Optional[np.ndarray] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.doc_len.shape[0]
+
+    def terms(self, text: str) -> Counter:
+        return Counter(char_ngrams(normalize_text(text), self.ngram_range))
+
+    def _grow(self) -> None:
+        cap = self.capacity * 2
+        doc_len = np.zeros(cap, dtype=np.float32)
+        doc_len[: self.size] = self.doc_len[: self.size]
+        valid = np.zeros(cap, dtype=bool)
+        valid[: self.size] = self.valid[: self.size]
+        self.doc_len, self.valid = doc_len, valid
+        self.doc_terms.extend([None] * (cap - len(self.doc_terms)))
+
+    def add(self, text: str) -> int:
+        terms = self.terms(text)
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            slot = self.size
+            self.size += 1
+        for t, tf in terms.items():
+            self.postings.setdefault(t, {})[slot] = tf
+            self._arrays.pop(t, None)
+        length = sum(terms.values())
+        self.doc_terms[slot] = terms
+        self.doc_len[slot] = length
+        self.valid[slot] = True
+        self.n_docs += 1
+        self.total_len += length
+        self._norm = None
+        return slot
+
+    def remove(self, slot: int) -> None:
+        terms = self.doc_terms[slot]
+        if terms is None:
+            return
+        for t in terms:
+            docs = self.postings.get(t)
+            if docs is not None:
+                docs.pop(slot, None)
+                if not docs:
+                    del self.postings[t]
+            self._arrays.pop(t, None)
+        self.n_docs -= 1
+        self.total_len -= int(self.doc_len[slot])
+        self.doc_terms[slot] = None
+        self.doc_len[slot] = 0
+        self.valid[slot] = False
+        self.free.append(slot)
+        self._norm = None
+
+    def _postings_array(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arr = self._arrays.get(term)
+        if arr is None:
+            docs = self.postings[term]
+            arr = (
+                np.fromiter(docs.keys(), dtype=np.intp, count=len(docs)),
+                np.fromiter(docs.values(), dtype=np.float32, count=len(docs)),
+            )
+            self._arrays[term] = arr
+        return arr
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> Tuple[np.ndarray, float]:
+        """返回 (各槽位 BM25 得分, 查询自身得分)；后者用于归一化置信度。"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        terms = self.terms(query)
+        if not terms or self.n_docs == 0:
+            return scores, 0.0
+        avgdl = self.total_len / self.n_docs
+        if self._norm is None:
+            self._norm = self.k1 * (1 - self.b + self.b * self.doc_len[: self.size] / avgdl)
+        norm = self._norm
+        k1, b = self.k1, self.b
+        qlen = sum(terms.values())
+        self_score = 0.0
+        for t, qtf in terms.items():
+            docs = self.postings.get(t)
+            idf = self._idf(len(docs) if docs else 0)
+            self_score += idf * qtf * qtf * (k1 + 1) / (qtf + k1 * (1 - b + b * qlen / avgdl))
+            if not docs:
+                continue
+            slots, tfs = self._postings_array(t)
+            scores[slots] += idf * qtf * tfs * (k1 + 1) / (tfs + norm[slots])
+        return scores, self_score
+
+
+class FaqKnowledgeBase:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        embedder: Optional[HashingEmbedder] = None,
+        vector_weight: float = 0.5,
+        check_interval_s: float = 30.0,
+    ):
+        self.path = path
+        self.index = BM25Index()
+        self.embedder = embedder  # 为 None 时不建向量索引
+        self.vector_weight = vector_weight if embedder is not None else 0.0
+        self.vectors = np.zeros((self.index.capacity, embedder.dim if embedder else 0), dtype=np.float32)
+        self.entries: List[Optional[FaqEntry]] = []
+        self.phrasings: List[Optional[List[Set[str]]]] = []  # 槽位 -> 各问法的词项集合（算覆盖度）
+        self.slot_of: Dict[str, int] = {}
+        self.digests: Dict[str, str] = {}
+        self.check_interval_s = check_interval_s
+        self._mtime: Optional[int] = None
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+        self.reloads = 0
+        if path:
+            self.reload()
+
+    def __len__(self) -> int:
+        return self.index.n_docs
+
+    # ---------- 增量更新 ----------
+    def _add(self, entry: FaqEntry) -> None:
+        slot = self.index.add(entry.text)
+        if slot >= len(self.entries):
+            self.entries.extend([None] * (slot + 1 - len(self.entries)))
+            self.phrasings.extend([None] * (slot + 1 - len(self.phrasings)))
+        self.entries[slot] = entry
+        self.phrasings[slot] = [set(self.index.terms(p)) for p in (entry.question,) + entry.aliases]
+        self.slot_of[entry.id] = slot
+        self.digests[entry.id] = entry.digest
+        if self.embedder is not None:
+            if self.vectors.shape[0] < self.index.capacity:
+                vectors = np.zeros((self.index.capacity, self.embedder.dim), dtype=np.float32)
+                vectors[: self.vectors.shape[0]] = self.vectors
+                self.vectors = vectors
+            self.vectors[slot] = self.embedder.embed(entry.text)
+
+    def _remove(self, entry_id: str) -> None:
+        slot = self.slot_of.pop(entry_id)
+        self.digests.pop(entry_id, None)
+        self.index.remove(slot)
+        self.entries[slot] = None
+        self.phrasings[slot] = None
+
+    def sync(self, entries: List[FaqEntry]) -> Dict[str, int]:
+        """与给定条目集合对齐：仅增删内容有变化的条目，返回变更计数。"""
+        new = {e.id: e for e in entries}
+        added = updated = removed = 0
+        with self._lock:
+            for entry_id in [i for i in self.slot_of if i not in new]:
+                self._remove(entry_id)
+                removed += 1
+            for entry_id, entry in new.items():
+                old = self.digests.get(entry_id)
+                if old == entry.digest:
+                    continue
+                if old is not None:
+                    self._remove(entry_id)
+                    updated += 1
+                else:
+                    added += 1
+                self._add(entry)
+        return {"added": added, "updated": updated, "removed": removed}
+
+    # ---------- 文件加载 ----------
+    @staticmethod
+    def parse(raw: str) -> List[FaqEntry]:
+        """解析 JSON 数组 / `{"faqs": [...]}` / JSONL。"""
+        raw = raw.strip()
+        if not raw:
+            return []
+        if raw[0] in "[{":
+            try:
+                data = json.loads(raw)
+                items = data.get("faqs", []) if isinstance(data, dict) else data
+            except ValueError:
+                items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+        else:
+            items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+        entries: List[FaqEntry] = []
+        for item in items:
+            question, answer = item.get("question"), item.get("answer")
+            if not question or not answer:
+                continue
+            entries.append(
+                FaqEntry(
+                    id=str(item.get("id") or question),
+                    question=question,
+                    answer=answer,
+                    aliases=tuple(item.get("aliases") or ()),
+                )
+            )
+        return entries
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def reload(self) -> Dict[str, int]:
+        mtime = self._file_mtime()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = self.parse(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning("load knowledge base failed: %s", e)
+            return {"added": 0, "updated": 0, "removed": 0}
+        changes = self.sync(entries)
+        self._mtime = mtime
+        self.reloads += 1
+        logger.info("knowledge base reloaded: %s", changes)
+        return changes
+
+    def maybe_reload(self) -> None:
+        """文件 mtime 变化时增量重载；检测按 `check_interval_s` 节流。"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval_s
+        if self._file_mtime() != self._mtime:
+            self.reload()
+
+    # ---------- 检索 ----------
+    def _coverage(self, slot: int, query_terms: Set[str]) -> float:
+        """条目最佳问法的词项被查询覆盖的 idf 加权比例（0..1）。"""
+        postings, idf = self.index.postings, self.index._idf
+        best = 0.0
+        for terms in self.phrasings[slot] or ():
+            weights = {t: idf(len(postings.get(t, ()))) for t in terms}
+            total = sum(weights.values())
+            if total > 0:
+                best = max(best, sum(w for t, w in weights.items() if t in query_terms) / total)
+        return best
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[FaqEntry, float]]:
+        """返回 `(条目, 置信度)`，按置信度降序。"""
+        with self._lock:
+            scores, self_score = self.index.score(query)
+            if self_score <= 0:
+                return []
+            conf = np.minimum(scores / self_score, 1.0)
+            valid = self.index.valid[: self.index.size]
+            conf[~valid] = -np.inf
+            # 覆盖度只会降低置信度：对按查询归一化得分排序的候选逐条计算
+            query_terms = set(self.index.terms(query))
+            candidates = [i for i in top_k(conf, max(4 * k, 10)) if np.isfinite(conf[i])]
+            lexical = {i: min(float(conf[i]), self._coverage(i, query_terms)) for i in candidates}
+            if self.vector_weight > 0 and candidates:
+                cos = self.vectors[candidates] @ self.embedder.embed(query)
+                w = self.vector_weight
+                lexical = {i: (1 - w) * c + w * max(float(cos[n]), 0.0) for n, (i, c) in enumerate(lexical.items())}
+            ranked = sorted(lexical.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self.entries[i], c) for i, c in ranked]
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self),
+            "terms": len(self.index.postings),
+            "vector": self.embedder is not None,
+            "reloads": self.reloads,
+        }
+
+
+def build_knowledge_base(s) -> Optional[FaqKnowledgeBase]:
+    if not s.knowledge_base_enabled or not s.knowledge_base_path:
+        return None
+    return FaqKnowledgeBase(
+        s.knowledge_base_path,
+        embedder=HashingEmbedder(dim=s.knowledge_base_vector_dim) if s.knowledge_base_vector_enabled else None,
+        vector_weight=s.knowledge_base_vector_weight,
+        check_interval_s=s.knowledge_base_reload_interval_s,
+    )
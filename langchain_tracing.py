@@ -0,0 +1,51 @@
+"""LangChain 回调：将链路各阶段转换为当前请求 Span 下的子 Span。
+
+与 `tracing` 分开，使未调用链路的进程（测试、假链路、管理脚本）无需导入 LangChain。
+"""
+
+from __future__ import annotations
+
+from typing import Dict
+
+from langchain_core.tracers.base import BaseTracer
+
+from tracing import Span, _new_span_id
+
+
+class LangChainSpanHandler(BaseTracer):
+    """把 LangChain Run 树映射为当前请求 Span 下的子 Span。
+
+    Run 的起止时间由 LangChain 记录，这里只在 Run 结束时生成 Span，
+    顶层 Run 挂在请求 Span 下，其余按 `parent_run_id` 串联。
+    """
+
+    run_inline = True
+
+    def __init__(self, parent: Span):
+        super().__init__()
+        self.parent = parent
+        self._span_ids: Dict[str, str] = {}
+
+    def _persist_run(self, run) -> None:
+        return None
+
+    def _on_run_create(self, run) -> None:
+        self._span_ids[str(run.id)] = _new_span_id()
+
+    def _on_run_update(self, run) -> None:
+        span_id = self._span_ids.pop(str(run.id), None) or _new_span_id()
+        parent_id = self.parent.span_id
+        if run.parent_run_id is not None:
+            parent_id = self._span_ids.get(str(run.parent_run_id), parent_id)
+        span = Span(
+            self.parent.tracer,
+            f"{run.run_type}.{run.name}",
+            self.parent.trace_id,
+            parent_id=parent_id,
+            start_ns=int(run.start_time.timestamp() * 1e9),
+        )
+        span.span_id = span_id
+        if run.error:
+            span.status = "error"
+        end_ns = int(run.end_time.timestamp() * 1e9) if run.end_time else None
+        span.end(end_ns)
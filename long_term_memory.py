@@ -0,0 +1,94 @@
+"""会话长期记忆：每轮对话写入本地向量索引，提问时只把相关的早期轮次带入提示词。
+
+`SessionManager` 只保留最近 `history_limit` 条，提示词只带最近 `prompt_history_turns` 轮；
+更早的轮次在这里按会话建立 `VectorIndex`（哈希 n-gram 向量），每次请求检索最近窗口
+之外的 top-k 相关轮次，提示词大小不随会话长度增长。
+
+- 每个会话的轮次数上限 `max_turns`，超出后环形覆盖最早的轮次。
+- 会话数上限 `max_sessions`，超出后淘汰最久未访问的会话。
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from embeddings import HashingEmbedder, VectorIndex, normalize_text
+
+
+class _SessionMemory:
+    __slots__ = ("index", "turns")
+
+    def __init__(self, dim: int, max_turns: int):
+        self.index = VectorIndex(dim, capacity=16, max_items=max_turns)
+        self.turns = 0  # 已写入的轮次总数，同时作为下一轮的序号
+
+
+class LongTermMemory:
+    def __init__(
+        self,
+        embedder: Optional[HashingEmbedder] = None,
+        top_k: int = 3,
+        min_score: float = 0.3,
+        max_turns: int = 5000,
+        max_sessions: int = 10_000,
+    ):
+        self.embedder = embedder or HashingEmbedder()
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, _SessionMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_turn(self, session_id: str, user_message: str, bot_message: str) -> None:
+        # 以问答拼接后的文本建索引，问题或答案中的关键词都能召回
+        vec = self.embedder.embed_normalized(normalize_text(f"{user_message} {bot_message}"))
+        with self._lock:
+            mem = self.sessions.get(session_id)
+            if mem is None:
+                mem = self.sessions[session_id] = _SessionMemory(self.embedder.dim, self.max_turns)
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(session_id)
+            mem.index.add(vec, mem.turns, {"user_message": user_message, "bot_message": bot_message})
+            mem.turns += 1
+
+    def recall(self, session_id: str, query: str, recent_turns: int, k: Optional[int] = None) -> List[Dict]:
+        """检索最近 `recent_turns` 轮之外的相关轮次，按时间先后返回。"""
+        mem = self.sessions.get(session_id)
+        if mem is None:
+            return []
+        cutoff = mem.turns - recent_turns
+        if cutoff <= 0:
+            return []
+        q = self.embedder.embed(query)
+        with self._lock:
+            self.sessions.move_to_end(session_id)
+            hits = mem.index.search(q, self.top_k if k is None else k, self.min_score, max_seq=cutoff)
+            ordered = sorted(hits, key=lambda h: mem.index.seqs[h[0]])
+            return [mem.index.payloads[slot] for slot, _ in ordered]
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self.sessions),
+            "indexed_turns": sum(len(m.index) for m in self.sessions.values()),
+        }
+
+
+def build_long_term_memory(s) -> Optional[LongTermMemory]:
+    if not s.long_term_memory_enabled:
+        return None
+    return LongTermMemory(
+        HashingEmbedder(dim=s.long_term_memory_dim),
+        top_k=s.long_term_memory_top_k,
+        min_score=s.long_term_memory_min_score,
+        max_turns=s.long_term_memory_max_turns,
+        max_sessions=s.long_term_memory_max_sessions,
+    )
@@ -1,33 +1,108 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from contextlib import asynccontextmanager
 from session_manager import SessionManager
-from chat_chain import ChatChain
-import uvicorn
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from config import settings
 from fastapi.middleware.cors import CORSMiddleware
+from tracing import build_tracer, span
+from profiling import RequestProfilerMiddleware, StackSampler, is_valid_admin_key
+from rate_limit import build_rate_limiter
+from token_quota import build_token_quota, count_tokens, estimate_prompt_tokens
+from api_keys import ApiKeyRegistry
+from replay_cache import build_nonce_cache
+from stream_tickets import build_ticket_store
+from history_cache import EncodedHistoryCache
+from chat_jobs import JobFailed, JobManager, JobQueueFull
+from readiness import build_load_monitor
+from idempotency import IdempotencyConflict, IdempotencyStore, request_fingerprint
+from rolling_summary import build_rolling_summarizer, summary_tokens, turns_after
+from profiles import Profile, build_profile_registry
 import time
+import asyncio
+import importlib
 import logging
 import re
 import hmac
 import hashlib
 
+def _build_optional(enabled: bool, module: str, builder: str):
+    """按需导入可选组件：未启用时不加载其依赖（如 numpy）。"""
+    if not enabled:
+        return None
+    return getattr(importlib.import_module(module), builder)(settings)
+
+
 # 全局对象
 chat_chain = None
-session_manager = SessionManager(max_history_length=settings.history_limit)
+session_manager = SessionManager(
+    max_history_length=settings.history_limit,
+    hot_idle_s=settings.session_hot_idle_s,
+    warm_idle_s=settings.session_warm_idle_s,
+    cold_store_path=settings.session_cold_store_path,
+    compression=settings.session_compression,
+)
+tracer = build_tracer(settings)
+stack_sampler = StackSampler(settings.profiling_output_dir)
+token_quota = build_token_quota(settings)
+api_key_registry = ApiKeyRegistry(settings, check_interval_s=settings.api_keys_reload_interval_s)
+profile_registry = build_profile_registry(settings)
+nonce_cache = build_nonce_cache(settings)
+ticket_store = build_ticket_store(settings)
+semantic_cache = _build_optional(settings.semantic_cache_enabled, "semantic_cache", "build_semantic_cache")
+long_term_memory = _build_optional(settings.long_term_memory_enabled, "long_term_memory", "build_long_term_memory")
+knowledge_base = _build_optional(settings.knowledge_base_enabled, "knowledge_base", "build_knowledge_base")
+history_cache = EncodedHistoryCache(max_sessions=settings.history_cache_max_sessions)
+# 上游深度含排队的异步任务（job_manager 在下文定义，调用时解析）
+load_monitor = build_load_monitor(settings, upstream_queued=lambda: job_manager.queued)
+idempotency_store = IdempotencyStore(ttl_s=settings.idempotency_ttl_s, max_entries=settings.idempotency_max_entries)
+
+
+async def _summarize(summary, turns, max_chars):
+    return await chat_chain.summarize(summary, turns, max_chars)
+
+
+# 滚动摘要（chat_chain 在 lifespan 中创建，调用时解析）
+rolling_summarizer = build_rolling_summarizer(settings, _summarize)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     global chat_chain
-    # 启动时初始化
+    # 启动时初始化；LangChain/dashscope 较重，延迟到此处导入，测试与假链路无需加载
+    from chat_chain import ChatChain
+
     chat_chain = ChatChain()
     await chat_chain.initialize()
+    # 预编译租户画像链路；此后画像重载时先编译再替换索引
+    chat_chain.compile_profiles(profile_registry.current())
+    profile_registry.on_reload = chat_chain.compile_profiles
+    if settings.startup_prewarm_upstream:
+        await chat_chain.prewarm_upstream()
+    if settings.tracing_enabled:
+        import langchain_tracing  # noqa: F401  提前导入，避免首个采样请求承担导入开销
+    sync_task = asyncio.create_task(_rate_limit_sync_loop()) if rate_limiter.distributed else None
+    tier_task = asyncio.create_task(_session_tier_loop()) if session_manager.tiered else None
+    job_manager.start()
+    lag_task = asyncio.create_task(load_monitor.monitor_loop_lag())
+    # SIGTERM 时先排空在途流再交给 uvicorn 退出
+    load_monitor.install_drain_handler()
+    load_monitor.started = True
     yield
-    # 关闭时清理（如果需要）
+    # 关闭时清理：停止后台任务、落盘剩余 Span 与语义缓存
+    load_monitor.started = False
+    for task in (sync_task, tier_task, lag_task):
+        if task is not None:
+            task.cancel()
+    profile_registry.on_reload = None
+    await job_manager.stop()
+    if rolling_summarizer is not None:
+        await rolling_summarizer.stop()
+    tracer.shutdown()
+    if semantic_cache is not None:
+        semantic_cache.close()
 
 
 app = FastAPI(
@@ -48,6 +123,14 @@ if settings.allowed_origins:
         max_age=600,
     )
 
+# 条件性启用单请求剖析（X-Profile + X-Admin-Key 触发）
+if settings.profiling_enabled:
+    app.add_middleware(
+        RequestProfilerMiddleware,
+        admin_api_key=settings.admin_api_key,
+        output_dir=settings.profiling_output_dir,
+    )
+
 
 class ChatRequest(BaseModel):
     message: str
@@ -59,40 +142,12 @@ class ChatResponse(BaseModel):
     session_id: str
 
 
-def _all_api_keys() -> list[str]:
-    keys: list[str] = []
-    if settings.internal_api_key:
-        keys.append(settings.internal_api_key)
-    if settings.internal_api_keys:
-        keys.extend([k for k in settings.internal_api_keys if k])
-    if settings.api_keys:
-        keys.extend([v for v in settings.api_keys.values() if v])
-    # 去重保持顺序
-    out, seen = [], set()
-    for k in keys:
-        if k not in seen:
-            out.append(k)
-            seen.add(k)
-    return out
-
-
 def _is_valid_api_key(candidate: str | None) -> bool:
-    if not candidate:
-        return False
-    return candidate in _all_api_keys()
-
-
-def _get_key_for_kid(kid: str | None) -> str | None:
-    if kid:
-        return settings.api_keys.get(kid)
-    # 未提供 kid，仅当唯一密钥时可使用
-    keys = _all_api_keys()
-    if len(keys) == 1:
-        return keys[0]
-    return None
+    return api_key_registry.current().lookup(candidate) is not None
 
 
 def _verify_signed_url(request: Request) -> bool:
+    """校验签名 URL；通过时把验签所用的密钥条目记在 `request.state.signed_key`，供用量归属使用。"""
     if not settings.signed_url_enabled:
         return False
     q = request.query_params
@@ -111,9 +166,11 @@ def _verify_signed_url(request: Request) -> bool:
     now = int(time.time())
     if not (now - settings.signed_url_clock_skew_s <= exp_i <= now + settings.signed_url_ttl_s + settings.signed_url_clock_skew_s):
         return False
-    secret = _get_key_for_kid(kid)
-    if not secret:
+    # 未提供 kid，仅当唯一密钥时可使用
+    entry = api_key_registry.current().for_kid(kid)
+    if entry is None:
         return False
+    secret = entry.secret
     to_sign = "\n".join([
         request.method,
         request.url.path,
@@ -125,9 +182,18 @@ def _verify_signed_url(request: Request) -> bool:
     digest = hmac.new(secret.encode("utf-8"), to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
     # 时间常量比较
     try:
-        return hmac.compare_digest(digest, sig)
+        if not hmac.compare_digest(digest, sig):
+            return False
     except Exception:
         return False
+    # 防重放：签名有效的 nonce 在有效期内只能使用一次。kid 不在签名串内，按验签所用密钥（摘要）去重，
+    # 追加或改写 kid 参数不会得到新的 nonce 空间
+    if settings.replay_protection_enabled and not nonce_cache.check_and_add(
+        f"{entry.digest.hex()[:16]}:{nonce}", exp_i + settings.signed_url_clock_skew_s
+    ):
+        return False
+    request.state.signed_key = entry
+    return True
 
 
 # 依赖：API 鉴权（支持 Header 与 GET 签名 URL）
@@ -136,50 +202,99 @@ def require_api_key(request: Request, x_api_key: str | None = Header(default=Non
         return
     if _is_valid_api_key(x_api_key):
         return
-    # GET 请求允许使用签名 URL（EventSource 无法携带自定义头）
-    if request.method == "GET" and _verify_signed_url(request):
+    # GET /chat/stream 允许使用流式票据或签名 URL（EventSource 无法携带自定义头）；
+    # 票据只在拉流路由上有效，不能当作其他 GET 接口的凭据
+    if request.method == "GET" and (
+        (request.url.path == "/chat/stream" and ticket_store.peek(request.query_params.get("ticket")))
+        or _verify_signed_url(request)
+    ):
         return
     raise HTTPException(status_code=401, detail="unauthorized")
 
 
-# 轻量内存速率限制（滑动窗口）
-class RateLimiter:
-    def __init__(self, max_requests: int, window_s: int):
-        self.max_requests = max_requests
-        self.window_s = window_s
-        self.buckets: dict[str, list[float]] = {}
-
-    def allow(self, key: str) -> bool:
-        now = time.time()
-        window_start = now - self.window_s
-        q = self.buckets.setdefault(key, [])
-        # 丢弃窗口外
-        i = 0
-        for ts in q:
-            if ts >= window_start:
-                break
-            i += 1
-        if i:
-            del q[:i]
-        if len(q) >= self.max_requests:
-            return False
-        q.append(now)
-        return True
+# 依赖：管理员鉴权（运维接口；未配置管理员密钥时表现为不存在）
+def require_admin_key(x_admin_key: str | None = Header(default=None)):
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=404, detail="not found")
+    if not is_valid_admin_key(settings.admin_api_key, x_admin_key):
+        raise HTTPException(status_code=401, detail="unauthorized")
+
 
+def require_profiling():
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="not found")
 
-rate_limiter = RateLimiter(settings.rate_limit_requests, settings.rate_limit_window_s)
+
+def _usage_key_for(entry) -> str:
+    return f"kid:{entry.kid}" if entry.kid else "ak:" + entry.digest.hex()[:16]
+
+
+# 依赖：用量归属（按 kid / API Key 摘要 / 客户端 IP）
+def resolve_usage_key(request: Request, x_api_key: str | None = Header(default=None)) -> str:
+    """只按实际通过校验的凭据归属：有效的 X-API-Key、已验签的签名 URL（由 `require_api_key` 记录）；
+    其余一律按客户端 IP，未知的 Key 或 kid 参数不会得到新的配额桶。流式票据在兑换时使用签发时的用量键。"""
+    entry = api_key_registry.current().lookup(x_api_key)
+    if entry is None:
+        entry = getattr(request.state, "signed_key", None)
+    if entry is not None:
+        return _usage_key_for(entry)
+    client_ip = request.client.host if request.client else "0.0.0.0"
+    return f"ip:{client_ip}"
+
+
+# 轻量内存速率限制（GCRA，O(1) 状态 + LRU 有界键表，可叠加按 IP/全局维度）
+rate_limiter = build_rate_limiter(settings)
 
 
 def require_rate_limit(request: Request, x_api_key: str | None = Header(default=None)):
     if not settings.rate_limit_enabled:
         return
+    client_ip = request.client.host if request.client else "0.0.0.0"
     if settings.rate_limit_by == "api_key" and x_api_key:
         key = f"ak:{x_api_key}"
     else:
-        client_ip = request.client.host if request.client else "0.0.0.0"
         key = f"ip:{client_ip}"
-    if not rate_limiter.allow(key):
-        raise HTTPException(status_code=429, detail="too many requests")
+    decision = rate_limiter.allow({"primary": key, "ip": f"ip:{client_ip}", "global": "global"})
+    if not decision.allowed:
+        raise HTTPException(status_code=429, detail="too many requests", headers=decision.headers())
+    # 由中间件写入 X-RateLimit-* 响应头
+    request.state.rate_limit = decision
+
+
+# 依赖：过载削峰与排空（拒绝新的对话轮次，提示客户端/网关改投其他副本）
+def require_capacity():
+    reason = load_monitor.shed_reason()
+    if reason is not None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"service unavailable: {reason}",
+            headers={"Retry-After": "1", "Connection": "close"},
+        )
+
+
+async def _rate_limit_sync_loop():
+    """集群限流：周期性把本地计数批量同步到共享存储（在线程中执行，避免阻塞事件循环）。"""
+    while True:
+        await asyncio.sleep(settings.rate_limit_sync_interval_s)
+        try:
+            await asyncio.to_thread(rate_limiter.sync)
+        except Exception as e:
+            logger.warning("rate limit sync failed: %s", e)
+
+
+async def _session_tier_loop():
+    """会话分层：周期性把空闲会话下沉到温/冷层。
+
+    在事件循环线程内执行，与请求处理串行，避免会话在层间搬移时被并发读写。
+    """
+    while True:
+        await asyncio.sleep(settings.session_tier_sweep_interval_s)
+        try:
+            moved = session_manager.demote_idle(limit=settings.session_tier_sweep_batch)
+            if moved["warm"] or moved["cold"]:
+                logger.info("session tiers demoted: %s", moved)
+        except Exception as e:
+            logger.warning("session tier sweep failed: %s", e)
 
 
 # ---------- 日志与脱敏 ----------
@@ -199,7 +314,7 @@ def sanitize_text(text: str) -> str:
         return "<unloggable>"
 
 
-SENSITIVE_HEADERS = {"authorization", "x-api-key"}
+SENSITIVE_HEADERS = {"authorization", "x-api-key", "x-admin-key"}
 
 
 def sanitize_headers(headers: Dict[str, str]) -> Dict[str, str]:
@@ -239,6 +354,9 @@ async def body_limit_and_logging(request: Request, call_next):
     )
 
     response = await call_next(request)
+    decision = getattr(request.state, "rate_limit", None)
+    if decision is not None:
+        response.headers.update(decision.headers())
     logger.info("res %s %s status=%s", request.method, request.url.path, response.status_code)
     return response
 
@@ -248,107 +366,654 @@ async def async_iter(chunks):
         yield c
 
 
-@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(require_api_key), Depends(require_rate_limit)])
-async def chat(request: ChatRequest):
-    """聊天接口"""
+# ---------- 中间件：请求级链路追踪 ----------
+@app.middleware("http")
+async def request_tracing(request: Request, call_next):
+    if not tracer.enabled:
+        return await call_next(request)
+    root = tracer.start_request_span(
+        f"{request.method} {request.url.path}", request.headers.get("traceparent")
+    )
+    root.set_attribute("http.method", request.method)
+    root.set_attribute("http.path", request.url.path)
+    with tracer.activate(root):
+        try:
+            response = await call_next(request)
+        except Exception as e:
+            root.record_error(e)
+            root.end()
+            raise
+    root.set_attribute("http.status_code", response.status_code)
+    response.headers["traceparent"] = root.traceparent
+    # 流式响应在 body 发送完毕后才结束根 Span
+    response.body_iterator = _end_span_after(response.body_iterator, root)
+    return response
+
+
+async def _end_span_after(body_iterator, root):
     try:
-        # 获取会话历史
-        history = session_manager.get_history(request.session_id)
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        root.end()
 
-        # 调用会话链
-        reply = await chat_chain.process_message(
-            message=request.message, history=history
-        )
 
-        # 更新会话历史
+def _check_token_quota(
+    usage_key: str,
+    message: str,
+    history: list,
+    recalled: Optional[list] = None,
+    knowledge: Optional[list] = None,
+    summary: Optional[dict] = None,
+) -> int:
+    """调用前估算提示词 token 并校验配额，返回估算值。"""
+    recent = turns_after(history, summary)
+    prompt_tokens = estimate_prompt_tokens(message, recent, settings.prompt_history_turns, recalled)
+    if summary is not None:
+        # 带摘要时只发送摘要之后的轮次，记录相对完整历史窗口节省的 token
+        prompt_tokens += summary_tokens(summary)
+        full_tokens = estimate_prompt_tokens(message, history, settings.prompt_history_turns, recalled)
+        rolling_summarizer.record_prompt(full_tokens, prompt_tokens)
+    for k in knowledge or []:
+        prompt_tokens += count_tokens(k["question"]) + count_tokens(k["answer"])
+    if settings.token_quota_enabled and not token_quota.check(usage_key, prompt_tokens):
+        raise HTTPException(status_code=429, detail="token quota exceeded")
+    return prompt_tokens
+
+
+def _recall(session_id: str, message: str) -> Optional[list]:
+    """从长期记忆召回最近窗口之外的相关早期轮次。"""
+    if long_term_memory is None:
+        return None
+    with span("memory.recall") as sp:
+        recalled = long_term_memory.recall(session_id, message, settings.prompt_history_turns)
+        if sp is not None:
+            sp.set_attribute("memory.recalled", len(recalled))
+    return recalled
+
+
+def _append_turn(session_id: str, user_message: str, bot_message: str) -> None:
+    """写入会话历史，并同步写入长期记忆索引。"""
+    with span("session.add_message"):
         session_manager.add_message(
-            session_id=request.session_id,
-            user_message=request.message,
-            bot_message=reply,
+            session_id=session_id,
+            user_message=user_message,
+            bot_message=bot_message,
+        )
+    if long_term_memory is not None:
+        long_term_memory.add_turn(session_id, user_message, bot_message)
+    if rolling_summarizer is not None:
+        # 超过阈值时在后台折叠早期轮次，本轮不等待
+        rolling_summarizer.maybe_compact(session_manager, session_id)
+
+
+def _semantic_cacheable(history: list, profile: Optional[Profile] = None) -> bool:
+    # 语义缓存不区分租户，使用画像的请求不查也不写，避免回复跨租户复用
+    return semantic_cache is not None and profile is None and len(history) <= settings.semantic_cache_max_history
+
+
+def _semantic_lookup(message: str, history: list, profile: Optional[Profile] = None) -> Optional[str]:
+    """首轮/少历史消息查语义缓存，命中返回缓存回复。"""
+    if not _semantic_cacheable(history, profile):
+        return None
+    with span("semantic_cache.lookup") as sp:
+        reply = semantic_cache.lookup(message)
+        if sp is not None:
+            sp.set_attribute("cache.hit", reply is not None)
+    return reply
+
+
+def _semantic_store(message: str, history: list, reply: str, chain_kwargs: Optional[dict] = None) -> None:
+    if _semantic_cacheable(history, (chain_kwargs or {}).get("profile")):
+        semantic_cache.store(message, reply)
+
+
+def _search_knowledge(message: str) -> tuple[Optional[str], Optional[list]]:
+    """知识库检索：返回 (高置信模板回复, 中等置信的参考问答)。"""
+    if knowledge_base is None:
+        return None, None
+    knowledge_base.maybe_reload()
+    with span("knowledge.search") as sp:
+        hits = knowledge_base.search(message, settings.knowledge_base_context_top_k)
+        if sp is not None:
+            sp.set_attribute("knowledge.top_score", hits[0][1] if hits else 0.0)
+    if hits and hits[0][1] >= settings.knowledge_base_answer_threshold:
+        entry = hits[0][0]
+        return settings.knowledge_base_answer_template.format(question=entry.question, answer=entry.answer), None
+    context = [
+        {"question": e.question, "answer": e.answer}
+        for e, score in hits
+        if score >= settings.knowledge_base_context_threshold
+    ]
+    return None, context or None
+
+
+def _profile_for(usage_key: str) -> Optional[Profile]:
+    """按用量键选择租户画像：kid -> 密钥条目的租户 -> 画像，均为字典查找；无 kid 的调用方使用 default 画像。"""
+    profiles = profile_registry.current()
+    if not profiles:
+        return None
+    tenant = None
+    if usage_key.startswith("kid:"):
+        entry = api_key_registry.current().by_kid.get(usage_key[4:])
+        if entry is not None:
+            tenant = entry.tenant
+    return profiles.get(tenant)
+
+
+def _plan_reply(session_id: str, message: str, history: list, usage_key: str) -> tuple[Optional[str], dict, int]:
+    """决定回复来源，返回 (预置回复, 会话链附加参数, 提示词 token 估算)。
+
+    依次尝试知识库高置信命中、语义缓存；二者命中时返回预置回复，不调用 LLM、不计 token。
+    否则召回长期记忆与知识库参考资料（及会话的滚动摘要），校验 token 配额后交给会话链（按租户画像选择链路）。
+    """
+    answer, knowledge = _search_knowledge(message)
+    if answer is not None:
+        return answer, {}, 0
+    profile = _profile_for(usage_key)
+    cached = _semantic_lookup(message, history, profile)
+    if cached is not None:
+        return cached, {}, 0
+    recalled = _recall(session_id, message)
+    summary = session_manager.get_summary(session_id) if rolling_summarizer is not None else None
+    prompt_tokens = _check_token_quota(usage_key, message, history, recalled, knowledge, summary)
+    chain_kwargs = {"recalled": recalled, "knowledge": knowledge}
+    if summary is not None:
+        chain_kwargs["summary"] = summary
+    if profile is not None:
+        chain_kwargs["profile"] = profile
+    return None, chain_kwargs, prompt_tokens
+
+
+def _begin_idempotent(idempotency_key: str | None, usage_key: str, *request_parts: str):
+    """登记幂等键，返回 (条目, 是否新建)；未携带幂等键时返回 (None, True)。
+
+    幂等键按用量键隔离；同一幂等键携带不同请求内容时返回 422。
+    """
+    if idempotency_key is None:
+        return None, True
+    if not idempotency_key or len(idempotency_key) > settings.idempotency_key_max_length:
+        raise HTTPException(status_code=400, detail="invalid Idempotency-Key")
+    try:
+        return idempotency_store.begin(
+            request_fingerprint(usage_key, idempotency_key), request_fingerprint(*request_parts)
         )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
 
-        return ChatResponse(reply=reply, session_id=request.session_id)
+
+_REPLAYED_HEADERS = {"Idempotent-Replayed": "true"}
+
+
+async def _complete_reply(
+    message: str,
+    session_id: str,
+    history: list,
+    usage_key: str,
+    prompt_tokens: int,
+    cached: Optional[str] = None,
+    chain_kwargs: Optional[dict] = None,
+) -> str:
+    """生成完整回复（预置回复直接使用），计费并写入会话历史。"""
+    with load_monitor.turn():
+        if cached is not None:
+            # 知识库/语义缓存命中：不调用 LLM，不消耗 token 预算
+            token_quota.charge(usage_key, session_id, request=True)
+            reply = cached
+        else:
+            # 调用会话链
+            reply = await chat_chain.process_message(message=message, history=history, **(chain_kwargs or {}))
+            token_quota.charge(
+                usage_key,
+                session_id,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=count_tokens(reply),
+                request=True,
+            )
+            _semantic_store(message, history, reply, chain_kwargs)
+
+        # 更新会话历史
+        _append_turn(session_id, message, reply)
+        return reply
+
+
+async def _single_chunk(coro):
+    yield await coro
+
+
+@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(require_api_key), Depends(require_capacity), Depends(require_rate_limit)])
+async def chat(
+    request: ChatRequest,
+    response: Response,
+    usage_key: str = Depends(resolve_usage_key),
+    idempotency_key: str | None = Header(default=None),
+):
+    """聊天接口；携带 `Idempotency-Key` 时重试附着到原请求或返回已存结果，不重复调用 LLM"""
+    entry, created = _begin_idempotent(idempotency_key, usage_key, "chat", request.session_id, request.message)
+    try:
+        if created:
+            # 获取会话历史
+            with span("session.get_history"):
+                history = session_manager.get_history(request.session_id)
+            try:
+                cached, chain_kwargs, prompt_tokens = _plan_reply(
+                    request.session_id, request.message, history, usage_key
+                )
+            except Exception:
+                if entry is not None:
+                    idempotency_store.discard(entry)
+                raise
+            reply = _complete_reply(
+                request.message, request.session_id, history, usage_key, prompt_tokens, cached, chain_kwargs
+            )
+            if entry is None:
+                return ChatResponse(reply=await reply, session_id=request.session_id)
+            # 生成在后台任务中执行，与本连接解耦：客户端超时断开后重试仍可取到结果
+            idempotency_store.run(entry, _single_chunk(reply))
+        else:
+            response.headers.update(_REPLAYED_HEADERS)
+        await entry.wait()
+        if isinstance(entry.error, Exception):
+            raise entry.error
+        if entry.error is not None:
+            raise HTTPException(status_code=500, detail="处理失败: cancelled")
+        return ChatResponse(reply="".join(entry.chunks), session_id=request.session_id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 
-@app.post("/chat/stream", dependencies=[Depends(require_api_key), Depends(require_rate_limit)])
-async def chat_stream(request: ChatRequest):
-    """流式聊天接口（SSE）。"""
+class _QuotaExhausted(Exception):
+    """生成过程中 token 预算用尽（已输出部分已写入历史）。"""
+
+
+async def _reply_chunks(
+    message: str,
+    session_id: str,
+    history: list,
+    usage_key: str,
+    prompt_tokens: int,
+    cached: Optional[str] = None,
+    chain_kwargs: Optional[dict] = None,
+):
+    """逐片产出回复文本，结束后写入会话历史；超出 token 预算时提前终止并抛出 `_QuotaExhausted`。
 
-    async def event_generator():
-        history = session_manager.get_history(request.session_id)
+    `cached` 为知识库或语义缓存的预置回复，此时整段作为单个片段产出，不调用 LLM、不计 token。
+    """
+    with load_monitor.turn():
         collected: list[str] = []
+        remaining = token_quota.charge(usage_key, session_id, prompt_tokens=prompt_tokens, request=True)
+        if cached is not None:
+            stream = async_iter([cached])
+        else:
+            stream = chat_chain.stream_message(message=message, history=history, **(chain_kwargs or {}))
+        exhausted = False
         try:
-            async for chunk in chat_chain.stream_message(
-                message=request.message, history=history
-            ):
+            async for chunk in stream:
+                # 预算恰好被上一片段用完且回复已结束时不算超额；仍有后续片段时才终止
+                if cached is None and settings.token_quota_enabled and remaining <= 0:
+                    exhausted = True
+                    break
                 text = str(chunk)
                 collected.append(text)
-                yield f"data: {text}\n\n"
-            # 结束事件
+                yield text
+                if cached is not None:
+                    continue
+                remaining = token_quota.charge(usage_key, session_id, completion_tokens=count_tokens(text))
+            # 超出预算时保留已输出部分
             full_reply = "".join(collected).strip()
-            session_manager.add_message(
-                session_id=request.session_id,
-                user_message=request.message,
-                bot_message=full_reply,
-            )
-            yield "event: end\ndata: [DONE]\n\n"
-        except Exception as e:
-            # 错误事件（不暴露内部细节）
-            yield "event: error\ndata: 服务器处理异常\n\n"
+            if cached is None and not exhausted:
+                _semantic_store(message, history, full_reply, chain_kwargs)
+            _append_turn(session_id, message, full_reply)
+        finally:
+            await stream.aclose()
+        if exhausted:
+            raise _QuotaExhausted()
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+async def _sse_chat(
+    message: str,
+    session_id: str,
+    history: list,
+    usage_key: str,
+    prompt_tokens: int,
+    cached: Optional[str] = None,
+    chain_kwargs: Optional[dict] = None,
+):
+    """SSE 事件流：逐片推送回复，结束事件为 `end`；预算用尽或异常时为 `error`。"""
+    chunks = _reply_chunks(message, session_id, history, usage_key, prompt_tokens, cached, chain_kwargs)
+    try:
+        async for text in chunks:
+            yield f"data: {text}\n\n"
+        yield "event: end\ndata: [DONE]\n\n"
+    except _QuotaExhausted:
+        yield "event: error\ndata: token quota exceeded\n\n"
+    except Exception:
+        # 错误事件（不暴露内部细节）
+        yield "event: error\ndata: 服务器处理异常\n\n"
+    finally:
+        await chunks.aclose()
+
+
+async def _sse_entry(entry):
+    """幂等条目的 SSE 事件流：回放已产出片段并跟随实时输出，事件格式同 `_sse_chat`。"""
+    async for text in entry.subscribe():
+        yield f"data: {text}\n\n"
+    if entry.error is None:
+        yield "event: end\ndata: [DONE]\n\n"
+    elif isinstance(entry.error, _QuotaExhausted):
+        yield "event: error\ndata: token quota exceeded\n\n"
+    else:
+        yield "event: error\ndata: 服务器处理异常\n\n"
 
-@app.get("/chat/stream", dependencies=[Depends(require_api_key), Depends(require_rate_limit)])
-async def chat_stream_get(message: str, session_id: str):
-    """流式聊天接口（GET 版本，兼容原生 EventSource）。"""
 
-    async def event_generator():
+def _stream_reply(message: str, session_id: str, usage_key: str, idempotency_key: str | None) -> StreamingResponse:
+    entry, created = _begin_idempotent(idempotency_key, usage_key, "chat/stream", session_id, message)
+    if not created:
+        return StreamingResponse(
+            load_monitor.track_stream(_sse_entry(entry)), media_type="text/event-stream", headers=_REPLAYED_HEADERS
+        )
+    with span("session.get_history"):
         history = session_manager.get_history(session_id)
-        collected: list[str] = []
-        try:
-            async for chunk in chat_chain.stream_message(
-                message=message, history=history
-            ):
-                text = str(chunk)
-                collected.append(text)
-                yield f"data: {text}\n\n"
-            full_reply = "".join(collected).strip()
-            session_manager.add_message(
-                session_id=session_id,
-                user_message=message,
-                bot_message=full_reply,
-            )
-            yield "event: end\ndata: [DONE]\n\n"
-        except Exception:
-            yield "event: error\ndata: 服务器处理异常\n\n"
+    try:
+        cached, chain_kwargs, prompt_tokens = _plan_reply(session_id, message, history, usage_key)
+    except Exception:
+        if entry is not None:
+            idempotency_store.discard(entry)
+        raise
+    if entry is None:
+        return StreamingResponse(
+            load_monitor.track_stream(
+                _sse_chat(message, session_id, history, usage_key, prompt_tokens, cached, chain_kwargs)
+            ),
+            media_type="text/event-stream",
+        )
+    # 预算用尽时已输出部分已写入历史，视为完成（重试回放同样的结果）
+    idempotency_store.run(
+        entry,
+        _reply_chunks(message, session_id, history, usage_key, prompt_tokens, cached, chain_kwargs),
+        keep_errors=(_QuotaExhausted,),
+    )
+    return StreamingResponse(load_monitor.track_stream(_sse_entry(entry)), media_type="text/event-stream")
+
+
+@app.post("/chat/stream", dependencies=[Depends(require_api_key), Depends(require_capacity), Depends(require_rate_limit)])
+async def chat_stream(
+    request: ChatRequest,
+    usage_key: str = Depends(resolve_usage_key),
+    idempotency_key: str | None = Header(default=None),
+):
+    """流式聊天接口（SSE）。"""
+    return _stream_reply(request.message, request.session_id, usage_key, idempotency_key)
+
+
+class StreamTicketResponse(BaseModel):
+    ticket: str
+    expires_in: int
+    stream_url: str
+
+
+@app.post(
+    "/chat/stream/tickets",
+    response_model=StreamTicketResponse,
+    dependencies=[Depends(require_api_key), Depends(require_rate_limit)],
+)
+async def create_stream_ticket(request: ChatRequest, usage_key: str = Depends(resolve_usage_key)):
+    """签发流式票据：消息暂存服务端（短 TTL、一次性），供 EventSource 以 GET 拉流。"""
+    ticket_id, _ = ticket_store.issue(request.message, request.session_id, usage_key)
+    return StreamTicketResponse(
+        ticket=ticket_id,
+        expires_in=int(settings.stream_ticket_ttl_s),
+        stream_url=f"/chat/stream?ticket={ticket_id}",
+    )
+
+
+@app.get("/chat/stream", dependencies=[Depends(require_api_key), Depends(require_capacity), Depends(require_rate_limit)])
+async def chat_stream_get(
+    message: str | None = None,
+    session_id: str | None = None,
+    ticket: str | None = None,
+    usage_key: str = Depends(resolve_usage_key),
+    idempotency_key: str | None = Header(default=None),
+):
+    """流式聊天接口（GET 版本，兼容原生 EventSource）；支持 `?ticket=` 或 message/session_id。"""
+    if ticket:
+        t = ticket_store.redeem(ticket)
+        if t is None:
+            raise HTTPException(status_code=401, detail="invalid or expired ticket")
+        message, session_id, usage_key = t.message, t.session_id, t.usage_key
+    elif not message or not session_id:
+        raise HTTPException(status_code=422, detail="message and session_id are required")
+    return _stream_reply(message, session_id, usage_key, idempotency_key)
+
+
+# ---------- 异步对话任务 ----------
+async def _run_chat_job(job):
+    """任务执行：在轮到该会话时读取历史并生成回复（与同步接口同一套路由、计费与历史写入）。"""
+    with span("session.get_history"):
+        history = session_manager.get_history(job.session_id)
+    try:
+        cached, chain_kwargs, prompt_tokens = _plan_reply(job.session_id, job.message, history, job.usage_key)
+    except HTTPException as e:
+        raise JobFailed(e.detail)
+    try:
+        async for text in _reply_chunks(
+            job.message, job.session_id, history, job.usage_key, prompt_tokens, cached, chain_kwargs
+        ):
+            yield text
+    except _QuotaExhausted:
+        raise JobFailed("token quota exceeded")
+
+
+job_manager = JobManager(
+    _run_chat_job,
+    workers=settings.chat_jobs_workers,
+    max_queued=settings.chat_jobs_max_queued,
+    result_ttl_s=settings.chat_jobs_result_ttl_s,
+    max_jobs=settings.chat_jobs_max,
+)
+
+
+class ChatJobResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    stream_url: str
+
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+def _get_own_job(job_id: str, usage_key: str):
+    job = job_manager.get(job_id)
+    # 仅提交方（同一用量键）可查看；不存在与无权限同样返回 404
+    if job is None or not hmac.compare_digest(job.usage_key, usage_key):
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@app.post(
+    "/chat/jobs",
+    response_model=ChatJobResponse,
+    status_code=202,
+    dependencies=[Depends(require_api_key), Depends(require_capacity), Depends(require_rate_limit)],
+)
+async def create_chat_job(request: ChatRequest, usage_key: str = Depends(resolve_usage_key)):
+    """提交异步对话任务，立即返回任务 id；同一会话的任务按提交顺序执行"""
+    try:
+        job = job_manager.submit(request.session_id, request.message, usage_key)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="job queue full", headers={"Retry-After": "5"})
+    return ChatJobResponse(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/chat/jobs/{job.id}",
+        stream_url=f"/chat/jobs/{job.id}/stream",
+    )
+
+
+@app.get("/chat/jobs/{job_id}", dependencies=[Depends(require_api_key)])
+async def get_chat_job(job_id: str, usage_key: str = Depends(resolve_usage_key)):
+    """查询任务状态与结果（运行中时为已产出的部分回复）"""
+    return _get_own_job(job_id, usage_key).to_dict()
+
+
+async def _sse_job(job):
+    async for text in job_manager.subscribe(job):
+        yield f"data: {text}\n\n"
+    if job.error:
+        yield f"event: error\ndata: {job.error}\n\n"
+    else:
+        yield "event: end\ndata: [DONE]\n\n"
+
+
+@app.get("/chat/jobs/{job_id}/stream", dependencies=[Depends(require_api_key)])
+async def stream_chat_job(job_id: str, usage_key: str = Depends(resolve_usage_key)):
+    """订阅任务输出（SSE）：先回放已产出片段，再跟随实时输出；断开不影响任务执行"""
+    job = _get_own_job(job_id, usage_key)
+    return StreamingResponse(load_monitor.track_stream(_sse_job(job)), media_type="text/event-stream")
 
 
 @app.get("/health")
 async def health_check():
-    """健康检查"""
+    """健康检查（存活探针：进程可响应即返回 healthy）"""
     return {"status": "healthy", "version": "1.0.0"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪探针：启动完成、未排空且未饱和时返回 200，否则 503 并附原因"""
+    reasons = load_monitor.not_ready_reasons()
+    if reasons:
+        return JSONResponse({"status": "not_ready", "reasons": reasons}, status_code=503)
+    return {"status": "ready"}
+
+
+@app.post("/admin/profile/sampling", dependencies=[Depends(require_profiling), Depends(require_admin_key)])
+async def start_stack_sampling(duration_s: float = 10.0, interval_ms: int | None = None):
+    """启动进程级定时栈采样，结果写入折叠栈文件"""
+    duration_s = max(0.1, min(duration_s, settings.profiling_max_duration_s))
+    interval_s = max(1, interval_ms or settings.profiling_sample_interval_ms) / 1000
+    try:
+        path = stack_sampler.start(duration_s, interval_s)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="sampler already running")
+    return {"status": "started", "file": path, "duration_s": duration_s}
+
+
+@app.get("/admin/profile/sampling", dependencies=[Depends(require_profiling), Depends(require_admin_key)])
+async def stack_sampling_status():
+    """查询栈采样状态"""
+    return stack_sampler.status()
+
+
+@app.get("/usage", dependencies=[Depends(require_api_key)])
+async def get_my_usage(usage_key: str = Depends(resolve_usage_key)):
+    """调用方（按 API Key）的 token 用量与剩余预算"""
+    return token_quota.key_report(usage_key)
+
+
+@app.get("/admin/usage", dependencies=[Depends(require_admin_key)])
+async def get_all_usage():
+    """全部 Key 的 token 用量"""
+    return {"keys": token_quota.all_keys_report()}
+
+
+@app.get("/admin/semantic-cache", dependencies=[Depends(require_admin_key)])
+async def get_semantic_cache_stats():
+    """语义缓存命中统计"""
+    if semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_cache.stats()}
+
+
+@app.get("/admin/knowledge", dependencies=[Depends(require_admin_key)])
+async def get_knowledge_stats():
+    """FAQ 知识库状态"""
+    if knowledge_base is None:
+        return {"enabled": False}
+    return {"enabled": True, **knowledge_base.stats()}
+
+
+@app.post("/admin/knowledge/reload", dependencies=[Depends(require_admin_key)])
+async def reload_knowledge():
+    """立即增量重载 FAQ 文件，返回新增/更新/删除条目数"""
+    if knowledge_base is None:
+        raise HTTPException(status_code=404, detail="knowledge base disabled")
+    return knowledge_base.reload()
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin_key)])
+async def get_profiles_stats():
+    """租户画像：已加载的租户、重载次数，及已编译链路与模型客户端数"""
+    stats = profile_registry.stats()
+    if chat_chain is not None and hasattr(chat_chain, "profile_chains"):
+        stats["compiled_chains"] = len(chat_chain.profile_chains)
+        stats["llm_clients"] = len(chat_chain.llms)
+    return stats
+
+
+@app.get("/admin/load", dependencies=[Depends(require_admin_key)])
+async def get_load_stats():
+    """负载信号：在途流、上游深度、事件循环延迟与削峰次数"""
+    return load_monitor.stats()
+
+
+@app.get("/admin/sessions", dependencies=[Depends(require_admin_key)])
+async def get_sessions_stats():
+    """会话统计（含热/温/冷各层会话数与大小、滚动摘要折叠与节省的提示词 token）"""
+    stats = session_manager.get_session_stats()
+    if rolling_summarizer is not None:
+        stats["summary"] = rolling_summarizer.stats()
+    return stats
+
+
+@app.get("/sessions/{session_id}/usage")
+async def get_session_usage(session_id: str):
+    """会话的 token 用量"""
+    return {"session_id": session_id, **token_quota.session_report(session_id)}
+
+
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """删除会话"""
     session_manager.clear_session(session_id)
+    token_quota.forget_session(session_id)
+    history_cache.forget(session_id)
+    if long_term_memory is not None:
+        long_term_memory.forget(session_id)
+    if rolling_summarizer is not None:
+        rolling_summarizer.forget(session_id)
     return {"message": f"会话 {session_id} 删除成功"}
 
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(t.strip().removeprefix("W/") in (etag, "*") for t in if_none_match.split(","))
+
+
 @app.get("/sessions/{session_id}/history")
-async def get_session_history(session_id: str):
-    """获取会话历史"""
-    history = session_manager.get_history(session_id)
-    return {"session_id": session_id, "history": history}
+async def get_session_history(
+    session_id: str,
+    before: int | None = Query(default=None, ge=0),
+    limit: int = Query(default=50, ge=1, le=500),
+    if_none_match: str | None = Header(default=None),
+):
+    """获取会话历史（游标分页：`before` 为消息序号，返回其之前的最近 `limit` 条）
+
+    只读访问：不刷新会话活跃时间；响应体由逐条缓存的 JSON 字节拼接，`If-None-Match` 命中返回 304。
+    """
+    history = session_manager.peek_history(session_id)
+    page = history_cache.page(history, before, limit)
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, page.etag):
+        return Response(status_code=304, headers=headers)
+    body = history_cache.render(session_id, history, page)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     # 默认开发模式，未提供证书时以 HTTP 运行
     uvicorn.run(
         "main:app",
@@ -0,0 +1,164 @@
+"""租户画像：按租户选择系统提示词与模型，单个部署服务多个租户。
+
+- 画像来源：`profiles`（配置，JSON 对象）与可选的画像文件 `profiles_file`（同格式，文件优先）：
+  `{"tenant": {"system_prompt": "...", "model_name": "qwen-plus", "temperature": 0.3}}`，
+  省略的字段沿用默认配置；名为 `default` 的画像用于未单独配置的租户。
+- 租户取自 `api_keys` 条目的 `tenant`（缺省为 kid）。请求路径为两次字典查找：kid -> 租户 -> 画像。
+- `ProfileRegistry` 在配置对象被替换或画像文件 mtime 变化时重建不可变索引并原子替换引用；
+  文件解析失败时保留上一版索引。`on_reload` 回调用于预编译新画像的链路（见 `ChatChain.compile_profiles`），
+  在途流持有旧链路引用，不受替换影响。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("app.profiles")
+
+DEFAULT_PROFILE = "default"
+
+
+@dataclass(frozen=True)
+class Profile:
+    """画像内容决定编译出的链路；名称不参与比较，内容相同的画像共享同一条已编译链路。"""
+
+    name: str = field(compare=False)
+    system_prompt: Optional[str] = None  # None 表示沿用内置系统提示词
+    model_name: Optional[str] = None  # None 表示沿用 `model_name`
+    temperature: Optional[float] = None  # None 表示沿用 `temperature`
+
+    @classmethod
+    def parse(cls, name: str, value: Any) -> "Profile":
+        if not isinstance(value, dict):
+            raise ValueError(f"profile {name!r} must be an object")
+        prompt, model, temperature = value.get("system_prompt"), value.get("model_name"), value.get("temperature")
+        if prompt is not None and not isinstance(prompt, str):
+            raise ValueError(f"profile {name!r}: system_prompt must be a string")
+        if model is not None and not isinstance(model, str):
+            raise ValueError(f"profile {name!r}: model_name must be a string")
+        if temperature is not None:
+            if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not 0 <= temperature <= 1:
+                raise ValueError(f"profile {name!r}: temperature must be within [0, 1]")
+            temperature = float(temperature)
+        return cls(name, prompt or None, model or None, temperature)
+
+
+class ProfileIndex:
+    """不可变索引；构建后不再修改，可被多个请求无锁并发读取。"""
+
+    def __init__(self, profiles: Dict[str, Profile]):
+        self.by_tenant = profiles
+        self.default = profiles.get(DEFAULT_PROFILE)
+
+    def __len__(self) -> int:
+        return len(self.by_tenant)
+
+    def get(self, tenant: Optional[str]) -> Optional[Profile]:
+        """租户画像；未配置时返回 `default` 画像，二者都没有时返回 None（使用内置链路）。"""
+        if tenant is not None:
+            profile = self.by_tenant.get(tenant)
+            if profile is not None:
+                return profile
+        return self.default
+
+    def profiles(self) -> List[Profile]:
+        return list(self.by_tenant.values())
+
+    @classmethod
+    def from_sources(cls, *sources: Dict[str, Any]) -> "ProfileIndex":
+        """按顺序合并来源（后者覆盖前者）；任一画像无效时抛出 ValueError。"""
+        merged: Dict[str, Any] = {}
+        for source in sources:
+            merged.update(source or {})
+        return cls({name: Profile.parse(name, value) for name, value in merged.items()})
+
+
+class ProfileRegistry:
+    """持有当前画像索引；检测到配置或画像文件变化时重建并原子替换。"""
+
+    def __init__(
+        self,
+        settings,
+        check_interval_s: float = 5.0,
+        on_reload: Optional[Callable[[ProfileIndex], None]] = None,
+    ):
+        self.settings = settings
+        self.check_interval_s = check_interval_s
+        self.on_reload = on_reload
+        self._index = ProfileIndex({})
+        self._fingerprint: Optional[Tuple] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.errors = 0
+        self.reload()
+
+    def _config_fingerprint(self) -> Tuple:
+        s = self.settings
+        return (id(s.profiles), s.profiles_file)
+
+    def _file_mtime(self) -> Optional[float]:
+        path = self.settings.profiles_file
+        if not path:
+            return None
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_file(self) -> Dict[str, Any]:
+        path = self.settings.profiles_file
+        if not path:
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("profiles file must contain a JSON object")
+        return data
+
+    def reload(self) -> ProfileIndex:
+        with self._lock:
+            fingerprint = (self._config_fingerprint(), self._file_mtime())
+            self._fingerprint = fingerprint  # 失败时同样记录，文件再次变化前不重复解析
+            try:
+                index = ProfileIndex.from_sources(self.settings.profiles, self._load_file())
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                logger.warning("load profiles failed, keeping previous %d profiles: %s", len(self._index), e)
+                return self._index
+            if self.on_reload is not None:
+                self.on_reload(index)
+            self._index = index
+            self.reloads += 1
+            return index
+
+    def current(self) -> ProfileIndex:
+        """返回当前索引；配置字段变化立即重建，文件变化按 `check_interval_s` 节流检测。"""
+        now = time.monotonic()
+        fp = self._fingerprint
+        if fp is not None and fp[0] == self._config_fingerprint():
+            if now < self._next_check:
+                return self._index
+            self._next_check = now + self.check_interval_s
+            if fp[1] == self._file_mtime():
+                return self._index
+        return self.reload()
+
+    def stats(self) -> Dict:
+        index = self._index
+        return {
+            "profiles": sorted(index.by_tenant),
+            "default": index.default is not None,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+
+def build_profile_registry(s) -> ProfileRegistry:
+    return ProfileRegistry(s, check_interval_s=s.profiles_reload_interval_s)
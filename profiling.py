@@ -0,0 +1,146 @@
+"""按需性能剖析：单请求 CPU Profile 与进程级定时栈采样。
+
+- `RequestProfilerMiddleware`：纯 ASGI 中间件，仅当请求携带 `X-Profile` 且管理员密钥
+  校验通过时，用 cProfile 包住该请求（含流式 body 发送），结果写入 `.prof` 文件，
+  响应头 `X-Profile-File` 返回文件名。未启用时不注册，零开销。
+- `StackSampler`：后台线程按固定间隔读取 `sys._current_frames()`，累计折叠栈
+  （`a;b;c count`，可直接喂给 flamegraph.pl / speedscope），到时自动停止并落盘。
+  不依赖信号，能在 uvicorn 事件循环内在线开启，无需重启 Pod。
+
+注意：cProfile 作用于事件循环线程，剖析期间同一线程上并发执行的其他请求也会被计入；
+同一时刻只允许一个请求剖析。
+"""
+
+from __future__ import annotations
+
+import cProfile
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+PROFILE_HEADER = b"x-profile"
+ADMIN_KEY_HEADER = b"x-admin-key"
+
+
+def is_valid_admin_key(expected: Optional[str], candidate: Optional[str]) -> bool:
+    if not expected or not candidate:
+        return False
+    return hmac.compare_digest(expected.encode("utf-8"), candidate.encode("utf-8"))
+
+
+class RequestProfilerMiddleware:
+    """对单个请求做 CPU Profile（由认证请求头触发）。"""
+
+    def __init__(self, app, admin_api_key: Optional[str], output_dir: str):
+        self.app = app
+        self.admin_api_key = admin_api_key
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if PROFILE_HEADER not in headers:
+            return await self.app(scope, receive, send)
+        candidate = headers.get(ADMIN_KEY_HEADER, b"").decode("latin-1")
+        if not is_valid_admin_key(self.admin_api_key, candidate):
+            return await self.app(scope, receive, send)
+        # cProfile 同一时刻只能有一个活动实例
+        if not self._lock.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        filename = f"req-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1_000_000:06d}.prof"
+        path = os.path.join(self.output_dir, filename)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-file", filename.encode("latin-1"))
+                ]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_header)
+            finally:
+                profiler.disable()
+            profiler.dump_stats(path)
+        finally:
+            self._lock.release()
+
+
+class StackSampler:
+    """定时栈采样器（进程级），输出折叠栈文本。"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_file: Optional[str] = None
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration_s: float, interval_s: float) -> str:
+        """启动一次定时采样，返回输出文件路径；已有采样在运行时抛出 RuntimeError。"""
+        if self.running:
+            raise RuntimeError("sampler already running")
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"stacks-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        self._stop.clear()
+        self.samples = 0
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(path, duration_s, interval_s),
+            name="stack-sampler",
+            daemon=True,
+        )
+        self._thread.start()
+        return path
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, path: str, duration_s: float, interval_s: float) -> None:
+        own_ident = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + duration_s
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stacks[_collapse(frame, names.get(ident, str(ident)))] += 1
+            self.samples += 1
+            self._stop.wait(interval_s)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.last_file = path
+
+    def status(self) -> Dict:
+        return {"running": self.running, "samples": self.samples, "last_file": self.last_file}
+
+
+def _collapse(frame, thread_name: str) -> str:
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    parts.append(thread_name)
+    parts.reverse()
+    return ";".join(p.replace(";", ":") for p in parts)
@@ -0,0 +1,280 @@
+"""内存级速率限制：GCRA（通用信元速率算法）+ LRU 有界键表 + 多维组合。
+
+GCRA 每个键只保存一个浮点数 TAT（理论到达时间），判定与更新均为 O(1)：
+- 发射间隔 T = window_s / max_requests，突发容量等于 max_requests；
+- 请求到达时 new_tat = max(tat, now) + T，若 new_tat - now > window_s 则拒绝。
+TAT 不晚于当前时间的键与“从未出现”等价，可随时淘汰；键表按 LRU 维护并设上限，
+扫描大量 IP 不会让内存无限增长。
+
+集群模式（多副本）使用 `DistributedRateLimiter`：请求路径只操作本地计数，
+由后台周期性 `sync()` 与共享计数存储批量对账，以有界超发换取零网络往返。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass(slots=True)
+class RateLimitDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # 距离额度完全恢复的秒数
+    retry_after: float  # 被拒绝时距离下次可用的秒数（允许时为 0）
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            h["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return h
+
+
+class GCRARateLimiter:
+    """单维度 GCRA 限流器；`max_keys` 限制键表大小（LRU 淘汰）。"""
+
+    def __init__(self, max_requests: int, window_s: float, max_keys: int = 100_000):
+        self.max_requests = max_requests
+        self.window_s = window_s
+        self.max_keys = max_keys
+        self.emission_interval = window_s / max_requests
+        self.tats: "OrderedDict[str, float]" = OrderedDict()
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def check(self, key: str, now: Optional[float] = None) -> Tuple[RateLimitDecision, float]:
+        """只判定不落账，返回 (decision, new_tat)；用于多维组合时先全部判定再统一提交。"""
+        now = time.time() if now is None else now
+        tat = self.tats.get(key)
+        if tat is None or tat < now:
+            tat = now
+        new_tat = tat + self.emission_interval
+        ahead = new_tat - now
+        if ahead > self.window_s:
+            return RateLimitDecision(False, self.max_requests, 0, tat - now, ahead - self.window_s), tat
+        remaining = int((self.window_s - ahead) / self.emission_interval + 1e-9)
+        return RateLimitDecision(True, self.max_requests, remaining, ahead, 0.0), new_tat
+
+    def commit(self, key: str, new_tat: float, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        tats = self.tats
+        tats[key] = new_tat
+        tats.move_to_end(key)
+        if len(tats) > self.max_keys:
+            _, head_tat = tats.popitem(last=False)
+            if head_tat > now:
+                self.evicted += 1
+        else:
+            # 顺手回收 LRU 头部一个已过期的键（与新键等价），摊还 O(1)
+            head_key = next(iter(tats))
+            if tats[head_key] <= now:
+                del tats[head_key]
+
+    def allow(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        now = time.time() if now is None else now
+        with self._lock:
+            decision, new_tat = self.check(key, now)
+            if decision.allowed:
+                self.commit(key, new_tat, now)
+        return decision
+
+    def __len__(self) -> int:
+        return len(self.tats)
+
+
+class CompositeRateLimiter:
+    """多维组合限流（如 按 key + 按 IP + 全局）：全部维度通过才放行，且只在放行时落账。
+
+    返回的决策取剩余额度最少的维度，用于生成 `X-RateLimit-*` 头。
+    """
+
+    def __init__(self, limiters: Sequence[Tuple[str, Any]]):
+        # 成员需提供 check(key, now) -> (decision, token) 与 commit(key, token, now)
+        self.limiters: List[Tuple[str, Any]] = list(limiters)
+        self._lock = threading.Lock()
+
+    def allow(self, keys: Dict[str, str], now: Optional[float] = None) -> RateLimitDecision:
+        """`keys` 为 维度名 -> 键；缺失的维度跳过。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            pending = []
+            worst: Optional[RateLimitDecision] = None
+            for name, limiter in self.limiters:
+                key = keys.get(name)
+                if key is None:
+                    continue
+                decision, new_tat = limiter.check(key, now)
+                if not decision.allowed:
+                    return decision
+                pending.append((limiter, key, new_tat))
+                if worst is None or decision.remaining < worst.remaining:
+                    worst = decision
+            for limiter, key, new_tat in pending:
+                limiter.commit(key, new_tat, now)
+            return worst or RateLimitDecision(True, 0, 0, 0.0, 0.0)
+
+    def sync(self) -> None:
+        """同步所有集群模式维度（本地维度无需同步）。"""
+        for _, limiter in self.limiters:
+            if isinstance(limiter, DistributedRateLimiter):
+                limiter.sync()
+
+    @property
+    def distributed(self) -> bool:
+        return any(isinstance(limiter, DistributedRateLimiter) for _, limiter in self.limiters)
+
+
+# ---------- 集群模式：本地计数 + 批量同步共享计数 ----------
+class CounterStore:
+    """共享计数存储接口：按固定窗口累加计数并返回累加后的集群总数。"""
+
+    def incr_many(self, window: int, deltas: Dict[str, int], ttl_s: float) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class InMemoryCounterStore(CounterStore):
+    """进程内替身存储（测试/单机用）：多个限流器实例共享同一对象即可模拟多副本。"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[int, str], int] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def incr_many(self, window: int, deltas: Dict[str, int], ttl_s: float) -> Dict[str, int]:
+        with self._lock:
+            self.calls += 1
+            # 丢弃早于上一窗口的计数，模拟 TTL 过期
+            for wk in [wk for wk in self.counters if wk[0] < window - 1]:
+                del self.counters[wk]
+            out = {}
+            for key, delta in deltas.items():
+                total = self.counters.get((window, key), 0) + delta
+                self.counters[(window, key)] = total
+                out[key] = total
+            return out
+
+
+class RedisCounterStore(CounterStore):
+    """Redis 共享计数（可选依赖 `redis`）：一次 pipeline 完成批量 INCRBY + EXPIRE。"""
+
+    def __init__(self, url: str, prefix: str = "rl"):
+        import redis  # 可选依赖，仅集群模式需要
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def incr_many(self, window: int, deltas: Dict[str, int], ttl_s: float) -> Dict[str, int]:
+        keys = list(deltas)
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            name = f"{self.prefix}:{window}:{key}"
+            pipe.incrby(name, deltas[key])
+            pipe.expire(name, int(math.ceil(ttl_s)))
+        results = pipe.execute()
+        return {key: int(results[i * 2]) for i, key in enumerate(keys)}
+
+
+class DistributedRateLimiter:
+    """集群级固定窗口限流：请求路径只读写本地计数，后台按 `sync()` 批量与共享存储对账。
+
+    判定依据为 `上次同步得到的集群总数 + 本地未同步计数`。两次同步之间其他副本的放行
+    不可见，因此超发上限约为 “各副本在一个同步周期内的放行量之和”；同步失败时回退为
+    本地计数（计数保留到下次同步），不阻断请求。
+    """
+
+    def __init__(self, max_requests: int, window_s: float, store: CounterStore, name: str = "primary"):
+        self.max_requests = max_requests
+        self.window_s = window_s
+        self.store = store
+        self.name = name
+        self.window = -1
+        self.known: Dict[str, int] = {}  # 上次同步得到的集群计数（当前窗口）
+        self.pending: Dict[str, int] = {}  # 本地已放行、尚未同步的计数
+        self._lock = threading.RLock()
+
+    def _roll(self, now: float) -> None:
+        window = int(now // self.window_s)
+        if window != self.window:
+            self.window = window
+            self.known = {}
+            self.pending = {}
+
+    def check(self, key: str, now: Optional[float] = None) -> Tuple[RateLimitDecision, int]:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll(now)
+            used = self.known.get(key, 0) + self.pending.get(key, 0)
+        reset_after = (self.window + 1) * self.window_s - now
+        if used >= self.max_requests:
+            return RateLimitDecision(False, self.max_requests, 0, reset_after, reset_after), 0
+        return RateLimitDecision(True, self.max_requests, self.max_requests - used - 1, reset_after, 0.0), 1
+
+    def commit(self, key: str, delta: int, now: Optional[float] = None) -> None:
+        with self._lock:
+            self.pending[key] = self.pending.get(key, 0) + delta
+
+    def allow(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        with self._lock:
+            decision, delta = self.check(key, now)
+            if decision.allowed:
+                self.commit(key, delta, now)
+        return decision
+
+    def sync(self, now: Optional[float] = None) -> None:
+        """把本地计数批量推送到共享存储，并刷新本窗口内已知键的集群总数。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll(now)
+            window = self.window
+            deltas = {key: 0 for key in self.known}
+            deltas.update(self.pending)
+            self.pending = {}
+        if not deltas:
+            return
+        try:
+            totals = self.store.incr_many(window, {f"{self.name}:{k}": v for k, v in deltas.items()}, self.window_s * 2)
+        except Exception:
+            # 同步失败：计数退回本地，下个周期重试
+            with self._lock:
+                if self.window == window:
+                    for key, delta in deltas.items():
+                        if delta:
+                            self.pending[key] = self.pending.get(key, 0) + delta
+            raise
+        prefix_len = len(self.name) + 1
+        with self._lock:
+            if self.window == window:
+                for name, total in totals.items():
+                    self.known[name[prefix_len:]] = total
+
+
+def build_rate_limiter(s, store: Optional[CounterStore] = None) -> CompositeRateLimiter:
+    """依据配置构建组合限流器：主维度（ip/api_key）必有，另可叠加按 IP 与全局限额。
+
+    `rate_limit_mode="cluster"` 时各维度改用 DistributedRateLimiter，共享存储由
+    `rate_limit_store_url` 指定（redis://...），未配置则退化为进程内存储。
+    """
+
+    def make(name: str, max_requests: int, max_keys: int):
+        if s.rate_limit_mode == "cluster":
+            return DistributedRateLimiter(max_requests, s.rate_limit_window_s, shared, name=name)
+        return GCRARateLimiter(max_requests, s.rate_limit_window_s, max_keys)
+
+    shared = store
+    if s.rate_limit_mode == "cluster" and shared is None:
+        shared = RedisCounterStore(s.rate_limit_store_url) if s.rate_limit_store_url else InMemoryCounterStore()
+    limiters: List[Tuple[str, Any]] = [("primary", make("primary", s.rate_limit_requests, s.rate_limit_max_keys))]
+    if s.rate_limit_ip_requests:
+        limiters.append(("ip", make("ip", s.rate_limit_ip_requests, s.rate_limit_max_keys)))
+    if s.rate_limit_global_requests:
+        limiters.append(("global", make("global", s.rate_limit_global_requests, 1)))
+    return CompositeRateLimiter(limiters)
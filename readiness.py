@@ -0,0 +1,177 @@
+"""就绪探针、过载削峰与优雅排空。
+
+- 饱和信号：在途 SSE 流数、上游深度（在途生成数 + 排队的异步任务数）、事件循环延迟。
+- 就绪：启动完成、未排空且各信号低于阈值时 `/ready` 返回 200，否则 503（附原因），
+  负载均衡据此把流量导向其他副本。
+- 削峰：信号超过阈值的 `shed_factor` 倍时直接拒绝新的对话轮次（503 + Retry-After），
+  避免在探针周期内继续接收请求拖垮在途流。
+- 排空：收到 SIGTERM 后不再接收新的对话轮次，等待在途流、生成与排队任务结束（最长 `drain_timeout_s`），
+  再交还服务器原有的退出处理。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger("app.readiness")
+
+
+class LoadMonitor:
+    def __init__(
+        self,
+        max_streams: int = 0,
+        max_upstream: int = 0,
+        max_loop_lag_ms: float = 0,
+        shed_factor: float = 1.5,
+        lag_interval_s: float = 0.5,
+        drain_timeout_s: float = 25.0,
+        upstream_queued: Optional[Callable[[], int]] = None,
+    ):
+        self.max_streams = max_streams  # 0 表示不限
+        self.max_upstream = max_upstream
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.shed_factor = shed_factor  # 0 表示只在排空时拒绝
+        self.lag_interval_s = lag_interval_s
+        self.drain_timeout_s = drain_timeout_s
+        self.upstream_queued = upstream_queued or (lambda: 0)
+        self.started = False
+        self.draining = False
+        self.streams = 0
+        self.turns = 0
+        self.loop_lag_ms = 0.0
+        self.shed = 0
+        self._drain_task: Optional[asyncio.Task] = None
+
+    # ---------- 计数 ----------
+    @contextmanager
+    def turn(self):
+        """标记一次在途生成（调用上游 LLM 或写入历史的对话轮次）。"""
+        self.turns += 1
+        try:
+            yield
+        finally:
+            self.turns -= 1
+
+    async def track_stream(self, events: AsyncIterator[str]) -> AsyncIterator[str]:
+        """包装 SSE 事件流，统计在途流数。"""
+        self.streams += 1
+        try:
+            async for event in events:
+                yield event
+        finally:
+            self.streams -= 1
+            await events.aclose()
+
+    # ---------- 饱和判定 ----------
+    @property
+    def upstream(self) -> int:
+        return self.turns + self.upstream_queued()
+
+    def _over(self, factor: float) -> List[str]:
+        reasons = []
+        if self.max_streams and self.streams >= self.max_streams * factor:
+            reasons.append("streams")
+        if self.max_upstream and self.upstream >= self.max_upstream * factor:
+            reasons.append("upstream")
+        if self.max_loop_lag_ms and self.loop_lag_ms >= self.max_loop_lag_ms * factor:
+            reasons.append("loop_lag")
+        return reasons
+
+    def not_ready_reasons(self) -> List[str]:
+        reasons = []
+        if not self.started:
+            reasons.append("starting")
+        if self.draining:
+            reasons.append("draining")
+        return reasons + self._over(1.0)
+
+    def shed_reason(self) -> Optional[str]:
+        """应拒绝新对话轮次时返回原因。"""
+        if self.draining:
+            return "draining"
+        over = self._over(self.shed_factor) if self.shed_factor > 0 else []
+        if over:
+            self.shed += 1
+            return over[0]
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "started": self.started,
+            "draining": self.draining,
+            "streams": self.streams,
+            "turns": self.turns,
+            "upstream": self.upstream,
+            "loop_lag_ms": round(self.loop_lag_ms, 1),
+            "shed": self.shed,
+        }
+
+    # ---------- 事件循环延迟 ----------
+    async def monitor_loop_lag(self) -> None:
+        """周期性休眠并测量实际唤醒延迟；取衰减峰值，单次长阻塞在若干周期内逐步回落。"""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval_s)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.lag_interval_s) * 1000)
+            self.loop_lag_ms = max(lag_ms, self.loop_lag_ms * 0.5)
+
+    # ---------- 排空 ----------
+    async def drain(self, poll_s: float = 0.1) -> bool:
+        """进入排空并等待在途流、生成与排队任务结束；超时返回 False。"""
+        self.draining = True
+        logger.info("draining: %d streams, %d turns in flight", self.streams, self.turns)
+        deadline = time.monotonic() + self.drain_timeout_s
+        while self.streams or self.upstream:
+            if time.monotonic() >= deadline:
+                logger.warning("drain timed out with %d streams, %d upstream", self.streams, self.upstream)
+                return False
+            await asyncio.sleep(poll_s)
+        return True
+
+    def install_drain_handler(self) -> bool:
+        """接管 SIGTERM：先排空，再调用服务器原有的处理函数（uvicorn 据此优雅退出）。
+
+        再次收到 SIGTERM 时立即交还原处理函数。需在主线程、服务器已注册信号处理后调用。
+        """
+        previous = signal.getsignal(signal.SIGTERM)
+        if not callable(previous):
+            return False
+        loop = asyncio.get_running_loop()
+
+        def handler(sig, frame):
+            if self.draining:
+                previous(sig, frame)
+                return
+
+            async def drain_then_exit():
+                await self.drain()
+                previous(sig, frame)
+
+            def start():
+                self._drain_task = loop.create_task(drain_then_exit())
+
+            self.draining = True
+            loop.call_soon_threadsafe(start)
+
+        try:
+            signal.signal(signal.SIGTERM, handler)
+        except ValueError:  # 非主线程
+            return False
+        return True
+
+
+def build_load_monitor(s, upstream_queued: Optional[Callable[[], int]] = None) -> LoadMonitor:
+    return LoadMonitor(
+        max_streams=s.readiness_max_streams,
+        max_upstream=s.readiness_max_upstream,
+        max_loop_lag_ms=s.readiness_max_loop_lag_ms,
+        shed_factor=s.load_shed_factor,
+        lag_interval_s=s.loop_lag_interval_s,
+        drain_timeout_s=s.drain_timeout_s,
+        upstream_queued=upstream_queued,
+    )
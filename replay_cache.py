@@ -0,0 +1,155 @@
+"""签名 URL 的 nonce 防重放缓存：内存有界，按时间分桶整体过期。
+
+nonce 只需记住到其 URL 过期（`exp + clock_skew`）为止。缓存按过期时间把 nonce 放入
+固定宽度的时间桶，桶过期时整桶丢弃，无需逐条清理：
+- `BucketedNonceCache`：每桶一个 set，精确判定；总条目数设上限，超限时拒绝（fail closed）。
+- `RotatingBloomNonceCache`：每桶一个定长 Bloom 过滤器，内存与请求量无关，
+  代价是极小概率把新 nonce 误判为重放（可配置误判率）。
+- `RedisNonceCache`：`SET NX EXAT` 原子写入，所有副本共享同一 nonce 视图（可选依赖 `redis`）。
+
+接口统一为 `check_and_add(key, expires_at, now) -> bool`：首次出现返回 True。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger("app.replay")
+
+
+class NonceCache:
+    def check_and_add(self, key: str, expires_at: float, now: Optional[float] = None) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class BucketedNonceCache(NonceCache):
+    """按过期时间分桶的 set；`max_entries` 为全部桶的总条目上限。"""
+
+    def __init__(self, bucket_s: float = 30.0, max_entries: int = 1_000_000):
+        self.bucket_s = bucket_s
+        self.max_entries = max_entries
+        self.buckets: Dict[int, Set[str]] = {}
+        self.size = 0
+        self.rejected_full = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        # 桶 i 覆盖过期时间 [i*bucket_s, (i+1)*bucket_s)，整桶过期后丢弃
+        horizon = int(now // self.bucket_s)
+        for idx in [i for i in self.buckets if i < horizon]:
+            self.size -= len(self.buckets.pop(idx))
+
+    def check_and_add(self, key: str, expires_at: float, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        idx = int(expires_at // self.bucket_s)
+        with self._lock:
+            self._expire(now)
+            bucket = self.buckets.get(idx)
+            if bucket is not None and key in bucket:
+                return False
+            if self.size >= self.max_entries:
+                self.rejected_full += 1
+                logger.warning("nonce cache full, rejecting signed url")
+                return False
+            if bucket is None:
+                bucket = self.buckets[idx] = set()
+            bucket.add(key)
+            self.size += 1
+            return True
+
+    def stats(self) -> Dict:
+        return {"backend": "sets", "buckets": len(self.buckets), "entries": self.size, "rejected_full": self.rejected_full}
+
+
+class _Bloom:
+    __slots__ = ("bits", "m", "k")
+
+    def __init__(self, m: int, k: int):
+        self.bits = bytearray((m + 7) // 8)
+        self.m = m
+        self.k = k
+
+    def add_if_absent(self, key: str) -> bool:
+        """若 key 可能已存在返回 False；否则写入并返回 True。"""
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        bits, m = self.bits, self.m
+        # 双重哈希生成 k 个位置
+        positions = [(h1 + i * h2) % m for i in range(self.k)]
+        if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            return False
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        return True
+
+
+class RotatingBloomNonceCache(NonceCache):
+    """按过期时间分桶的 Bloom 过滤器；每桶容量由 `capacity_per_window` 按桶宽折算。"""
+
+    def __init__(self, window_s: float, capacity_per_window: int, fp_rate: float = 1e-6, bucket_s: float = 30.0):
+        self.bucket_s = bucket_s
+        n = max(1, math.ceil(capacity_per_window * bucket_s / window_s))
+        self.m = max(64, math.ceil(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / n * math.log(2)))
+        self.filters: Dict[int, _Bloom] = {}
+        self._lock = threading.Lock()
+
+    def check_and_add(self, key: str, expires_at: float, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        idx = int(expires_at // self.bucket_s)
+        with self._lock:
+            horizon = int(now // self.bucket_s)
+            for old in [i for i in self.filters if i < horizon]:
+                del self.filters[old]
+            bloom = self.filters.get(idx)
+            if bloom is None:
+                bloom = self.filters[idx] = _Bloom(self.m, self.k)
+            return bloom.add_if_absent(key)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": "bloom",
+            "buckets": len(self.filters),
+            "bits_per_bucket": self.m,
+            "hashes": self.k,
+            "bytes": sum(len(b.bits) for b in self.filters.values()),
+        }
+
+
+class RedisNonceCache(NonceCache):
+    """共享 nonce 视图：`SET key 1 NX EXAT expires_at`，写入成功即首次出现。"""
+
+    def __init__(self, url: str, prefix: str = "nonce"):
+        import redis  # 可选依赖，仅共享后端需要
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def check_and_add(self, key: str, expires_at: float, now: Optional[float] = None) -> bool:
+        return bool(self.client.set(f"{self.prefix}:{key}", 1, nx=True, exat=int(math.ceil(expires_at))))
+
+    def stats(self) -> Dict:
+        return {"backend": "redis"}
+
+
+def build_nonce_cache(s) -> NonceCache:
+    window_s = s.signed_url_ttl_s + 2 * s.signed_url_clock_skew_s
+    if s.replay_cache_backend == "redis" and s.replay_cache_url:
+        return RedisNonceCache(s.replay_cache_url)
+    if s.replay_cache_backend == "bloom":
+        return RotatingBloomNonceCache(
+            window_s,
+            s.replay_cache_bloom_capacity,
+            fp_rate=s.replay_cache_bloom_fp_rate,
+            bucket_s=s.replay_cache_bucket_s,
+        )
+    return BucketedNonceCache(bucket_s=s.replay_cache_bucket_s, max_entries=s.replay_cache_max_entries)
@@ -0,0 +1,142 @@
+"""滚动摘要：长会话的早期轮次在后台折叠为摘要，提示词只带摘要 + 摘要之后的轮次。
+
+- 触发：轮次写入后检查未被摘要覆盖的轮次，数量达到 `trigger_turns`（或 token 估算达到 `trigger_tokens`）时
+  调度后台任务折叠，请求不等待。
+- 折叠：保留最近 `keep_turns` 轮原文，其余未摘要轮次连同已有摘要交给 LLM 合并为新摘要，随会话保存
+  （`SessionManager.set_summary`），记录覆盖到的消息序号 `upto_seq`。
+- 同一会话同时最多一个折叠任务；失败时保留原摘要，下一轮写入后重试。
+- `trigger_turns` 应小于 `history_limit`：未折叠的轮次被截断后无法再进入摘要。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from token_quota import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+logger = logging.getLogger("app.summary")
+
+Summarize = Callable[[Optional[str], List[Dict], int], Awaitable[str]]
+
+
+def turns_after(history: List[Dict], summary: Optional[Dict]) -> List[Dict]:
+    """摘要之后的轮次（`seq` 大于 `upto_seq`）；无摘要时返回全部。"""
+    if not summary:
+        return history
+    upto = summary["upto_seq"]
+    i = len(history)
+    while i and history[i - 1]["seq"] > upto:
+        i -= 1
+    return history[i:]
+
+
+def summary_tokens(summary: Optional[Dict]) -> int:
+    return count_tokens(summary["text"]) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+
+
+class RollingSummarizer:
+    def __init__(
+        self,
+        summarize: Summarize,
+        trigger_turns: int = 8,
+        trigger_tokens: int = 0,
+        keep_turns: int = 4,
+        max_chars: int = 600,
+    ):
+        self.summarize = summarize  # (已有摘要, 待折叠轮次, 字数上限) -> 新摘要
+        self.trigger_turns = trigger_turns
+        self.trigger_tokens = trigger_tokens  # 0 表示只按轮次触发
+        self.keep_turns = keep_turns
+        self.max_chars = max_chars
+        self.running: Dict[str, asyncio.Task] = {}
+        self.compactions = 0
+        self.failures = 0
+        self.folded_turns = 0
+        self.prompts = 0  # 带摘要的提示词数
+        self.prompt_tokens_saved = 0
+
+    def _due(self, pending: List[Dict]) -> bool:
+        if len(pending) <= self.keep_turns:
+            return False
+        if len(pending) >= self.trigger_turns:
+            return True
+        if not self.trigger_tokens:
+            return False
+        tokens = sum(count_tokens(m["user_message"]) + count_tokens(m["bot_message"]) for m in pending)
+        return tokens >= self.trigger_tokens
+
+    def maybe_compact(self, sessions, session_id: str) -> Optional[asyncio.Task]:
+        """轮次写入后调用：需要折叠且没有进行中的任务时调度后台折叠，返回任务。"""
+        if session_id in self.running:
+            return None
+        summary = sessions.get_summary(session_id)
+        pending = turns_after(sessions.peek_history(session_id), summary)
+        if not self._due(pending):
+            return None
+        fold = pending[: len(pending) - self.keep_turns]
+        task = asyncio.create_task(self._compact(sessions, session_id, summary, fold))
+        self.running[session_id] = task
+        return task
+
+    async def _compact(self, sessions, session_id: str, summary: Optional[Dict], fold: List[Dict]) -> bool:
+        try:
+            text = await self.summarize(summary["text"] if summary else None, fold, self.max_chars)
+        except Exception as e:
+            self.failures += 1
+            logger.warning("summarize %s failed: %s", session_id, e)
+            return False
+        finally:
+            self.running.pop(session_id, None)
+        # 折叠期间摘要被替换或会话被清空时放弃本次结果
+        if not text or sessions.get_summary(session_id) is not summary:
+            return False
+        updated = {
+            "text": text,
+            "upto_seq": fold[-1]["seq"],
+            "turns": (summary["turns"] if summary else 0) + len(fold),
+        }
+        if not sessions.set_summary(session_id, updated):
+            return False
+        self.compactions += 1
+        self.folded_turns += len(fold)
+        return True
+
+    def record_prompt(self, full_tokens: int, compact_tokens: int) -> None:
+        """记录一次带摘要的提示词相对完整历史窗口节省的 token 估算。"""
+        self.prompts += 1
+        self.prompt_tokens_saved += max(0, full_tokens - compact_tokens)
+
+    def forget(self, session_id: str) -> None:
+        task = self.running.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def stop(self) -> None:
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "running": len(self.running),
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "folded_turns": self.folded_turns,
+            "prompts_with_summary": self.prompts,
+            "prompt_tokens_saved": self.prompt_tokens_saved,
+        }
+
+
+def build_rolling_summarizer(s, summarize: Summarize) -> Optional[RollingSummarizer]:
+    if not s.summary_enabled:
+        return None
+    return RollingSummarizer(
+        summarize,
+        trigger_turns=s.summary_trigger_turns,
+        trigger_tokens=s.summary_trigger_tokens,
+        keep_turns=s.summary_keep_turns,
+        max_chars=s.summary_max_chars,
+    )
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+API Key 校验基准：旧版“每次重建列表 + 线性查找” vs 预构建摘要索引。
+
+示例：
+  python scripts/bench_api_keys.py --sizes 10 10000 --iterations 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_keys import ApiKeyIndex  # noqa: E402
+
+
+def legacy_is_valid(candidate: str, internal_api_key, internal_api_keys, api_keys) -> bool:
+    """原 main._all_api_keys + _is_valid_api_key 实现，仅用于对比。"""
+    keys: list[str] = []
+    if internal_api_key:
+        keys.append(internal_api_key)
+    if internal_api_keys:
+        keys.extend([k for k in internal_api_keys if k])
+    if api_keys:
+        keys.extend([v for v in api_keys.values() if v])
+    out, seen = [], set()
+    for k in keys:
+        if k not in seen:
+            out.append(k)
+            seen.add(k)
+    return candidate in out
+
+
+def bench(n: int, iterations: int) -> None:
+    api_keys = {f"kid-{i}": secrets.token_hex(32) for i in range(n)}
+    hit = api_keys[f"kid-{n - 1}"]  # 最坏情况：位于列表末尾
+    miss = secrets.token_hex(32)
+
+    t0 = time.perf_counter()
+    index = ApiKeyIndex.from_sources(None, [], api_keys)
+    build_ms = (time.perf_counter() - t0) * 1e3
+
+    for name, fn in (
+        ("legacy", lambda c: legacy_is_valid(c, None, [], api_keys)),
+        ("index", lambda c: index.lookup(c) is not None),
+    ):
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn(hit)
+            fn(miss)
+        elapsed = time.perf_counter() - t0
+        print(f"keys={n:>6} {name:<6} ns/check={elapsed / (2 * iterations) * 1e9:10.0f}")
+    print(f"keys={n:>6} index build={build_ms:.2f}ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 10_000])
+    ap.add_argument("--iterations", type=int, default=20000)
+    args = ap.parse_args()
+    for n in args.sizes:
+        bench(n, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+聊天客户端基准：每次请求新建连接（原 `requests.post` 写法）vs 连接池复用 vs 异步并发会话。
+
+在子进程中以 uvicorn 启动服务（替换为不调用上游的假链路，关闭 lifespan；与客户端分进程避免争用 GIL），统计：
+- 顺序 --requests 次 POST /chat：`requests.post`（每次新建 TCP 连接）vs 同步外观 `ChatClient`（keep-alive）
+- --sessions 个会话各 --turns 轮流式对话：`AsyncChatClient` 单进程并发驱动，统计总耗时与首片段延迟
+- 服务端接受的 TCP 连接数（反映连接复用程度）
+
+示例：
+  python scripts/bench_chat_client.py --requests 500 --sessions 100 --turns 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DASHSCOPE_API_KEY", "sk-bench")
+
+import requests  # noqa: E402
+
+from chat_client import AsyncChatClient, ChatClient  # noqa: E402
+
+
+class EchoChain:
+    async def process_message(self, message, history, recalled=None, knowledge=None):
+        return f"回声: {message}"
+
+    async def stream_message(self, message, history, recalled=None, knowledge=None):
+        for chunk in ("片段1", "片段2", "片段3"):
+            await asyncio.sleep(0.005)  # 模拟上游逐片段输出
+            yield chunk
+
+
+class PeerCounter:
+    """ASGI 包装：按客户端 (host, port) 统计服务端接受的连接数，GET /__peers 返回并清零。"""
+
+    def __init__(self, app):
+        self.app = app
+        self.peers = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/__peers":
+            body, self.peers = str(len(self.peers)).encode(), set()
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"%d" % len(body))]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        if scope["type"] == "http" and scope.get("client"):
+            self.peers.add(tuple(scope["client"]))
+        await self.app(scope, receive, send)
+
+
+def serve(port: int) -> None:
+    """子进程入口：服务端与客户端分属不同进程，避免争用 GIL。"""
+    import logging
+
+    import uvicorn
+
+    import main
+
+    main.chat_chain = EchoChain()
+    logging.getLogger("app").setLevel(logging.WARNING)
+    uvicorn.run(PeerCounter(main.app), port=port, log_level="warning", lifespan="off", access_log=False)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)], cwd=ROOT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/__peers", timeout=0.5)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def peers(base: str) -> int:
+    return int(requests.get(f"{base}/__peers").text)
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+async def drive_sessions(base: str, sessions: int, turns: int, max_connections: int):
+    first_chunk_ms = []
+
+    async def converse(session):
+        for t in range(turns):
+            t0 = time.perf_counter()
+            first = True
+            async for _ in session.stream(f"第{t}轮"):
+                if first:
+                    first_chunk_ms.append((time.perf_counter() - t0) * 1e3)
+                    first = False
+
+    async with AsyncChatClient(base, max_connections=max_connections) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*[converse(client.session()) for _ in range(sessions)])
+        elapsed = time.perf_counter() - t0
+        assert client.retried == 0, f"{client.retried} retries"
+    return elapsed, first_chunk_ms
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--max-connections", type=int, default=20)
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_server(port)
+    payload = {"message": "你好", "session_id": "bench-legacy"}
+
+    legacy_s, _ = timed(lambda: [requests.post(f"{base}/chat", json=payload).raise_for_status() for _ in range(args.requests)])
+    legacy_conns = peers(base)
+
+    with ChatClient(base) as client:
+        client.session_id = "bench-pooled"
+        pooled_s, _ = timed(lambda: [client.send_message("你好") for _ in range(args.requests)])
+    pooled_conns = peers(base)
+
+    elapsed, first_ms = asyncio.run(drive_sessions(base, args.sessions, args.turns, args.max_connections))
+    async_conns = peers(base)
+    turns = args.sessions * args.turns
+    server.terminate()
+    server.wait()
+
+    rows = [
+        (f"顺序 {args.requests} 次 /chat，requests.post", legacy_s, f"{args.requests / legacy_s:.0f} req/s", legacy_conns),
+        (f"顺序 {args.requests} 次 /chat，ChatClient 连接池", pooled_s, f"{args.requests / pooled_s:.0f} req/s", pooled_conns),
+        (f"{args.sessions} 会话 × {args.turns} 轮流式，AsyncChatClient", elapsed, f"{turns / elapsed:.0f} 轮/s", async_conns),
+    ]
+    print("| 场景 | 总耗时 | 吞吐 | 服务端连接数 |")
+    print("| --- | --- | --- | --- |")
+    for name, seconds, rate, conns in rows:
+        print(f"| {name} | {seconds * 1e3:.0f} ms | {rate} | {conns} |")
+    q = statistics.quantiles(first_ms, n=100)
+    print(f"首片段延迟 p50 {q[49]:.1f} ms / p99 {q[98]:.1f} ms")
+
+
+if __name__ == "__main__":
+    run()
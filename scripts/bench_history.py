@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+会话历史接口序列化基准：通用 jsonable_encoder 路径 vs 逐条缓存字节拼接。
+
+构造一个含 --messages 条消息的会话，统计：
+- 原实现：`jsonable_encoder` + `JSONResponse` 序列化整段历史
+- 缓存拼接：全量、单页（--limit 条）
+- ETag 命中：仅定位分页并计算 ETag（304 路径，无序列化）
+
+示例：
+  python scripts/bench_history.py --messages 1000 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from history_cache import EncodedHistoryCache  # noqa: E402
+from session_manager import SessionManager  # noqa: E402
+
+
+def timeit(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return statistics.median(samples)
+
+
+def run(n: int, limit: int, repeat: int) -> None:
+    sm = SessionManager(max_history_length=n)
+    for i in range(n):
+        sm.add_message("bench", f"第{i}个问题：订单什么时候发货？", f"第{i}个回答：您的订单预计明天发货，请留意物流通知。")
+    history = sm.peek_history("bench")
+    cache = EncodedHistoryCache()
+    cache.render("bench", history, cache.page(history, None, n))  # 预热：逐条编码一次
+
+    def generic():
+        JSONResponse(content=jsonable_encoder({"session_id": "bench", "history": history}))
+
+    def cached_full():
+        cache.render("bench", history, cache.page(history, None, n))
+
+    def cached_page():
+        cache.render("bench", history, cache.page(history, None, limit))
+
+    def etag_only():
+        cache.page(history, None, limit)
+
+    print(f"messages={n}")
+    for name, fn in [
+        ("jsonable_encoder (full)", generic),
+        ("cached join (full)", cached_full),
+        (f"cached join (limit={limit})", cached_page),
+        ("etag / 304", etag_only),
+    ]:
+        print(f"  {name:<26} {timeit(fn, repeat):9.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    for n in args.messages:
+        run(n, args.limit, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+槽位索引会话管理基准：列式 `IndexedSessionManager` vs 字典版 `SessionManager`。
+
+构造 --sessions 个会话（各 1 轮问答），统计：
+- 构造耗时与 Python 堆占用（tracemalloc，单独一轮构造，避免拖慢计时）
+- 列举活跃会话 / 统计活跃数：向量化扫描 vs 遍历 last_activity 字典
+- 清理 --idle-ratio 比例的非活跃会话
+- 导出 / 导入：列式批量 vs 逐会话 `export_session_data` / `import_session_data`
+
+示例：
+  python scripts/bench_indexed_sessions.py --sessions 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indexed_session_manager import IndexedSessionManager  # noqa: E402
+from session_manager import SessionManager  # noqa: E402
+
+USER, BOT = "请问订单的物流到哪里了？", "您的订单已到达转运中心，预计明天送达。"
+
+
+def build_indexed(n: int) -> IndexedSessionManager:
+    sm = IndexedSessionManager(max_history_length=10, session_timeout_minutes=30)
+    for i in range(n):
+        slot = sm.create_session(f"session-{i:08d}")
+        sm.add_user_message(slot, USER)
+        sm.add_ai_message(slot, BOT)
+    return sm
+
+
+def build_dict(n: int) -> SessionManager:
+    sm = SessionManager(max_history_length=10)
+    for i in range(n):
+        sm.add_message(f"session-{i:08d}", USER, BOT)
+    return sm
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - t0) * 1e3, result
+
+
+def median_ms(fn, repeat: int) -> float:
+    return statistics.median(timed(fn)[0] for _ in range(repeat))
+
+
+def heap_mib(build, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    sm = build(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sm
+    gc.collect()
+    return current / 2**20
+
+
+def age(sm_times, keys, seconds: float) -> None:
+    for k in keys:
+        sm_times[k] -= seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--idle-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-memory", action="store_true")
+    args = parser.parse_args()
+    n = args.sessions
+    rng = random.Random(42)
+    idle = rng.sample(range(n), int(n * args.idle_ratio))
+    rows = []
+
+    build_ms_i, indexed = timed(lambda: build_indexed(n))
+    build_ms_d, dicted = timed(lambda: build_dict(n))
+    rows.append(("构造", build_ms_i, build_ms_d))
+
+    # 使部分会话超过 30 分钟未活跃
+    indexed.last_activity[idle] -= 3600
+    idle_ids = [f"session-{i:08d}" for i in idle]
+    age(dicted.last_activity, idle_ids, 3600)
+    cutoff = time.time() - 1800
+
+    rows.append(
+        (
+            "列举活跃会话",
+            median_ms(indexed.list_active_sessions, args.repeat),
+            median_ms(lambda: [s for s, t in dicted.last_activity.items() if t > cutoff], args.repeat),
+        )
+    )
+    rows.append(
+        (
+            "统计活跃数",
+            median_ms(lambda: indexed.get_all_sessions_stats()["active_sessions"], args.repeat),
+            median_ms(lambda: sum(1 for t in dicted.last_activity.values() if t > cutoff), args.repeat),
+        )
+    )
+
+    export_bulk_ms, dump = timed(indexed.export_sessions)
+    export_each_ms, singles = timed(lambda: [indexed.export_session_data(i) for i in indexed.list_all_sessions()])
+    import_bulk_ms, _ = timed(lambda: IndexedSessionManager(max_history_length=10).import_sessions(dump))
+
+    def import_each():
+        target = IndexedSessionManager(max_history_length=10)
+        for d in singles:
+            target.import_session_data(d)
+
+    import_each_ms, _ = timed(import_each)
+    del dump, singles
+    gc.collect()
+
+    cleanup_i, removed_i = timed(indexed.cleanup_inactive_sessions)
+    cleanup_d, removed_d = timed(lambda: dicted.clean_inactive_sessions(timeout_hours=0.5))
+    assert removed_i == removed_d == len(idle)
+    rows.append((f"清理 {len(idle)} 个非活跃会话", cleanup_i, cleanup_d))
+
+    print(f"sessions={n}")
+    print("| 操作 | 列式索引 | 字典版 |")
+    print("| --- | --- | --- |")
+    for name, a, b in rows:
+        print(f"| {name} | {a:.2f} ms | {b:.2f} ms |")
+    print(f"| 导出（批量 / 逐会话） | {export_bulk_ms:.1f} ms | {export_each_ms:.1f} ms |")
+    print(f"| 导入（批量 / 逐会话） | {import_bulk_ms:.1f} ms | {import_each_ms:.1f} ms |")
+
+    del indexed, dicted
+    gc.collect()
+    if not args.skip_memory:
+        print(f"| Python 堆占用 | {heap_mib(build_indexed, n):.0f} MiB | {heap_mib(build_dict, n):.0f} MiB |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+FAQ 知识库基准：索引构建耗时、单次检索耗时、增量重载耗时。
+
+合成 --sizes 条 FAQ（中文问句），分别统计 BM25 与 BM25 + 向量融合两种模式；
+增量重载修改其中 --change-ratio 比例的条目后调用 `sync`。
+
+示例：
+  python scripts/bench_knowledge_base.py --sizes 1000 10000 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import HashingEmbedder  # noqa: E402
+from knowledge_base import FaqEntry, FaqKnowledgeBase  # noqa: E402
+
+SUBJECTS = ["订单", "退款", "发票", "会员", "积分", "优惠券", "收货地址", "密码", "物流", "售后", "账号", "支付"]
+ACTIONS = ["如何修改", "怎么查询", "为什么无法使用", "在哪里设置", "多久可以完成", "需要哪些材料办理", "能否取消"]
+
+
+def make_entries(n: int, rng: random.Random, version: int = 0) -> list:
+    out = []
+    for i in range(n):
+        subject, action = SUBJECTS[i % len(SUBJECTS)], ACTIONS[(i // len(SUBJECTS)) % len(ACTIONS)]
+        question = f"{subject}{action}（编号{i}）"
+        out.append(FaqEntry(str(i), question, f"关于{question}的标准答复 v{version}", (f"{action}{subject}{i}",)))
+    return out
+
+
+def run(n: int, vector: bool, queries: int, change_ratio: float) -> None:
+    rng = random.Random(n)
+    entries = make_entries(n, rng)
+    kb = FaqKnowledgeBase(embedder=HashingEmbedder(dim=512) if vector else None)
+    t0 = time.perf_counter()
+    kb.sync(entries)
+    build_s = time.perf_counter() - t0
+
+    latencies = []
+    for _ in range(queries):
+        i = rng.randrange(n)
+        q = f"{SUBJECTS[i % len(SUBJECTS)]}{rng.choice(ACTIONS)}{i}"
+        t0 = time.perf_counter()
+        kb.search(q, 3)
+        latencies.append((time.perf_counter() - t0) * 1e3)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    changed = list(entries)
+    for i in rng.sample(range(n), max(1, int(n * change_ratio))):
+        e = changed[i]
+        changed[i] = FaqEntry(e.id, e.question, e.answer.replace("v0", "v1"), e.aliases)
+    t0 = time.perf_counter()
+    stats = kb.sync(changed)
+    reload_ms = (time.perf_counter() - t0) * 1e3
+
+    mode = "bm25+vec" if vector else "bm25"
+    print(
+        f"n={n:>6} {mode:<8} build={build_s:>6.2f}s  search p50={statistics.median(latencies):>6.2f}ms "
+        f"p99={p99:>6.2f}ms  incremental({stats['updated']} updated)={reload_ms:>7.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--change-ratio", type=float, default=0.01)
+    args = parser.parse_args()
+    for n in args.sizes:
+        for vector in (False, True):
+            run(n, vector, args.queries, args.change_ratio)
+
+
+if __name__ == "__main__":
+    main()
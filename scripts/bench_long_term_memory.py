@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+长期记忆基准：会话增长到数千轮时的提示词大小与检索耗时。
+
+对比“全部历史带入提示词”与“最近窗口 + 召回 top-k”两种方式的提示词 token 估算，
+并统计单次召回（查询向量化 + 检索）耗时与索引写入耗时。
+
+示例：
+  python scripts/bench_long_term_memory.py --turns 100 1000 5000 --window 10 --top-k 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from long_term_memory import LongTermMemory  # noqa: E402
+from token_quota import estimate_prompt_tokens  # noqa: E402
+
+TOPICS = ["订单", "发货", "退款", "发票", "会员", "积分", "优惠券", "地址", "售后", "账号"]
+
+
+def make_turn(rng: random.Random, i: int) -> dict:
+    topic = rng.choice(TOPICS)
+    return {
+        "user_message": f"第{i}轮：请问{topic}相关的问题，编号 {rng.randint(1000, 9999)} 怎么处理",
+        "bot_message": f"关于{topic}，请在个人中心查看，编号 {i} 已记录，如有疑问请联系客服。",
+    }
+
+
+def run(turns: int, window: int, top_k: int, queries: int) -> None:
+    rng = random.Random(turns)
+    history = [make_turn(rng, i) for i in range(turns)]
+    mem = LongTermMemory(top_k=top_k, min_score=0.0, max_turns=max(turns, 1))
+    t0 = time.perf_counter()
+    for h in history:
+        mem.add_turn("bench", h["user_message"], h["bot_message"])
+    index_us = (time.perf_counter() - t0) / turns * 1e6
+
+    latencies = []
+    recalled_tokens = []
+    for _ in range(queries):
+        q = f"之前说的{rng.choice(TOPICS)}问题，编号 {rng.randint(0, turns - 1)} 处理好了吗"
+        t0 = time.perf_counter()
+        recalled = mem.recall("bench", q, window)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+        recalled_tokens.append(estimate_prompt_tokens(q, history, window, recalled))
+
+    full = estimate_prompt_tokens("之前说的订单问题处理好了吗", history, turns)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"turns={turns:>6}  full_prompt={full:>8} tok  window+top{top_k}={statistics.mean(recalled_tokens):>6.0f} tok  "
+        f"recall p50={statistics.median(latencies):>7.1f}us p99={p99:>7.1f}us  index={index_us:.1f}us/turn"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--window", type=int, default=10, help="最近窗口轮数（prompt_history_turns）")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    for n in args.turns:
+        run(n, args.window, args.top_k, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+限流器基准：旧版“时间戳列表”滑动窗口 vs GCRA（O(1) 状态 + LRU 有界键表）。
+
+示例：
+  python scripts/bench_rate_limiter.py --keys 1000000 --max-keys 100000
+
+输出每种实现的单次 allow 耗时、键表大小与内存（tracemalloc 统计，会放大绝对耗时）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import GCRARateLimiter  # noqa: E402
+
+
+class LegacyRateLimiter:
+    """原 main.RateLimiter 实现（每键一个时间戳列表，键永不删除），仅用于对比。"""
+
+    def __init__(self, max_requests: int, window_s: int):
+        self.max_requests = max_requests
+        self.window_s = window_s
+        self.buckets: dict[str, list[float]] = {}
+
+    def allow(self, key: str) -> bool:
+        now = time.time()
+        window_start = now - self.window_s
+        q = self.buckets.setdefault(key, [])
+        i = 0
+        for ts in q:
+            if ts >= window_start:
+                break
+            i += 1
+        if i:
+            del q[:i]
+        if len(q) >= self.max_requests:
+            return False
+        q.append(now)
+        return True
+
+
+def run(name: str, limiter, keys: list[str], repeat: int) -> None:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for k in keys:
+            limiter.allow(k)
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = len(keys) * repeat
+    table = getattr(limiter, "buckets", None) or getattr(limiter, "tats", {})
+    print(
+        f"{name:<8} ops={n:>9} ns/op={elapsed / n * 1e9:8.0f} keys={len(table):>8} "
+        f"mem={current / 1e6:8.1f}MB peak={peak / 1e6:8.1f}MB"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--keys", type=int, default=1_000_000, help="不同键数量（模拟扫描的 IP 数）")
+    ap.add_argument("--repeat", type=int, default=3, help="每个键请求次数")
+    ap.add_argument("--limit", type=int, default=60, help="窗口内最大请求数")
+    ap.add_argument("--window", type=int, default=60, help="窗口秒数")
+    ap.add_argument("--max-keys", type=int, default=100_000, help="GCRA 键表上限")
+    args = ap.parse_args()
+
+    keys = [f"ip:{i}" for i in range(args.keys)]
+    run("legacy", LegacyRateLimiter(args.limit, args.window), keys, args.repeat)
+    run("gcra", GCRARateLimiter(args.limit, args.window, args.max_keys), keys, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+会话分层存储基准：大规模会话的内存占用与提升（promotion）耗时。
+
+构造 --sessions 个会话（每个 1~2 轮），比较：
+- 全部常驻热层（不分层）
+- 分层：--hot-ratio 热、--warm-ratio 温（内存压缩），其余冷（SQLite 文件）
+
+内存为 tracemalloc 统计的 Python 堆占用（不含 SQLite 文件，文件大小单独列出）；
+提升耗时为对温/冷层会话调用 `get_history` 的耗时。
+
+示例：
+  python scripts/bench_session_tiers.py --sessions 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_manager import SessionManager  # noqa: E402
+
+HOT_IDLE_S, WARM_IDLE_S = 60, 3600
+
+
+def populate(sm: SessionManager, n: int, rng: random.Random) -> None:
+    for i in range(n):
+        sid = f"session-{i:08d}"
+        for t in range(rng.randint(1, 2)):
+            sm.add_message(sid, f"请问订单 {i} 的物流到哪里了？第{t}次询问", f"您的订单 {i} 已到达转运中心，预计明天送达。")
+
+
+def p50_p99(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def build_tiered(n: int, hot_ratio: float, warm_ratio: float, compression: str, db: str):
+    rng = random.Random(42)
+    sm = SessionManager(
+        max_history_length=10,
+        hot_idle_s=HOT_IDLE_S,
+        warm_idle_s=WARM_IDLE_S,
+        cold_store_path=db,
+        compression=compression,
+    )
+    populate(sm, n, rng)
+    # 按插入顺序分配空闲时长：最早的为冷，其次为温，最新的保持热
+    now = time.time()
+    n_hot, n_warm = int(n * hot_ratio), int(n * warm_ratio)
+    n_cold = n - n_hot - n_warm
+    for i, sid in enumerate(list(sm.sessions)):
+        if i < n_cold:
+            sm.last_activity[sid] = now - 2 * WARM_IDLE_S
+        elif i < n_cold + n_warm:
+            sm.last_activity[sid] = now - 2 * HOT_IDLE_S
+    t0 = time.perf_counter()
+    moved = sm.demote_idle(now)
+    return sm, moved, time.perf_counter() - t0, n_cold
+
+
+def run(n: int, hot_ratio: float, warm_ratio: float, compression: str, probes: int) -> None:
+    mib = 1024 * 1024
+    rng = random.Random(7)
+    # 计时与内存分两轮统计，避免 tracemalloc 放大耗时
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "sessions.db")
+        sm, moved, demote_s, n_cold = build_tiered(n, hot_ratio, warm_ratio, compression, db)
+        tiers = sm.tier_stats()
+        warm_lat, cold_lat = [], []
+        for sid in rng.sample(list(sm.warm), min(probes, len(sm.warm))):
+            t0 = time.perf_counter()
+            sm.get_history(sid)
+            warm_lat.append((time.perf_counter() - t0) * 1e6)
+        for i in rng.sample(range(n_cold), min(probes, n_cold)):
+            t0 = time.perf_counter()
+            sm.get_history(f"session-{i:08d}")
+            cold_lat.append((time.perf_counter() - t0) * 1e6)
+        db_size = os.path.getsize(db) + (os.path.getsize(db + "-wal") if os.path.exists(db + "-wal") else 0)
+        del sm
+        gc.collect()
+
+    tracemalloc.start()
+    sm = SessionManager(max_history_length=10)
+    populate(sm, n, random.Random(42))
+    all_hot = tracemalloc.get_traced_memory()[0]
+    del sm
+    gc.collect()
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracemalloc.start()
+        sm, _, _, _ = build_tiered(n, hot_ratio, warm_ratio, compression, os.path.join(tmp, "sessions.db"))
+        gc.collect()
+        tiered = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del sm
+
+    print(f"sessions={n}  compression={compression}")
+    print(f"  all hot            heap={all_hot / mib:8.1f} MiB")
+    print(
+        f"  tiered             heap={tiered / mib:8.1f} MiB  sqlite={db_size / mib:.1f} MiB  "
+        f"(hot={tiers['hot']['sessions']} warm={tiers['warm']['sessions']} "
+        f"warm_bytes={tiers['warm']['bytes'] / mib:.1f} MiB cold={tiers['cold']['sessions']})"
+    )
+    print(f"  demote sweep       {demote_s:.2f}s  moved={moved}")
+    if warm_lat:
+        print("  promote warm->hot  p50=%.1fus p99=%.1fus" % p50_p99(warm_lat))
+    if cold_lat:
+        print("  promote cold->hot  p50=%.1fus p99=%.1fus" % p50_p99(cold_lat))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--hot-ratio", type=float, default=0.01)
+    parser.add_argument("--warm-ratio", type=float, default=0.09)
+    parser.add_argument("--compression", choices=["zlib", "zstd"], default="zlib")
+    parser.add_argument("--probes", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.sessions, args.hot_ratio, args.warm_ratio, args.compression, args.probes)
+
+
+if __name__ == "__main__":
+    main()
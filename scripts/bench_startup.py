@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+冷启动基准：导入耗时与首个请求可服务时间。
+
+每轮在全新子进程中测量（避免模块缓存影响）：
+- 导入：`python -X importtime -c "import main"`，统计总耗时与 `main` 直接依赖中最重的模块
+- 启动：以 uvicorn 启动服务，轮询直至 `/health`（进程可响应）与 `/ready`（链路初始化完成）首次返回 200
+
+结果可追加到 JSONL 文件（`--record`，带 git 版本），用于跨版本跟踪导入开销；
+`--max-import-ms` 超出时以非零状态退出，可作为 CI 门禁。
+
+示例：
+  python scripts/bench_startup.py --runs 5
+  python scripts/bench_startup.py --runs 5 --serve --record cache/startup.jsonl
+  python scripts/bench_startup.py --max-import-ms 800
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("DASHSCOPE_API_KEY", "sk-bench")  # 初始化只校验是否配置，不发起调用
+    return env
+
+
+def measure_import() -> Tuple[float, List[Tuple[str, float]]]:
+    """返回 (总耗时 ms, [(模块, 累计耗时 ms)] 按耗时降序的 main 直接依赖)。"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = 0
+    deps: List[Tuple[str, float]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        us = int(cumulative)
+        if name.strip() == "main":
+            total_us = us
+        elif name.startswith("   ") and not name.startswith("    "):
+            deps.append((name.strip(), us / 1e3))  # 缩进一级：main 直接导入的模块
+    deps.sort(key=lambda d: d[1], reverse=True)
+    return total_us / 1e3, deps
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=0.5) as r:
+            return r.status
+    except Exception:
+        return None
+
+
+def measure_serve(timeout_s: float = 30.0) -> Dict[str, float]:
+    """启动 uvicorn，返回进程启动到 /health、/ready 首次 200 的耗时（ms）。"""
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=_env(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    result: Dict[str, float] = {}
+    try:
+        while len(result) < 2 and time.perf_counter() - t0 < timeout_s:
+            for path in ("health", "ready"):
+                if path not in result and _get(f"http://127.0.0.1:{port}/{path}") == 200:
+                    result[path] = (time.perf_counter() - t0) * 1e3
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=timeout_s)
+    return result
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="列出最重的 main 直接依赖数")
+    parser.add_argument("--serve", action="store_true", help="同时测量首个请求可服务时间")
+    parser.add_argument("--record", help="结果追加到该 JSONL 文件")
+    parser.add_argument("--max-import-ms", type=float, help="导入耗时中位数超出时失败退出")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    import_ms = statistics.median(t for t, _ in imports)
+    per_module: Dict[str, List[float]] = {}
+    for _, deps in imports:
+        for name, ms in deps:
+            per_module.setdefault(name, []).append(ms)
+    modules = sorted(((n, statistics.median(v)) for n, v in per_module.items()), key=lambda d: d[1], reverse=True)
+
+    print(f"import main: median {import_ms:.1f} ms over {args.runs} runs")
+    for name, ms in modules[: args.top]:
+        print(f"  {name:<28} {ms:8.1f} ms")
+
+    record = {
+        "rev": _git_rev(),
+        "python": sys.version.split()[0],
+        "ts": int(time.time()),
+        "import_ms": round(import_ms, 1),
+        "modules_ms": {n: round(ms, 1) for n, ms in modules[: args.top]},
+    }
+    if args.serve:
+        serves = [measure_serve() for _ in range(args.runs)]
+        for path in ("health", "ready"):
+            ms = statistics.median(s[path] for s in serves)
+            record[f"first_{path}_ms"] = round(ms, 1)
+            print(f"first 200 on /{path}: median {ms:.1f} ms")
+
+    if args.record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.record)), exist_ok=True)
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"import budget exceeded: {import_ms:.1f} ms > {args.max_import_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 """
-生成 GET /chat/stream 的短期签名 URL（适配 EventSource）。
+生成 GET /chat/stream 的 EventSource URL。
+
+默认（推荐）：调用 POST /chat/stream/tickets 换取一次性短票据，输出 `/chat/stream?ticket=...`，
+URL 长度与消息长度无关。
 
 示例：
   python scripts/gen_signed_url.py \
+    --key YOUR_KEY \
+    --session-id s1 --message 你好 \
+    --base https://localhost:8000
+
+离线签名模式（--signed）：本地计算签名 URL，消息完整出现在 query 中（长消息可能超出网关 URL 限制）。
+  python scripts/gen_signed_url.py --signed \
     --key YOUR_KEY --kid default \
     --session-id s1 --message 你好 \
     --base https://localhost:8000 --ttl 300
 
 注意：
   - 计算签名规则与服务端一致：HMAC-SHA256-HEX(method, path, session_id, message, exp, nonce)。
-  - 输出包含 query: session_id, message, exp, nonce, sig[, kid]。
+  - 输出包含 query: session_id, message, exp, nonce, sig[, kid]；nonce 仅可使用一次。
 """
 
 from __future__ import annotations
@@ -18,9 +27,12 @@ from __future__ import annotations
 import argparse
 import hashlib
 import hmac
+import json
 import secrets
+import ssl
 import time
-from urllib.parse import urlencode, quote
+import urllib.request
+from urllib.parse import urlencode
 
 
 def gen_signed_url(base: str, key: str, session_id: str, message: str, ttl: int, kid: str | None) -> str:
@@ -35,17 +47,36 @@ def gen_signed_url(base: str, key: str, session_id: str, message: str, ttl: int,
     return base.rstrip("/") + path + "?" + urlencode(qs, safe="")
 
 
+def create_ticket_url(base: str, key: str, session_id: str, message: str, insecure: bool = False) -> str:
+    """调用 POST /chat/stream/tickets，返回带票据的完整流式 URL。"""
+    req = urllib.request.Request(
+        base.rstrip("/") + "/chat/stream/tickets",
+        data=json.dumps({"message": message, "session_id": session_id}).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-API-Key": key},
+        method="POST",
+    )
+    ctx = ssl._create_unverified_context() if insecure else None
+    with urllib.request.urlopen(req, context=ctx) as resp:
+        data = json.loads(resp.read().decode("utf-8"))
+    return base.rstrip("/") + data["stream_url"]
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--base", default="http://localhost:8000", help="服务基地址")
-    ap.add_argument("--key", required=True, help="签名密钥（与服务端一致）")
-    ap.add_argument("--kid", default=None, help="可选：密钥 ID（当服务端配置多密钥时建议提供）")
+    ap.add_argument("--key", required=True, help="API Key / 签名密钥（与服务端一致）")
+    ap.add_argument("--kid", default=None, help="可选：密钥 ID（签名模式下，当服务端配置多密钥时建议提供）")
     ap.add_argument("--session-id", required=True)
     ap.add_argument("--message", required=True)
-    ap.add_argument("--ttl", type=int, default=300, help="有效期（秒）")
+    ap.add_argument("--signed", action="store_true", help="离线生成签名 URL（不调用服务端）")
+    ap.add_argument("--ttl", type=int, default=300, help="签名模式有效期（秒）")
+    ap.add_argument("--insecure", action="store_true", help="票据模式下跳过证书校验（自签证书）")
     args = ap.parse_args()
 
-    url = gen_signed_url(args.base, args.key, args.session_id, args.message, args.ttl, args.kid)
+    if args.signed:
+        url = gen_signed_url(args.base, args.key, args.session_id, args.message, args.ttl, args.kid)
+    else:
+        url = create_ticket_url(args.base, args.key, args.session_id, args.message, args.insecure)
     print(url)
 
 
@@ -0,0 +1,236 @@
+"""语义响应缓存：近似重复问题（首轮/少历史）直接复用已有回复，跳过 LLM。
+
+- 向量由 `embeddings.HashingEmbedder` 离线生成，存放在一块连续的 float32 矩阵
+  （capacity x dim）中；查询只做一次矩阵-向量乘，得分最高且超过阈值即命中。
+- 容量固定：槽位满时淘汰最久未命中的条目（向量化 argmin），过期条目（TTL）视为空槽。
+- 可选持久化：`flush()` 时把向量矩阵（`<path>.f32`）与元数据（`<path>.json`，含向量文件的 CRC32）
+  在同一检查点各自写临时文件再原子替换；运行期间的写入只改内存，崩溃时文件仍是上一检查点的一致快照。
+  启动时以写时复制方式映射向量文件，CRC 与元数据不符（如两次替换之间崩溃）时丢弃整个快照。
+- 一个持久化路径只能由一个进程使用：打开时对 `<path>.lock` 加排他锁，已被其他进程（如同机的其他 worker）
+  持有时告警并退化为不持久化的内存缓存。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台不加锁
+    fcntl = None
+
+from embeddings import HashingEmbedder, normalize_text
+
+logger = logging.getLogger("app.semantic_cache")
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embedder: Optional[HashingEmbedder] = None,
+        capacity: int = 10_000,
+        threshold: float = 0.92,
+        ttl_s: float = 86_400,
+        path: Optional[str] = None,
+    ):
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.path = path
+        self.keys: List[Optional[str]] = [None] * capacity  # 归一化后的问题
+        self.replies: List[Optional[str]] = [None] * capacity
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.slot_of: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self.vectors = self._open_vectors()
+
+    # ---------- 持久化 ----------
+    def _acquire_path(self) -> bool:
+        """对 `<path>.lock` 加排他锁，防止多个进程写同一份快照。"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)) or ".", exist_ok=True)
+        if fcntl is None:
+            return True
+        f = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _open_vectors(self) -> np.ndarray:
+        empty = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        if not self.path:
+            return empty
+        if not self._acquire_path():
+            logger.warning("semantic cache path %s is used by another process, persistence disabled", self.path)
+            self.path = None
+            return empty
+        vec_path, meta_path = self.path + ".f32", self.path + ".json"
+        meta = None
+        if os.path.exists(vec_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("load semantic cache meta failed: %s", e)
+        if not meta or meta.get("dim") != self.dim or meta.get("capacity") != self.capacity:
+            return empty
+        if os.path.getsize(vec_path) != empty.nbytes:
+            return empty
+        # 写时复制映射：运行期写入不回写文件，文件只在 flush 时整体替换
+        vectors = np.memmap(vec_path, dtype=np.float32, mode="c", shape=(self.capacity, self.dim))
+        if zlib.crc32(vectors) != meta.get("vectors_crc32"):
+            logger.warning("semantic cache snapshot %s is inconsistent, starting empty", self.path)
+            return empty
+        for e in meta.get("entries", []):
+            slot = e["slot"]
+            self.keys[slot], self.replies[slot] = e["key"], e["reply"]
+            self.created[slot], self.last_used[slot] = e["created"], e["last_used"]
+            self.valid[slot] = True
+            self.slot_of[e["key"]] = slot
+        return vectors
+
+    def flush(self) -> None:
+        """检查点：向量与元数据在锁内取同一时刻的快照，各自写临时文件后原子替换（先向量后元数据）。"""
+        if not self.path:
+            return
+        with self._lock:
+            vectors = np.array(self.vectors, dtype=np.float32)
+            entries = self._entries()
+        vec_tmp, meta_tmp = self.path + ".f32.tmp", self.path + ".json.tmp"
+        vectors.tofile(vec_tmp)
+        meta = {
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "vectors_crc32": zlib.crc32(vectors),
+            "entries": entries,
+        }
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(vec_tmp, self.path + ".f32")
+        os.replace(meta_tmp, self.path + ".json")
+
+    def close(self) -> None:
+        """落盘并释放持久化路径的进程锁。"""
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _entries(self) -> List[Dict]:
+        return [
+            {
+                "slot": int(slot),
+                "key": self.keys[slot],
+                "reply": self.replies[slot],
+                "created": float(self.created[slot]),
+                "last_used": float(self.last_used[slot]),
+            }
+            for slot in np.flatnonzero(self.valid)
+        ]
+
+    # ---------- 查询与写入 ----------
+    def _expire(self, now: float) -> None:
+        if self.ttl_s <= 0:
+            return
+        stale = self.valid & (self.created < now - self.ttl_s)
+        if stale.any():
+            for slot in np.flatnonzero(stale):
+                self._clear(int(slot))
+
+    def _clear(self, slot: int) -> None:
+        key = self.keys[slot]
+        if key is not None:
+            self.slot_of.pop(key, None)
+        self.keys[slot] = None
+        self.replies[slot] = None
+        self.valid[slot] = False
+
+    def lookup(self, message: str, now: Optional[float] = None) -> Optional[str]:
+        """返回命中的缓存回复；未命中返回 None。"""
+        now = time.time() if now is None else now
+        normalized = normalize_text(message)
+        if not normalized:
+            return None
+        with self._lock:
+            slot = self.slot_of.get(normalized)
+            if slot is None and self.valid.any():
+                q = self.embedder.embed_normalized(normalized)
+                scores = self.vectors @ q
+                scores[~self.valid] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = best
+            if slot is None or (self.ttl_s > 0 and self.created[slot] < now - self.ttl_s):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.last_used[slot] = now
+            return self.replies[slot]
+
+    def store(self, message: str, reply: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        normalized = normalize_text(message)
+        if not normalized or not reply:
+            return
+        vec = self.embedder.embed_normalized(normalized)
+        with self._lock:
+            slot = self.slot_of.get(normalized)
+            if slot is None:
+                self._expire(now)
+                free = np.flatnonzero(~self.valid)
+                if free.size:
+                    slot = int(free[0])
+                else:
+                    # 淘汰最久未使用的条目
+                    slot = int(np.argmin(self.last_used))
+                    self._clear(slot)
+                self.vectors[slot] = vec
+                self.keys[slot] = normalized
+                self.slot_of[normalized] = slot
+                self.valid[slot] = True
+            self.replies[slot] = reply
+            self.created[slot] = now
+            self.last_used[slot] = now
+
+    def __len__(self) -> int:
+        return int(self.valid.sum())
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def build_semantic_cache(s) -> Optional[SemanticCache]:
+    if not s.semantic_cache_enabled:
+        return None
+    return SemanticCache(
+        HashingEmbedder(dim=s.semantic_cache_dim),
+        capacity=s.semantic_cache_max_entries,
+        threshold=s.semantic_cache_threshold,
+        ttl_s=s.semantic_cache_ttl_s,
+        path=s.semantic_cache_path,
+    )
@@ -1,53 +1,301 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-from collections import defaultdict
+from collections import OrderedDict
 
+import json
+import sqlite3
+import threading
 import time
+import zlib
+
+
+# 消息记录的固定字段作为 zlib 预置字典，短会话也能获得可观压缩率
+_ZDICT = b'[{"seq":,"user_message":"","bot_message":"","timestamp":"20","unix_timestamp":17'
+_RAW, _PACKED = b"\x00", b"\x01"
+
+
+def _make_codec(name: str, min_bytes: int = 256):
+    """返回 (压缩, 解压) 函数对；不足 `min_bytes` 的数据原样保存（压缩收益小于调用开销）。
+
+    zstd 为可选依赖 `zstandard`。
+    """
+    if name == "zstd":
+        import zstandard  # 可选依赖，仅 session_compression=zstd 需要
+
+        pack, unpack = zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    else:
+
+        def pack(data: bytes) -> bytes:
+            c = zlib.compressobj(6, zdict=_ZDICT)
+            return c.compress(data) + c.flush()
+
+        def unpack(data: bytes) -> bytes:
+            d = zlib.decompressobj(zdict=_ZDICT)
+            return d.decompress(data) + d.flush()
+
+    def compress(data: bytes) -> bytes:
+        return _PACKED + pack(data) if len(data) >= min_bytes else _RAW + data
+
+    def decompress(blob: bytes) -> bytes:
+        return unpack(blob[1:]) if blob[:1] == _PACKED else blob[1:]
+
+    return compress, decompress
+
+
+class SqliteSessionStore:
+    """冷层：长期空闲会话落到本地 SQLite（压缩后的 JSON，滚动摘要单独一列）。"""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data BLOB NOT NULL, messages INTEGER NOT NULL, last_activity REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_activity ON sessions(last_activity)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:  # 旧库补列
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+        self._lock = threading.Lock()
+
+    def put_many(self, rows: List[Tuple[str, bytes, int, float, Optional[str]]]) -> None:
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sessions (id, data, messages, last_activity, summary) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.execute("COMMIT")
+
+    def pop(self, session_id: str) -> Optional[Tuple[bytes, float, Optional[str]]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data, last_activity, summary FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return row
+
+    def get(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def delete_older_than(self, cutoff: float) -> int:
+        with self._lock:
+            return self.conn.execute("DELETE FROM sessions WHERE last_activity < ?", (cutoff,)).rowcount
+
+    def stats(self) -> Tuple[int, int]:
+        """返回 (会话数, 消息总数)。"""
+        with self._lock:
+            count, messages = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM sessions").fetchone()
+        return count, messages
 
 
 class SessionManager:
-    def __init__(self, max_history_length: int = 10):
-        self.sessions: Dict[str, List[Dict]] = defaultdict(list)
+    """会话历史管理，可选分层存储：
+
+    - 热层 `sessions`：活跃会话的消息列表（按最近访问排序）
+    - 温层 `warm`：空闲超过 `hot_idle_s` 的会话，序列化并压缩后留在内存
+    - 冷层 `cold`：空闲超过 `warm_idle_s` 的会话，写入本地 SQLite（需配置 `cold_store_path`）
+
+    `get_history` / `add_message` 访问温/冷层会话时透明提升回热层。`hot_idle_s=0` 时不分层。
+
+    滚动摘要（`set_summary`）随会话保存：热/温层在内存，下沉到冷层时写入同一行，提升时一并恢复。
+    摘要为 `{"text", "upto_seq", "turns"}`，覆盖序号不超过 `upto_seq` 的轮次。
+    """
+
+    def __init__(
+        self,
+        max_history_length: int = 10,
+        hot_idle_s: float = 0,
+        warm_idle_s: float = 0,
+        cold_store_path: Optional[str] = None,
+        compression: str = "zlib",
+    ):
+        self.sessions: "OrderedDict[str, List[Dict]]" = OrderedDict()
         self.max_history_length = max_history_length
         self.last_activity: Dict[str, float] = {}
+        self.hot_idle_s = hot_idle_s
+        self.warm_idle_s = warm_idle_s
+        self.warm: "OrderedDict[str, Tuple[bytes, int]]" = OrderedDict()  # 会话 -> (压缩数据, 消息数)
+        self.warm_bytes = 0
+        self.cold = SqliteSessionStore(cold_store_path) if cold_store_path else None
+        self._compress, self._decompress = _make_codec(compression)
+        self.promotions = {"warm": 0, "cold": 0}
+        self.summaries: Dict[str, Dict] = {}  # 热/温层会话的滚动摘要
+
+    @property
+    def tiered(self) -> bool:
+        return self.hot_idle_s > 0
+
+    def _encode(self, messages: List[Dict]) -> bytes:
+        return self._compress(json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def _decode(self, blob: bytes) -> List[Dict]:
+        return json.loads(self._decompress(blob))
+
+    def _load(self, session_id: str, create: bool = False) -> Optional[List[Dict]]:
+        """取热层消息列表；会话在温/冷层时提升回热层。"""
+        messages = self.sessions.get(session_id)
+        if messages is not None:
+            self.sessions.move_to_end(session_id)
+            return messages
+        warm = self.warm.pop(session_id, None)
+        if warm is not None:
+            self.warm_bytes -= len(warm[0])
+            messages = self._decode(warm[0])
+            self.promotions["warm"] += 1
+        elif self.cold is not None:
+            row = self.cold.pop(session_id)
+            if row is not None:
+                messages = self._decode(row[0])
+                if row[2]:
+                    self.summaries[session_id] = json.loads(row[2])
+                self.promotions["cold"] += 1
+        if messages is None:
+            if not create:
+                return None
+            messages = []
+        self.sessions[session_id] = messages
+        return messages
 
     def get_history(self, session_id: str) -> List[Dict]:
         """获取会话历史"""
         self._update_activity(session_id)
-        return self.sessions.get(session_id, [])
+        messages = self._load(session_id)
+        return messages if messages is not None else []
+
+    def peek_history(self, session_id: str) -> List[Dict]:
+        """只读获取会话历史：不刷新活跃时间，也不把温/冷层会话提升回热层。"""
+        messages = self.sessions.get(session_id)
+        if messages is not None:
+            return messages
+        warm = self.warm.get(session_id)
+        if warm is not None:
+            return self._decode(warm[0])
+        if self.cold is not None:
+            blob = self.cold.get(session_id)
+            if blob is not None:
+                return self._decode(blob)
+        return []
 
     def add_message(self, session_id: str, user_message: str, bot_message: str):
         """添加消息"""
         self._update_activity(session_id)
+        messages = self._load(session_id, create=True)
         message_record = {
+            # 会话内单调递增的消息序号，截断后仍保持连续，用作分页游标
+            "seq": messages[-1].get("seq", len(messages) - 1) + 1 if messages else 0,
             "user_message": user_message,
             "bot_message": bot_message,
             "timestamp": datetime.now().isoformat(),
             "unix_timestamp": time.time(),
         }
-        self.sessions[session_id].append(message_record)
+        messages.append(message_record)
 
         # 如果会话历史长度超过最大历史长度，则删除最早的消息
-        if len(self.sessions[session_id]) > self.max_history_length:
-            self.sessions[session_id] = self.sessions[session_id][
-                -self.max_history_length :
-            ]
+        if len(messages) > self.max_history_length:
+            del messages[: len(messages) - self.max_history_length]
+
+    def get_summary(self, session_id: str) -> Optional[Dict]:
+        """热/温层会话的滚动摘要（冷层会话需先经 `get_history` 提升）。"""
+        return self.summaries.get(session_id)
+
+    def set_summary(self, session_id: str, summary: Dict) -> bool:
+        """保存滚动摘要；会话已删除或已下沉到冷层时返回 False。"""
+        if session_id not in self.sessions and session_id not in self.warm:
+            return False
+        self.summaries[session_id] = summary
+        return True
+
+    def demote_idle(self, now: Optional[float] = None, limit: int = 0) -> Dict[str, int]:
+        """把空闲会话下沉：热 -> 温（压缩），温 -> 冷（SQLite）。
+
+        按访问顺序从最旧处扫描，代价与下沉数量成正比；`limit` 限制每层单次下沉数量（0 不限）。
+        """
+        if not self.tiered:
+            return {"warm": 0, "cold": 0}
+        now = time.time() if now is None else now
+        to_warm = to_cold = 0
+        hot_cutoff = now - self.hot_idle_s
+        while self.sessions and not (limit and to_warm >= limit):
+            session_id = next(iter(self.sessions))
+            if self.last_activity.get(session_id, 0) >= hot_cutoff:
+                break
+            messages = self.sessions.pop(session_id)
+            blob = self._encode(messages)
+            self.warm[session_id] = (blob, len(messages))
+            self.warm_bytes += len(blob)
+            to_warm += 1
+        if self.cold is not None and self.warm_idle_s > 0:
+            warm_cutoff = now - self.warm_idle_s
+            rows = []
+            while self.warm and not (limit and len(rows) >= limit):
+                session_id = next(iter(self.warm))
+                ts = self.last_activity.get(session_id, 0)
+                if ts >= warm_cutoff:
+                    break
+                blob, count = self.warm.pop(session_id)
+                self.warm_bytes -= len(blob)
+                self.last_activity.pop(session_id, None)
+                summary = self.summaries.pop(session_id, None)
+                rows.append((session_id, blob, count, ts, json.dumps(summary, ensure_ascii=False) if summary else None))
+            if rows:
+                self.cold.put_many(rows)
+                to_cold = len(rows)
+        # 字典删除后不会收缩哈希表：大批量下沉后按剩余规模重建，释放空槽
+        if to_warm > len(self.sessions):
+            self.sessions = OrderedDict(self.sessions)
+        if to_cold > len(self.warm):
+            self.warm = OrderedDict(self.warm)
+            self.last_activity = dict(self.last_activity)
+            self.summaries = dict(self.summaries)
+        return {"warm": to_warm, "cold": to_cold}
 
     def clear_session(self, session_id: str):
         """清空会话"""
         if session_id in self.sessions:
             del self.sessions[session_id]
+        warm = self.warm.pop(session_id, None)
+        if warm is not None:
+            self.warm_bytes -= len(warm[0])
+        if self.cold is not None:
+            self.cold.delete(session_id)
         if session_id in self.last_activity:
             del self.last_activity[session_id]
+        self.summaries.pop(session_id, None)
+
+    def tier_stats(self) -> Dict:
+        """各层会话数与大小"""
+        cold_sessions, cold_messages = self.cold.stats() if self.cold is not None else (0, 0)
+        return {
+            "hot": {"sessions": len(self.sessions), "messages": sum(len(m) for m in self.sessions.values())},
+            "warm": {
+                "sessions": len(self.warm),
+                "messages": sum(c for _, c in self.warm.values()),
+                "bytes": self.warm_bytes,
+            },
+            "cold": {"sessions": cold_sessions, "messages": cold_messages},
+            "promotions": dict(self.promotions),
+            "summaries": len(self.summaries),
+        }
 
     def get_session_stats(self) -> Dict:
         """获取会话统计信息"""
+        tiers = self.tier_stats()
         return {
-            "total_sessions": len(self.sessions),
+            "total_sessions": sum(t["sessions"] for t in (tiers["hot"], tiers["warm"], tiers["cold"])),
             "active_sessions": len(
                 [s for s, t in self.last_activity.items() if t > time.time() - 3600]
             ),
-            "total_messages": sum(len(messages) for messages in self.sessions.values()),
+            "total_messages": sum(t["messages"] for t in (tiers["hot"], tiers["warm"], tiers["cold"])),
+            "tiers": tiers,
         }
 
     def _update_activity(self, session_id: str):
@@ -56,12 +304,16 @@ class SessionManager:
 
     def clean_inactive_sessions(self, timeout_hours: int = 24):
         """清理非活跃会话"""
+        cutoff = time.time() - timeout_hours * 3600
         inactive_session = [
             session_id
             for session_id, last_activity in self.last_activity.items()
-            if last_activity < time.time() - timeout_hours * 3600
+            if last_activity < cutoff
         ]
 
         for session_id in inactive_session:
             self.clear_session(session_id)
-        return len(inactive_session)
+        cleaned = len(inactive_session)
+        if self.cold is not None:
+            cleaned += self.cold.delete_older_than(cutoff)
+        return cleaned
@@ -0,0 +1,112 @@
+"""EventSource 流式票据：消息存放在服务端，URL 只携带短票据 id。
+
+`POST /chat/stream/tickets` 用 API Key 换取票据，`GET /chat/stream?ticket=...` 凭票据
+拉流。票据为 128 位随机值，短 TTL、一次性（兑换即删除），URL 长度与消息长度无关，
+服务端也无需对整段消息重复计算 HMAC。
+
+- `TicketStore`：进程内存储，按创建顺序（即过期顺序）摊还 O(1) 清理，数量有上限。
+- `RedisTicketStore`：多副本共享（`GETDEL` 原子兑换），可选依赖 `redis`。
+"""
+
+from __future__ import annotations
+
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+
+@dataclass
+class StreamTicket:
+    message: str
+    session_id: str
+    usage_key: str  # 创建者的用量归属，兑换后沿用
+    expires_at: float
+
+
+class TicketStore:
+    def __init__(self, ttl_s: float = 60.0, max_tickets: int = 100_000):
+        self.ttl_s = ttl_s
+        self.max_tickets = max_tickets
+        self.tickets: "OrderedDict[str, StreamTicket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        tickets = self.tickets
+        while tickets:
+            ticket_id, ticket = next(iter(tickets.items()))
+            if ticket.expires_at > now and len(tickets) <= self.max_tickets:
+                break
+            del tickets[ticket_id]
+
+    def issue(self, message: str, session_id: str, usage_key: str, now: Optional[float] = None) -> Tuple[str, StreamTicket]:
+        now = time.time() if now is None else now
+        ticket_id = secrets.token_urlsafe(16)
+        ticket = StreamTicket(message, session_id, usage_key, now + self.ttl_s)
+        with self._lock:
+            self.tickets[ticket_id] = ticket
+            # 超出上限时淘汰最早（最接近过期）的票据
+            self._expire(now)
+        return ticket_id, ticket
+
+    def peek(self, ticket_id: Optional[str], now: Optional[float] = None) -> bool:
+        """票据是否存在且未过期（不消耗）。"""
+        if not ticket_id:
+            return False
+        now = time.time() if now is None else now
+        ticket = self.tickets.get(ticket_id)
+        return ticket is not None and ticket.expires_at > now
+
+    def redeem(self, ticket_id: Optional[str], now: Optional[float] = None) -> Optional[StreamTicket]:
+        """兑换票据（一次性）；不存在或已过期返回 None。"""
+        if not ticket_id:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            ticket = self.tickets.pop(ticket_id, None)
+            self._expire(now)
+        if ticket is None or ticket.expires_at <= now:
+            return None
+        return ticket
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+
+class RedisTicketStore:
+    """多副本共享票据存储：`SET EX` 写入，`GETDEL` 原子兑换。"""
+
+    def __init__(self, url: str, ttl_s: float = 60.0, prefix: str = "ticket"):
+        import redis  # 可选依赖，仅共享后端需要
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+
+    def issue(self, message: str, session_id: str, usage_key: str, now: Optional[float] = None) -> Tuple[str, StreamTicket]:
+        now = time.time() if now is None else now
+        ticket_id = secrets.token_urlsafe(16)
+        ticket = StreamTicket(message, session_id, usage_key, now + self.ttl_s)
+        payload = json.dumps(asdict(ticket), ensure_ascii=False)
+        self.client.set(f"{self.prefix}:{ticket_id}", payload, ex=int(self.ttl_s))
+        return ticket_id, ticket
+
+    def peek(self, ticket_id: Optional[str], now: Optional[float] = None) -> bool:
+        return bool(ticket_id) and bool(self.client.exists(f"{self.prefix}:{ticket_id}"))
+
+    def redeem(self, ticket_id: Optional[str], now: Optional[float] = None) -> Optional[StreamTicket]:
+        if not ticket_id:
+            return None
+        raw = self.client.getdel(f"{self.prefix}:{ticket_id}")
+        if raw is None:
+            return None
+        return StreamTicket(**json.loads(raw))
+
+
+def build_ticket_store(s):
+    if s.stream_ticket_store_url:
+        return RedisTicketStore(s.stream_ticket_store_url, ttl_s=s.stream_ticket_ttl_s)
+    return TicketStore(ttl_s=s.stream_ticket_ttl_s, max_tickets=s.stream_ticket_max)
@@ -2,6 +2,7 @@ import asyncio
 import json
 import pytest
 import httpx
+import pytest_asyncio
 import time
 import hmac
 import hashlib
@@ -14,20 +15,20 @@ class FakeChain:
     async def initialize(self):
         return None
 
-    async def process_message(self, message: str, history):
+    async def process_message(self, message: str, history, recalled=None, knowledge=None):
         return f"回声: {message}"
 
-    async def stream_message(self, message: str, history):
+    async def stream_message(self, message: str, history, recalled=None, knowledge=None):
         # 模拟分片输出
         for chunk in ["片段1", "片段2", "片段3"]:
             await asyncio.sleep(0)
             yield chunk
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def async_client():
-    # 关闭 lifespan，避免真实初始化外部 LLM
-    transport = httpx.ASGITransport(app=main.app, lifespan="off")
+    # ASGITransport 不触发 lifespan，避免真实初始化外部 LLM
+    transport = httpx.ASGITransport(app=main.app)
     async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
         # 注入假实现与独立会话管理器
         main.chat_chain = FakeChain()
@@ -76,11 +77,11 @@ async def test_chat_stream_sse(async_client: httpx.AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_chat_stream_get_signed_url(async_client: httpx.AsyncClient):
-    # 启用鉴权并设置唯一密钥，允许使用签名 URL 访问 GET /chat/stream
-    main.settings.require_api_key = True
-    main.settings.signed_url_enabled = True
-    main.settings.internal_api_key = "test-secret"
+async def test_chat_stream_get_signed_url(async_client: httpx.AsyncClient, monkeypatch):
+    # 启用鉴权并设置唯一密钥，允许使用签名 URL 访问 GET /chat/stream（用例结束后还原）
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "signed_url_enabled", True)
+    monkeypatch.setattr(main.settings, "internal_api_key", "test-secret")
 
     session_id = "s3"
     message = "签名校验"
@@ -98,3 +99,275 @@ async def test_chat_stream_get_signed_url(async_client: httpx.AsyncClient):
             if line.startswith("event: end"):
                 break
         assert any(l.startswith("data: ") for l in lines)
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_get_signed_url_replay_rejected(async_client: httpx.AsyncClient, monkeypatch):
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "signed_url_enabled", True)
+    monkeypatch.setattr(main.settings, "internal_api_key", "test-secret")
+
+    session_id = "s4"
+    message = "重放"
+    exp = int(time.time()) + 60
+    nonce = "n-replay"
+    to_sign = "\n".join(["GET", "/chat/stream", session_id, message, str(exp), nonce])
+    sig = hmac.new(b"test-secret", to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    url = f"/chat/stream?session_id={session_id}&message={message}&exp={exp}&nonce={nonce}&sig={sig}"
+
+    r = await async_client.get(url)
+    assert r.status_code == 200
+    r = await async_client.get(url)
+    assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_signed_url_replay_with_appended_kid_rejected(async_client: httpx.AsyncClient, monkeypatch):
+    # 唯一密钥带 kid：不带 kid 与追加 kid 解析到同一密钥，kid 不在签名串内，不能借此绕过防重放
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "signed_url_enabled", True)
+    monkeypatch.setattr(main.settings, "internal_api_key", None)
+    monkeypatch.setattr(main.settings, "api_keys", {"a": "test-secret"})
+
+    exp = int(time.time()) + 60
+    to_sign = "\n".join(["GET", "/chat/stream", "s4k", "重放", str(exp), "n-replay-kid"])
+    sig = hmac.new(b"test-secret", to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    url = f"/chat/stream?session_id=s4k&message=重放&exp={exp}&nonce=n-replay-kid&sig={sig}"
+
+    r = await async_client.get(url)
+    assert r.status_code == 200
+    for replay in (url, url + "&kid=a"):
+        r = await async_client.get(replay)
+        assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_ticket(async_client: httpx.AsyncClient, monkeypatch):
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "internal_api_key", "test-secret")
+
+    payload = {"message": "长消息" * 2000, "session_id": "s5"}
+    r = await async_client.post("/chat/stream/tickets", json=payload)
+    assert r.status_code == 401
+    r = await async_client.post("/chat/stream/tickets", json=payload, headers={"X-API-Key": "test-secret"})
+    assert r.status_code == 200
+    stream_url = r.json()["stream_url"]
+    assert len(stream_url) < 64
+
+    async with async_client.stream("GET", stream_url) as r:
+        assert r.status_code == 200
+        lines = [line async for line in r.aiter_lines()]
+    assert "event: end" in lines
+    assert main.session_manager.get_history("s5")[0]["user_message"] == payload["message"]
+
+    # 票据一次性
+    r = await async_client.get(stream_url)
+    assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_ticket_only_valid_on_stream_route(async_client: httpx.AsyncClient, monkeypatch):
+    from rate_limit import CompositeRateLimiter, GCRARateLimiter
+
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "internal_api_key", "test-secret")
+    headers = {"X-API-Key": "test-secret"}
+    r = await async_client.post("/chat/stream/tickets", json={"message": "票据", "session_id": "s6"}, headers=headers)
+    ticket = r.json()["ticket"]
+    # 未兑换的票据不能作为其他 GET 接口的凭据
+    for url in ("/chat/jobs/some-job", "/chat/jobs/some-job/stream"):
+        r = await async_client.get(url, params={"ticket": ticket})
+        assert r.status_code == 401
+
+    # 换票同样受速率限制
+    monkeypatch.setattr(main.settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(main, "rate_limiter", CompositeRateLimiter([("primary", GCRARateLimiter(1, 60))]))
+    payload = {"message": "票据", "session_id": "s6"}
+    assert (await async_client.post("/chat/stream/tickets", json=payload, headers=headers)).status_code == 200
+    assert (await async_client.post("/chat/stream/tickets", json=payload, headers=headers)).status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_chat_semantic_cache_skips_llm(async_client: httpx.AsyncClient, monkeypatch):
+    from semantic_cache import SemanticCache
+
+    calls = []
+
+    class CountingChain(FakeChain):
+        async def process_message(self, message: str, history, recalled=None, knowledge=None):
+            calls.append(message)
+            return f"回声: {message}"
+
+    main.chat_chain = CountingChain()
+    monkeypatch.setattr(main, "semantic_cache", SemanticCache(capacity=16))
+    r1 = await async_client.post("/chat", json={"message": "你能做什么", "session_id": "sc1"})
+    r2 = await async_client.post("/chat", json={"message": "你可以做什么？", "session_id": "sc2"})
+    assert r2.json()["reply"] == r1.json()["reply"] == "回声: 你能做什么"
+    assert calls == ["你能做什么"]
+    # 命中后仍写入会话历史；有历史的会话不走缓存
+    assert len(main.session_manager.get_history("sc2")) == 1
+    await async_client.post("/chat", json={"message": "你能做什么", "session_id": "sc2"})
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_long_term_memory_recall(async_client: httpx.AsyncClient, monkeypatch):
+    from long_term_memory import LongTermMemory
+
+    seen = []
+
+    class RecordingChain(FakeChain):
+        async def process_message(self, message: str, history, recalled=None, knowledge=None):
+            seen.append(recalled)
+            return f"回声: {message}"
+
+    main.chat_chain = RecordingChain()
+    monkeypatch.setattr(main, "long_term_memory", LongTermMemory(top_k=1, min_score=0.2))
+    monkeypatch.setattr(main.settings, "prompt_history_turns", 2)
+    for msg in ["我的订单号是 A123", "今天天气不错", "推荐一首歌", "讲个笑话"]:
+        await async_client.post("/chat", json={"message": msg, "session_id": "m1"})
+    await async_client.post("/chat", json={"message": "订单 A123 到哪了", "session_id": "m1"})
+    assert seen[-1] and seen[-1][0]["user_message"] == "我的订单号是 A123"
+
+
+@pytest.mark.asyncio
+async def test_chat_knowledge_base_fast_path(async_client: httpx.AsyncClient, monkeypatch):
+    from knowledge_base import FaqEntry, FaqKnowledgeBase
+
+    seen = []
+
+    class RecordingChain(FakeChain):
+        async def process_message(self, message: str, history, recalled=None, knowledge=None):
+            seen.append(knowledge)
+            return f"回声: {message}"
+
+    kb = FaqKnowledgeBase()
+    kb.sync([FaqEntry("refund", "如何申请退款", "在订单页申请退款", ("怎么退款",))])
+    main.chat_chain = RecordingChain()
+    monkeypatch.setattr(main, "knowledge_base", kb)
+    r = await async_client.post("/chat", json={"message": "怎么退款？", "session_id": "kb1"})
+    assert r.json()["reply"] == "在订单页申请退款"
+    assert seen == []
+    # 流式接口同样直接返回模板回复
+    async with async_client.stream("POST", "/chat/stream", json={"message": "怎么退款", "session_id": "kb2"}) as resp:
+        body = "".join([c async for c in resp.aiter_text()])
+    assert "data: 在订单页申请退款" in body and "[DONE]" in body
+    # 中等置信度作为参考资料交给会话链（单条目语料 idf 偏低，放宽阈值）
+    monkeypatch.setattr(main.settings, "knowledge_base_context_threshold", 0.05)
+    await async_client.post("/chat", json={"message": "退款多久能到账", "session_id": "kb3"})
+    assert seen[-1] and seen[-1][0]["question"] == "如何申请退款"
+
+
+@pytest.mark.asyncio
+async def test_session_history_pagination_and_etag(async_client: httpx.AsyncClient):
+    main.session_manager = SessionManager(max_history_length=20)
+    for i in range(7):
+        main.session_manager.add_message("h1", f"问{i}", f"答{i}")
+    main.session_manager.last_activity["h1"] = 0
+
+    r = await async_client.get("/sessions/h1/history", params={"limit": 3})
+    assert r.status_code == 200
+    data = r.json()
+    assert [m["seq"] for m in data["history"]] == [4, 5, 6]
+    assert data["next_before"] == 4
+    # 只读访问不刷新活跃时间
+    assert main.session_manager.last_activity["h1"] == 0
+
+    r2 = await async_client.get("/sessions/h1/history", params={"limit": 3, "before": data["next_before"]})
+    assert [m["user_message"] for m in r2.json()["history"]] == ["问1", "问2", "问3"]
+    r3 = await async_client.get("/sessions/h1/history", params={"limit": 3, "before": 1})
+    assert [m["seq"] for m in r3.json()["history"]] == [0] and r3.json()["next_before"] is None
+
+    etag = r.headers["etag"]
+    r304 = await async_client.get("/sessions/h1/history", params={"limit": 3}, headers={"If-None-Match": etag})
+    assert r304.status_code == 304
+    main.session_manager.add_message("h1", "问7", "答7")
+    r4 = await async_client.get("/sessions/h1/history", params={"limit": 3}, headers={"If-None-Match": etag})
+    assert r4.status_code == 200 and r4.json()["history"][-1]["seq"] == 7
+
+
+@pytest.mark.asyncio
+async def test_chat_job_poll_and_stream(async_client: httpx.AsyncClient, monkeypatch):
+    monkeypatch.setattr(main.settings, "internal_api_keys", ["someone-else"])
+    r = await async_client.post("/chat/jobs", json={"message": "异步任务", "session_id": "j1"})
+    assert r.status_code == 202
+    job = r.json()
+    async with async_client.stream("GET", job["stream_url"]) as resp:
+        body = "".join([c async for c in resp.aiter_text()])
+    assert "data: 片段1" in body and "[DONE]" in body
+    data = (await async_client.get(job["status_url"])).json()
+    assert data["status"] == "succeeded" and data["reply"] == "片段1片段2片段3"
+    assert main.session_manager.get_history("j1")[0]["bot_message"] == "片段1片段2片段3"
+    # 其他调用方不可见
+    other = await async_client.get(job["status_url"], headers={"X-API-Key": "someone-else"})
+    assert other.status_code == 404
+
+
+class SlowCountingChain(FakeChain):
+    def __init__(self):
+        self.calls = 0
+
+    async def process_message(self, message: str, history, recalled=None, knowledge=None):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return f"回声: {message}"
+
+    async def stream_message(self, message: str, history, recalled=None, knowledge=None):
+        self.calls += 1
+        for chunk in ["片段1", "片段2", "片段3"]:
+            await asyncio.sleep(0.02)
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_chat_idempotency_concurrent_retries(async_client: httpx.AsyncClient):
+    main.chat_chain = chain = SlowCountingChain()
+    payload = {"message": "只算一次", "session_id": "idem1"}
+    headers = {"Idempotency-Key": "retry-1"}
+    rs = await asyncio.gather(*[async_client.post("/chat", json=payload, headers=headers) for _ in range(5)])
+    assert [r.status_code for r in rs] == [200] * 5
+    assert {r.json()["reply"] for r in rs} == {"回声: 只算一次"}
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in rs) == 4
+    # 完成后的重试直接返回已存结果
+    again = await async_client.post("/chat", json=payload, headers=headers)
+    assert again.json()["reply"] == "回声: 只算一次" and again.headers["Idempotent-Replayed"] == "true"
+    assert chain.calls == 1
+    assert len(main.session_manager.get_history("idem1")) == 1
+    # 同一幂等键、不同请求内容
+    conflict = await async_client.post("/chat", json={**payload, "message": "别的"}, headers=headers)
+    assert conflict.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_idempotency_concurrent_retries(async_client: httpx.AsyncClient):
+    main.chat_chain = chain = SlowCountingChain()
+    payload = {"message": "流式只算一次", "session_id": "idem2"}
+    headers = {"Idempotency-Key": "retry-2"}
+
+    async def fetch():
+        async with async_client.stream("POST", "/chat/stream", json=payload, headers=headers) as r:
+            assert r.status_code == 200
+            return "".join([c async for c in r.aiter_text()])
+
+    bodies = await asyncio.gather(*[fetch() for _ in range(4)])
+    bodies.append(await fetch())  # 完成后的重试：回放为 SSE
+    for body in bodies:
+        assert body.count("data: 片段") == 3 and "event: end" in body
+    assert chain.calls == 1
+    history = main.session_manager.get_history("idem2")
+    assert len(history) == 1 and history[0]["bot_message"] == "片段1片段2片段3"
+
+
+@pytest.mark.asyncio
+async def test_ready_and_load_shedding(async_client: httpx.AsyncClient, monkeypatch):
+    r = await async_client.get("/ready")
+    assert r.status_code == 503 and r.json()["reasons"] == ["starting"]
+    monkeypatch.setattr(main.load_monitor, "started", True)
+    assert (await async_client.get("/ready")).status_code == 200
+    # 排空：不再接收新的对话轮次，存活探针不受影响
+    monkeypatch.setattr(main.load_monitor, "draining", True)
+    assert (await async_client.get("/ready")).json()["reasons"] == ["draining"]
+    r = await async_client.post("/chat", json={"message": "你好", "session_id": "shed1"})
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+    assert (await async_client.get("/health")).status_code == 200
+    assert main.session_manager.get_history("shed1") == []
@@ -0,0 +1,74 @@
+import json
+import os
+from types import SimpleNamespace
+
+from api_keys import ApiKeyIndex, ApiKeyRegistry
+
+
+def _settings(**kw):
+    base = dict(internal_api_key=None, internal_api_keys=[], api_keys={}, api_keys_file=None)
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def test_index_lookup_and_kid():
+    index = ApiKeyIndex.from_sources("root", ["k1", "k2", "root"], {"tenant-a": "ka", "dup": "k1"})
+    assert len(index) == 4
+    assert index.lookup("root").kid is None
+    assert index.lookup("k1").kid == "dup"
+    assert index.lookup("ka").tenant == "tenant-a"
+    assert index.lookup("nope") is None
+    assert index.lookup("") is None
+    assert index.for_kid("tenant-a").secret == "ka"
+    assert index.for_kid(None) is None
+    assert ApiKeyIndex.from_sources("only", [], {}).for_kid(None).secret == "only"
+
+
+def test_registry_rebuilds_on_config_replacement():
+    s = _settings(internal_api_key="old")
+    reg = ApiKeyRegistry(s, check_interval_s=3600)
+    assert reg.current().lookup("old")
+    s.internal_api_key = "new"
+    assert reg.current().lookup("new")
+    assert not reg.current().lookup("old")
+    s.api_keys = {"kid": "k"}
+    assert reg.current().for_kid("kid").secret == "k"
+    before = reg.reloads
+    reg.current()
+    assert reg.reloads == before
+
+
+def test_registry_hot_reloads_secrets_file(tmp_path):
+    path = tmp_path / "keys.json"
+    path.write_text(json.dumps({"acme": {"key": "k-acme", "tenant": "Acme", "plan": "pro"}}), encoding="utf-8")
+    reg = ApiKeyRegistry(_settings(api_keys_file=str(path)), check_interval_s=0)
+    entry = reg.current().lookup("k-acme")
+    assert entry.kid == "acme" and entry.tenant == "Acme" and entry.metadata["plan"] == "pro"
+
+    old_index = reg.current()
+    path.write_text(json.dumps({"acme": "k-rotated"}), encoding="utf-8")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert reg.current().lookup("k-rotated").kid == "acme"
+    assert reg.current().lookup("k-acme") is None
+    # 旧索引对象保持不变，正在使用它的请求不受影响
+    assert old_index.lookup("k-acme") is not None
+
+
+def test_registry_keeps_file_keys_when_file_is_corrupt(tmp_path):
+    path = tmp_path / "keys.json"
+    path.write_text(json.dumps({"acme": "k-acme"}), encoding="utf-8")
+    reg = ApiKeyRegistry(_settings(internal_api_key="root", api_keys_file=str(path)), check_interval_s=0)
+    assert reg.current().lookup("k-acme").kid == "acme"
+
+    # 写入中途被读到：保留上一版文件密钥，配置来源照常生效
+    path.write_text('{"acme": "k-ne', encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    assert reg.current().lookup("k-acme").kid == "acme"
+    assert reg.current().lookup("root") is not None
+    assert reg.errors == 1
+
+    path.write_text(json.dumps({"acme": "k-new"}), encoding="utf-8")
+    os.utime(path, ns=(2, 2))
+    assert reg.current().lookup("k-new").kid == "acme"
+    assert reg.current().lookup("k-acme") is None
@@ -0,0 +1,139 @@
+import json
+
+import httpx
+import pytest
+
+import main
+from chat_client import AsyncChatClient, ChatClient, ChatError, iter_sse, run_sessions
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+
+
+async def _lines(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_incremental():
+    lines = [": ping", "data: 你", "", "data: a", "data: b", "", "event: error", "data: oops", "", "data: tail"]
+    assert [e async for e in iter_sse(_lines(lines))] == [
+        ("message", "你"),
+        ("message", "a\nb"),
+        ("error", "oops"),
+        ("message", "tail"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_client_against_app(monkeypatch):
+    main.chat_chain = FakeChain()
+    main.session_manager = SessionManager(max_history_length=5)
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "signed_url_enabled", True)
+    monkeypatch.setattr(main.settings, "internal_api_key", "test-secret")
+    transport = httpx.ASGITransport(app=main.app)
+    async with AsyncChatClient("http://test", api_key="test-secret", transport=transport) as client:
+        session = client.session("sdk1")
+        assert (await session.chat("你好"))["reply"] == "回声: 你好"
+        assert [c async for c in session.stream("流式")] == ["片段1", "片段2", "片段3"]
+        assert [c async for c in session.stream("签名", signed=True)] == ["片段1", "片段2", "片段3"]
+        assert len((await session.history())["history"]) == 3
+
+        # 同一连接池并发驱动多个会话
+        replies = await run_sessions(client, [["一", "二"]] * 20)
+        assert replies == [["片段1片段2片段3"] * 2] * 20
+
+    async with AsyncChatClient("http://test", api_key="wrong", retries=0, transport=transport) as client:
+        with pytest.raises(ChatError) as exc:
+            await client.chat("你好", "sdk2")
+        assert exc.value.status_code == 401
+
+
+def _sse(chunks, end=True, replayed=False):
+    body = "".join(f"data: {c}\n\n" for c in chunks) + ("event: end\ndata: [DONE]\n\n" if end else "")
+    headers = {"Content-Type": "text/event-stream"}
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return httpx.Response(200, text=body, headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_retry_backoff_and_stream_resume():
+    keys = []
+    calls = {"/chat": 0, "/chat/stream": 0}
+
+    def handler(request: httpx.Request):
+        keys.append(request.headers["Idempotency-Key"])
+        calls[request.url.path] += 1
+        if request.url.path == "/chat":
+            if calls["/chat"] == 1:
+                return httpx.Response(503, json={"detail": "overloaded"}, headers={"Retry-After": "0"})
+            if calls["/chat"] == 2:
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200, json={"reply": "ok", "session_id": json.loads(request.content)["session_id"]})
+        # 第一次连接在两个片段后断开；重连时服务端从头回放
+        if calls["/chat/stream"] == 1:
+            return _sse(["a", "b"], end=False)
+        return _sse(["a", "b", "c"], replayed=True)
+
+    client = AsyncChatClient("http://test", backoff_s=0, transport=httpx.MockTransport(handler))
+    assert (await client.chat("hi", "s"))["reply"] == "ok"
+    assert len(set(keys)) == 1 and client.retried == 2
+    keys.clear()
+    assert [c async for c in client.stream("hi", "s")] == ["a", "b", "c"]
+    assert len(keys) == 2 and len(set(keys)) == 1
+    await client.aclose()
+
+    failing = AsyncChatClient(
+        "http://test", retries=1, backoff_s=0, transport=httpx.MockTransport(lambda r: _sse(["x"], end=False))
+    )
+    with pytest.raises(ChatError):
+        _ = [c async for c in failing.stream("hi", "s")]
+    await failing.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_not_stitched_without_replay_and_retried_once_per_attempt():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(1)
+        # 重连到了没有幂等记录的副本：重新生成了不同的回复
+        return _sse(["a", "b"], end=False) if len(calls) == 1 else _sse(["x", "y", "z"])
+
+    client = AsyncChatClient("http://test", backoff_s=0, transport=httpx.MockTransport(handler))
+    received = []
+    with pytest.raises(ChatError, match="did not replay"):
+        async for chunk in client.stream("hi", "s"):
+            received.append(chunk)
+    assert received == ["a", "b"] and len(calls) == 2
+    await client.aclose()
+
+    # 建连失败只在一层重试：retries=2 共 3 次尝试
+    calls.clear()
+
+    def overloaded(request: httpx.Request):
+        calls.append(1)
+        return httpx.Response(503, json={"detail": "overloaded"})
+
+    client = AsyncChatClient("http://test", retries=2, backoff_s=0, transport=httpx.MockTransport(overloaded))
+    with pytest.raises(ChatError) as exc:
+        _ = [c async for c in client.stream("hi", "s")]
+    assert exc.value.status_code == 503 and len(calls) == 3 and client.retried == 2
+    await client.aclose()
+
+
+def test_sync_facade():
+    def handler(request: httpx.Request):
+        if request.url.path == "/chat/stream":
+            return _sse(["片段1", "片段2"])
+        if request.method == "DELETE":
+            return httpx.Response(404, json={"detail": "not found"})
+        return httpx.Response(200, json={"reply": "回声", "session_id": "s"})
+
+    with ChatClient("http://test", retries=0, transport=httpx.MockTransport(handler)) as client:
+        assert client.send_message("你好")["reply"] == "回声"
+        assert list(client.stream_message("流式")) == ["片段1", "片段2"]
+        assert client.clear_session() == {"error": "404: not found"}
+    assert client._loop.is_closed()
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from chat_jobs import FAILED, SUCCEEDED, JobFailed, JobManager, JobQueueFull
+
+
+def make_runner(log, delay=0.01):
+    async def runner(job):
+        log.append(("start", job.session_id, job.message))
+        for part in ("a", "b"):
+            await asyncio.sleep(delay)
+            yield f"{job.message}-{part}"
+        if job.message == "boom":
+            raise ValueError("internal detail")
+        if job.message == "quota":
+            raise JobFailed("token quota exceeded")
+        log.append(("end", job.session_id, job.message))
+
+    return runner
+
+
+async def wait_done(manager, jobs):
+    for _ in range(200):
+        if all(j.done for j in jobs):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("jobs did not finish")
+
+
+@pytest.mark.asyncio
+async def test_jobs_run_in_order_per_session_and_parallel_across_sessions():
+    log = []
+    manager = JobManager(make_runner(log), workers=4)
+    jobs = [manager.submit("s1", f"m{i}", "k") for i in range(3)] + [manager.submit("s2", "x", "k")]
+    await wait_done(manager, jobs)
+    s1 = [e for e in log if e[1] == "s1"]
+    assert s1 == [(kind, "s1", f"m{i}") for i in range(3) for kind in ("start", "end")]
+    # s2 与 s1 的第一个任务并行开始
+    assert log.index(("start", "s2", "x")) < log.index(("end", "s1", "m0"))
+    assert jobs[0].status == SUCCEEDED and jobs[0].reply == "m0-am0-b"
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_subscribe_replays_then_follows():
+    manager = JobManager(make_runner([], delay=0.02), workers=1)
+    job = manager.submit("s", "m", "k")
+    await asyncio.sleep(0.03)  # 已产出一个片段后再订阅
+    assert [t async for t in manager.subscribe(job)] == ["m-a", "m-b"]
+    assert [t async for t in manager.subscribe(job)] == ["m-a", "m-b"]  # 完成后可重复回放
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_failures_queue_bound_and_result_ttl():
+    manager = JobManager(make_runner([]), workers=1, max_queued=2, result_ttl_s=60, max_jobs=2)
+    boom, quota = manager.submit("s", "boom", "k"), manager.submit("s", "quota", "k")
+    with pytest.raises(JobQueueFull):
+        manager.submit("s", "extra", "k")
+    await wait_done(manager, [boom, quota])
+    assert boom.status == FAILED and boom.error == "服务器处理异常"
+    assert quota.error == "token quota exceeded"
+    # 任务表超出上限时淘汰最早完成的任务
+    latest = manager.submit("t", "ok", "k")
+    assert manager.get(boom.id) is None and manager.get(quota.id) is not None
+    await wait_done(manager, [latest])
+    manager._expire(latest.finished_at + 61)
+    assert latest.id not in manager.jobs and not manager.finished
+    await manager.stop()
@@ -0,0 +1,45 @@
+import json
+
+from history_cache import EncodedHistoryCache
+from session_manager import SessionManager
+
+
+def render(cache, sid, messages, before=None, limit=50):
+    page = cache.page(messages, before, limit)
+    return json.loads(cache.render(sid, messages, page))
+
+
+def test_encodes_each_message_once_and_follows_truncation():
+    sm = SessionManager(max_history_length=3)
+    cache = EncodedHistoryCache()
+    for i in range(3):
+        sm.add_message("s", f"问{i}", f"答{i}")
+    history = sm.get_history("s")
+    assert render(cache, "s", history)["history"] == history
+    assert cache.encoded == 3
+    sm.add_message("s", "问3", "答3")  # 截断最早一条
+    data = render(cache, "s", sm.get_history("s"))
+    assert [m["seq"] for m in data["history"]] == [1, 2, 3]
+    assert cache.encoded == 4
+
+
+def test_recreated_session_invalidates_cache():
+    sm = SessionManager()
+    cache = EncodedHistoryCache()
+    sm.add_message("s", "旧问题", "旧回答")
+    render(cache, "s", sm.get_history("s"))
+    sm.clear_session("s")
+    sm.add_message("s", "新问题", "新回答")
+    sm.get_history("s")[0]["unix_timestamp"] += 1  # 确保与旧记录时间戳不同
+    assert render(cache, "s", sm.get_history("s"))["history"][0]["user_message"] == "新问题"
+
+
+def test_etag_changes_with_content_and_empty_history():
+    sm = SessionManager()
+    cache = EncodedHistoryCache()
+    assert cache.page([], None, 10).etag == '"empty"'
+    sm.add_message("s", "问", "答")
+    etag = cache.page(sm.get_history("s"), None, 10).etag
+    sm.add_message("s", "问2", "答2")
+    assert cache.page(sm.get_history("s"), None, 10).etag != etag
+    assert render(cache, "s", [], None, 10) == {"session_id": "s", "history": [], "next_before": None}
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore
+
+
+async def _produce(chunks, fail=None):
+    for c in chunks:
+        await asyncio.sleep(0)
+        yield c
+    if fail is not None:
+        raise fail
+
+
+@pytest.mark.asyncio
+async def test_attach_and_replay():
+    store = IdempotencyStore()
+    entry, created = store.begin("k", "fp")
+    assert created
+    store.run(entry, _produce(["a", "b"]))
+    attached, created = store.begin("k", "fp")
+    assert attached is entry and not created
+    assert [c async for c in attached.subscribe()] == ["a", "b"]
+    # 完成后订阅直接回放
+    assert [c async for c in entry.subscribe()] == ["a", "b"]
+    with pytest.raises(IdempotencyConflict):
+        store.begin("k", "other")
+
+
+@pytest.mark.asyncio
+async def test_failure_drops_entry_unless_kept():
+    store = IdempotencyStore()
+    entry, _ = store.begin("k", "fp")
+    store.run(entry, _produce(["a"], fail=RuntimeError("boom")))
+    await entry.wait()
+    assert isinstance(entry.error, RuntimeError) and "k" not in store.entries
+    _, created = store.begin("k", "fp")
+    assert created  # 可重试的失败：重新执行
+
+    kept, _ = store.begin("q", "fp")
+    store.run(kept, _produce(["a"], fail=KeyError("x")), keep_errors=(KeyError,))
+    await kept.wait()
+    assert store.begin("q", "fp") == (kept, False)
+
+
+@pytest.mark.asyncio
+async def test_ttl_and_size_bounds():
+    store = IdempotencyStore(ttl_s=10, max_entries=2)
+    for key in ("a", "b", "c"):
+        entry, _ = store.begin(key, "fp")
+        store.run(entry, _produce([key]))
+        await entry.wait()
+    store.begin("d", "fp")  # 登记前淘汰最早完成的条目
+    assert list(store.entries) == ["c", "d"]
+    store.begin("e", "fp", now=store.finished["c"] + 11)
+    assert "c" not in store.entries and "d" in store.entries  # 执行中的条目不淘汰
@@ -0,0 +1,79 @@
+import httpx
+import pytest
+
+import api_with_session
+from indexed_session_manager import IndexedSessionManager
+
+
+def test_slots_reused_and_history_truncated():
+    sm = IndexedSessionManager(max_history_length=3, capacity=2)
+    a, b, c = sm.create_session("a"), sm.create_session("b"), sm.create_session("c")
+    assert (a, b, c) == (0, 1, 2) and sm.capacity >= 3
+    assert sm.create_session("a") == a
+    for i in range(3):
+        assert sm.add_user_message(a, f"问{i}") and sm.add_ai_message(a, f"答{i}")
+    assert [m["content"] for m in sm.get_session_history(a)] == ["答1", "问2", "答2"]
+    stats = sm.get_session_stats(a)
+    assert stats["user_messages"] == 1 and stats["ai_messages"] == 2 and stats["is_active"]
+
+    assert sm.delete_session(b) and not sm.delete_session(b)
+    assert not sm.add_user_message(b, "x") and sm.get_session_history(b) == []
+    assert sm.create_session("d") == b  # 复用空闲槽位
+    assert sm.get_slot("d") == b and sm.get_slot("b") is None
+    assert sm.list_all_sessions() == [0, 1, 2]
+
+
+def test_vectorized_active_scan_and_cleanup():
+    sm = IndexedSessionManager(session_timeout_minutes=1)
+    slots = [sm.create_session(f"s{i}") for i in range(5)]
+    now = sm.last_activity[slots[0]]
+    sm.last_activity[[1, 3]] = now - 120
+    assert sm.list_active_sessions(now) == [0, 2, 4]
+    assert sm.get_all_sessions_stats(now)["active_sessions"] == 3
+    assert sm.cleanup_inactive_sessions(now) == 2
+    assert sm.list_all_sessions() == [0, 2, 4] and len(sm) == 3
+    assert sorted(sm.free) == [1, 3] and sm.get_last_activity_array()[1] == 0
+
+
+def test_bulk_export_import_roundtrip():
+    src = IndexedSessionManager()
+    for i in range(4):
+        slot = src.create_session(f"s{i}")
+        src.add_user_message(slot, f"问{i}")
+        src.add_ai_message(slot, f"答{i}")
+    src.delete_session(1)
+    dump = src.export_sessions()
+    assert dump["session_ids"] == ["s0", "s2", "s3"]
+
+    dst = IndexedSessionManager(max_history_length=1)
+    dst.create_session("s2")
+    slots = dst.import_sessions(dump)
+    assert slots[1] == 0  # 已存在的会话原位覆盖
+    assert [m["content"] for m in dst.get_session_history(dst.get_slot("s3"))] == ["答3"]
+    assert dst.last_activity[slots[2]] == src.last_activity[src.get_slot("s3")]
+
+    single = src.export_session_data(src.get_slot("s0"))
+    assert dst.import_session_data({**single, "session_id": "copy"}) is not None
+    assert dst.import_session_data({"messages": [{"role": "bot", "content": "x"}]}) is None
+    assert dst.import_sessions({"session_ids": ["a", "a"], "messages": [[], []]}) == []
+
+
+@pytest.mark.asyncio
+async def test_api_with_session_contract(monkeypatch):
+    monkeypatch.setattr(api_with_session, "session_manager", IndexedSessionManager())
+    transport = httpx.ASGITransport(app=api_with_session.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        r = await client.post("/chat", json={"message": "你好"})
+        assert r.status_code == 200
+        idx = r.json()["session_index"]
+        assert (await client.post("/chat", json={"message": "再见", "session_index": idx})).status_code == 200
+        assert (await client.get(f"/sessions/{idx}/stats")).json()["total_messages"] == 4
+        assert (await client.get("/sessions/active")).json() == [idx]
+        exported = (await client.get(f"/sessions/{idx}/export")).json()
+        assert (await client.delete(f"/sessions/{idx}")).status_code == 200
+        assert (await client.get(f"/sessions/{idx}/stats")).status_code == 404
+        imported = (await client.post("/sessions/import", json=exported)).json()["session_index"]
+        assert imported == idx
+        assert len((await client.get(f"/sessions/{idx}/history")).json()["history"]) == 4
+        assert (await client.get("/sessions/arrays/activity")).json()["last_activity"][idx] > 0
+        assert (await client.get("/health")).json()["total_sessions"] == 1
@@ -0,0 +1,68 @@
+import json
+import os
+
+from embeddings import HashingEmbedder
+from knowledge_base import FaqEntry, FaqKnowledgeBase
+
+FAQS = [
+    {"id": "refund", "question": "如何申请退款", "aliases": ["怎么退款"], "answer": "在订单页申请退款"},
+    {"id": "invoice", "question": "怎么开发票", "answer": "在订单详情页申请发票"},
+    {"id": "password", "question": "忘记密码怎么办", "answer": "在登录页重置密码"},
+]
+
+
+def write_faq(path, items):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False)
+
+
+def test_bm25_ranks_matching_question_with_high_confidence(tmp_path):
+    path = tmp_path / "faq.json"
+    write_faq(path, FAQS)
+    kb = FaqKnowledgeBase(str(path))
+    hits = kb.search("怎么退款？", k=2)
+    assert hits[0][0].id == "refund" and hits[0][1] > 0.8
+    # 不相关问题置信度低
+    assert kb.search("今天天气如何")[0][1] < 0.25
+
+
+def test_vector_fusion_keeps_ranking(tmp_path):
+    path = tmp_path / "faq.json"
+    write_faq(path, FAQS)
+    kb = FaqKnowledgeBase(str(path), embedder=HashingEmbedder(dim=256), vector_weight=0.5)
+    assert kb.search("忘记密码了")[0][0].id == "password"
+
+
+def test_incremental_sync_only_touches_changed_entries():
+    kb = FaqKnowledgeBase()
+    entries = [FaqEntry(f["id"], f["question"], f["answer"], tuple(f.get("aliases", ()))) for f in FAQS]
+    assert kb.sync(entries) == {"added": 3, "updated": 0, "removed": 0}
+    changed = [entries[0], FaqEntry("invoice", "怎么开发票", "新的答案"), FaqEntry("ship", "多久发货", "24 小时内")]
+    assert kb.sync(changed) == {"added": 1, "updated": 1, "removed": 1}
+    assert len(kb) == 3
+    assert kb.search("忘记密码怎么办")[0][0].id != "password"
+    assert kb.search("怎么开发票")[0][0].answer == "新的答案"
+    # 删除后空出的槽位被复用
+    assert kb.index.size == 3
+
+
+def test_parse_jsonl_and_reload_on_mtime_change(tmp_path):
+    path = tmp_path / "faq.jsonl"
+    path.write_text("\n".join(json.dumps(f, ensure_ascii=False) for f in FAQS[:2]), encoding="utf-8")
+    kb = FaqKnowledgeBase(str(path), check_interval_s=0)
+    assert len(kb) == 2
+    path.write_text("\n".join(json.dumps(f, ensure_ascii=False) for f in FAQS), encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    kb.maybe_reload()
+    assert len(kb) == 3 and kb.reloads == 2
+
+
+def test_generic_short_queries_do_not_reach_answer_threshold():
+    # 查询只是某条问法的子串时，问法覆盖度低，达不到默认直接回复阈值 0.8
+    kb = FaqKnowledgeBase(os.path.join(os.path.dirname(__file__), "..", "examples", "faq.json"))
+    for query in ("怎么样", "如何", "退", "密码", "发票", "地址"):
+        hits = kb.search(query, k=1)
+        assert not hits or hits[0][1] < 0.8, (query, hits[0][1])
+    for query, entry_id in (("怎么退款？", "refund"), ("改地址", "address"), ("多久发货呀", "shipping")):
+        entry, conf = kb.search(query, k=1)[0]
+        assert entry.id == entry_id and conf >= 0.8
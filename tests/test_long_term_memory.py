@@ -0,0 +1,50 @@
+from chat_chain import ChatChain
+from embeddings import HashingEmbedder, VectorIndex
+from long_term_memory import LongTermMemory
+
+
+def test_vector_index_grows_then_overwrites_oldest():
+    emb = HashingEmbedder(dim=64)
+    index = VectorIndex(64, capacity=2, max_items=4)
+    for i in range(6):
+        index.add(emb.embed(f"第{i}条"), i, i)
+    assert len(index) == 4
+    assert sorted(index.payloads) == [2, 3, 4, 5]
+    hits = index.search(emb.embed("第5条"), k=1)
+    assert index.payloads[hits[0][0]] == 5
+    # max_seq 之外的条目不参与检索
+    assert all(index.seqs[slot] < 4 for slot, _ in index.search(emb.embed("第5条"), k=4, max_seq=4))
+
+
+def test_recall_skips_recent_window_and_orders_by_time():
+    mem = LongTermMemory(top_k=2, min_score=0.2)
+    mem.add_turn("s1", "我的订单号是 A123，什么时候发货", "预计明天发货")
+    mem.add_turn("s1", "退货地址在哪里", "请寄到上海仓库")
+    for i in range(20):
+        mem.add_turn("s1", f"闲聊第{i}句", "好的")
+    recalled = mem.recall("s1", "订单 A123 发货了吗", recent_turns=5)
+    assert recalled and recalled[0]["bot_message"] == "预计明天发货"
+    # 全部轮次都在最近窗口内时不召回
+    assert mem.recall("s1", "订单 A123", recent_turns=50) == []
+    assert mem.recall("unknown", "订单", recent_turns=1) == []
+
+
+def test_session_eviction_and_forget():
+    mem = LongTermMemory(max_sessions=2)
+    for sid in ("a", "b", "c"):
+        mem.add_turn(sid, "你好", "你好")
+    assert list(mem.sessions) == ["b", "c"]
+    mem.forget("b")
+    assert mem.stats() == {"sessions": 1, "indexed_turns": 1}
+
+
+def test_format_history_prepends_recalled_turns():
+    chain = ChatChain()
+    messages = chain._format_history(
+        {
+            "raw_history": [{"user_message": "最近的问题", "bot_message": "最近的回答"}],
+            "recalled": [{"user_message": "订单号 A123", "bot_message": "明天发货"}],
+        }
+    )
+    assert messages[0].type == "system" and "A123" in messages[0].content
+    assert [m.content for m in messages[1:]] == ["最近的问题", "最近的回答"]
@@ -0,0 +1,125 @@
+import json
+import os
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from langchain_core.language_models.fake import FakeStreamingListLLM
+
+import chat_chain as chat_chain_module
+import main
+from chat_chain import ChatChain
+from profiles import Profile, ProfileIndex, ProfileRegistry
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+
+
+def _settings(**kw):
+    base = dict(profiles={}, profiles_file=None)
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def test_registry_merges_sources_and_hot_reloads(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({"acme": {"model_name": "qwen-plus"}}), encoding="utf-8")
+    s = _settings(
+        profiles={"acme": {"system_prompt": "旧"}, "default": {"temperature": 0.2}},
+        profiles_file=str(path),
+    )
+    compiled = []
+    reg = ProfileRegistry(s, check_interval_s=0, on_reload=compiled.append)
+    index = reg.current()
+    assert index.get("acme") == Profile("acme", None, "qwen-plus", None)  # 文件覆盖同名租户
+    assert index.get("other") is index.get(None) is index.default
+    assert compiled == [index]
+
+    path.write_text(json.dumps({"acme": {"system_prompt": "新"}}), encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    assert reg.current().get("acme").system_prompt == "新" and reg.reloads == 2
+
+    # 文件写坏时保留上一版画像，不调用 on_reload
+    path.write_text("{", encoding="utf-8")
+    os.utime(path, ns=(2, 2))
+    assert reg.current().get("acme").system_prompt == "新"
+    assert reg.errors == 1 and len(compiled) == 2
+
+    with pytest.raises(ValueError):
+        ProfileIndex.from_sources({"bad": {"temperature": 3}})
+
+
+@pytest.mark.asyncio
+async def test_chains_compiled_once_and_clients_pooled(monkeypatch):
+    built = []
+
+    def fake_llm(**kw):
+        built.append(kw)
+        return FakeStreamingListLLM(responses=[kw["model"]])
+
+    monkeypatch.setattr(chat_chain_module, "Tongyi", fake_llm)
+    chain = ChatChain()
+    await chain.initialize()
+    acme = Profile("acme", "你是 {brand} 的客服", "m-acme", 0.3)
+    twin = Profile("twin", "你是 {brand} 的客服", "m-acme", 0.3)
+    beta = Profile("beta", "贝塔", None, None)
+    chain.compile_profiles(ProfileIndex({"acme": acme, "twin": twin, "beta": beta}))
+    # 内容相同的画像共享链路；beta 沿用默认模型与温度，复用默认客户端
+    assert len(chain.profile_chains) == 2 and len(built) == 2
+    assert chain.chain_for(acme) is chain.chain_for(twin)
+    assert chain.chain_for(None) is chain.chain
+
+    prompt = chain.chain_for(acme).steps[1]
+    messages = prompt.format_messages(message="你好", history=[])
+    assert messages[0].content == "你是 {brand} 的客服"  # 花括号按字面保留
+    assert await chain.process_message("你好", [], profile=acme) == "m-acme"
+    assert await chain.process_message("你好", []) == built[0]["model"]
+
+    # 流式过程中重载画像：在途流继续使用旧链路，之后的请求使用新链路
+    stream = chain.stream_message("你好", [], profile=acme)
+    first = await stream.__anext__()
+    acme2 = Profile("acme", "新人设", "m-acme-2", 0.3)
+    chain.compile_profiles(ProfileIndex({"acme": acme2, "beta": beta}))
+    assert first + "".join([c async for c in stream]) == "m-acme"
+    assert await chain.process_message("你好", [], profile=acme2) == "m-acme-2"
+    assert acme not in chain.profile_chains and len(built) == 3
+
+
+class ProfileFakeChain(FakeChain):
+    def __init__(self):
+        self.profiles = []
+
+    async def process_message(self, message, history, recalled=None, knowledge=None, profile=None):
+        self.profiles.append(profile)
+        return f"回声: {message}"
+
+
+class RecordingCache:
+    def __init__(self):
+        self.stored = []
+
+    def lookup(self, message):
+        return None
+
+    def store(self, message, reply):
+        self.stored.append(message)
+
+
+@pytest.mark.asyncio
+async def test_chat_selects_tenant_profile(monkeypatch, tmp_path):
+    keys = tmp_path / "keys.json"
+    keys.write_text(json.dumps({"kid1": {"key": "k1", "tenant": "acme"}, "kid2": "k2"}), encoding="utf-8")
+    monkeypatch.setattr(main.settings, "require_api_key", True)
+    monkeypatch.setattr(main.settings, "api_keys_file", str(keys))
+    monkeypatch.setattr(main.settings, "profiles", {"acme": {"system_prompt": "你是 Acme 的客服"}})
+    cache = RecordingCache()
+    monkeypatch.setattr(main, "semantic_cache", cache)
+    main.chat_chain = chain = ProfileFakeChain()
+    main.session_manager = SessionManager(max_history_length=5)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for key, session_id in (("k1", "p1"), ("k2", "p2")):
+            r = await client.post("/chat", json={"message": "你好", "session_id": session_id}, headers={"X-API-Key": key})
+            assert r.status_code == 200
+    assert [p.name if p else None for p in chain.profiles] == ["acme", None]
+    # 使用画像的回复不写入跨租户共享的语义缓存
+    assert cache.stored == ["你好"] and len(chain.profiles) == 2
@@ -0,0 +1,71 @@
+import logging
+import os
+import pstats
+import time
+
+import pytest
+import httpx
+
+import main
+from profiling import RequestProfilerMiddleware, StackSampler
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+
+
+@pytest.mark.asyncio
+async def test_request_profile_requires_admin_key(tmp_path):
+    main.chat_chain = FakeChain()
+    main.session_manager = SessionManager(max_history_length=5)
+    app = RequestProfilerMiddleware(main.app, admin_api_key="admin", output_dir=str(tmp_path))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        payload = {"message": "你好", "session_id": "p1"}
+        r = await client.post("/chat", json=payload, headers={"X-Profile": "1", "X-Admin-Key": "wrong"})
+        assert r.status_code == 200
+        assert "x-profile-file" not in r.headers
+
+        r = await client.post("/chat", json=payload, headers={"X-Profile": "1", "X-Admin-Key": "admin"})
+        assert r.status_code == 200
+        path = os.path.join(str(tmp_path), r.headers["x-profile-file"])
+        assert pstats.Stats(path).total_calls > 0
+
+
+def test_stack_sampler_writes_folded_stacks(tmp_path):
+    sampler = StackSampler(str(tmp_path))
+    path = sampler.start(duration_s=0.2, interval_s=0.01)
+    with pytest.raises(RuntimeError):
+        sampler.start(duration_s=0.2, interval_s=0.01)
+    sampler.stop()
+    lines = open(path, encoding="utf-8").read().splitlines()
+    assert sampler.samples > 0
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("MainThread" in line for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_sampling_endpoint_hidden_when_disabled(monkeypatch):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        r = await client.get("/admin/profile/sampling", headers={"X-Admin-Key": "admin"})
+        assert r.status_code == 404
+
+        monkeypatch.setattr(main.settings, "profiling_enabled", True)
+        monkeypatch.setattr(main.settings, "admin_api_key", "admin")
+        r = await client.get("/admin/profile/sampling")
+        assert r.status_code == 401
+        r = await client.get("/admin/profile/sampling", headers={"X-Admin-Key": "admin"})
+        assert r.status_code == 200
+        assert r.json()["running"] is False
+
+
+@pytest.mark.asyncio
+async def test_access_log_redacts_admin_key(monkeypatch, caplog):
+    monkeypatch.setattr(main.settings, "admin_api_key", "admin-secret")
+    transport = httpx.ASGITransport(app=main.app)
+    with caplog.at_level(logging.INFO, logger="app"):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            r = await client.get("/admin/load", headers={"X-Admin-Key": "admin-secret", "X-API-Key": "k-secret"})
+            assert r.status_code == 200
+    logged = "\n".join(rec.getMessage() for rec in caplog.records if rec.getMessage().startswith("req "))
+    assert "x-admin-key" in logged
+    assert "admin-secret" not in logged and "k-secret" not in logged
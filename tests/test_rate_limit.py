@@ -0,0 +1,125 @@
+import pytest
+import httpx
+
+import main
+from rate_limit import (
+    CompositeRateLimiter,
+    DistributedRateLimiter,
+    GCRARateLimiter,
+    InMemoryCounterStore,
+)
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+
+
+def test_gcra_burst_then_refill():
+    rl = GCRARateLimiter(max_requests=3, window_s=3)
+    now = 1000.0
+    decisions = [rl.allow("k", now) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].retry_after == pytest.approx(1.0)
+    # 一个发射间隔后恢复一个额度
+    assert rl.allow("k", now + 1.0).allowed
+    assert not rl.allow("k", now + 1.0).allowed
+
+
+def test_gcra_key_table_is_bounded():
+    rl = GCRARateLimiter(max_requests=5, window_s=60, max_keys=100)
+    for i in range(1000):
+        rl.allow(f"ip:{i}", 1000.0)
+    assert len(rl) == 100
+    assert rl.evicted == 900
+    # 过期键随新键到来被顺手回收，不计入淘汰
+    for i in range(100):
+        rl.allow(f"fresh:{i}", 2000.0)
+    assert len(rl) == 100
+    assert rl.evicted == 900
+    assert all(k.startswith("fresh:") for k in rl.tats)
+
+
+def test_composite_does_not_charge_on_reject():
+    per_key = GCRARateLimiter(max_requests=10, window_s=10)
+    global_ = GCRARateLimiter(max_requests=2, window_s=10)
+    rl = CompositeRateLimiter([("primary", per_key), ("global", global_)])
+    now = 50.0
+    assert rl.allow({"primary": "a", "global": "g"}, now).allowed
+    assert rl.allow({"primary": "b", "global": "g"}, now).allowed
+    d = rl.allow({"primary": "a", "global": "g"}, now)
+    assert not d.allowed and d.limit == 2
+    # 被全局维度拒绝的请求不消耗主维度额度
+    assert per_key.check("a", now)[0].remaining == 8
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_headers(monkeypatch):
+    monkeypatch.setattr(main.settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(main, "rate_limiter", CompositeRateLimiter([("primary", GCRARateLimiter(2, 60))]))
+    main.chat_chain = FakeChain()
+    main.session_manager = SessionManager(max_history_length=5)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        payload = {"message": "你好", "session_id": "r1"}
+        r = await client.post("/chat", json=payload)
+        assert r.status_code == 200
+        assert r.headers["x-ratelimit-limit"] == "2"
+        assert r.headers["x-ratelimit-remaining"] == "1"
+        await client.post("/chat", json=payload)
+        r = await client.post("/chat", json=payload)
+        assert r.status_code == 429
+        assert int(r.headers["retry-after"]) >= 1
+        assert r.headers["x-ratelimit-remaining"] == "0"
+
+
+def _simulate_cluster(replicas: int, limit: int, requests: int, sync_every: int) -> int:
+    """多副本轮询接收请求，每处理 sync_every 个请求各副本同步一次；返回集群总放行数。"""
+    store = InMemoryCounterStore()
+    nodes = [DistributedRateLimiter(limit, 60, store) for _ in range(replicas)]
+    now = 10.0
+    admitted = 0
+    for i in range(requests):
+        if nodes[i % replicas].allow("ak:tenant", now).allowed:
+            admitted += 1
+        if (i + 1) % sync_every == 0:
+            for node in nodes:
+                node.sync(now)
+    return admitted
+
+
+def test_cluster_limit_accuracy():
+    limit, replicas = 100, 4
+    # 超发上限：一个同步周期内的放行量 + 每个副本首次见到该键前的一次放行
+    for sync_every in (1, 4, 16, 40):
+        admitted = _simulate_cluster(replicas, limit, requests=1000, sync_every=sync_every)
+        assert limit <= admitted <= limit + sync_every + replicas - 1
+    # 对照：不同步时每个副本各自放行满额
+    assert _simulate_cluster(replicas=4, limit=limit, requests=1000, sync_every=10**9) == 4 * limit
+
+
+def test_cluster_sync_batches_and_window_rollover():
+    store = InMemoryCounterStore()
+    a = DistributedRateLimiter(3, 60, store)
+    b = DistributedRateLimiter(3, 60, store)
+    for _ in range(3):
+        assert a.allow("k", 1.0).allowed
+    a.sync(1.0)
+    b.sync(1.0)
+    assert store.calls == 1  # b 无本地计数也无已知键，不访问存储
+    assert b.allow("k", 1.0).allowed  # b 尚未知晓 k 的集群计数
+    b.sync(1.0)
+    assert not b.allow("k", 1.0).allowed
+    # 新窗口重新计数
+    assert b.allow("k", 61.0).allowed
+
+
+def test_cluster_sync_failure_keeps_local_counts():
+    class FailingStore(InMemoryCounterStore):
+        def incr_many(self, window, deltas, ttl_s):
+            raise ConnectionError("down")
+
+    rl = DistributedRateLimiter(2, 60, FailingStore())
+    assert rl.allow("k", 1.0).allowed
+    with pytest.raises(ConnectionError):
+        rl.sync(1.0)
+    assert rl.allow("k", 1.0).allowed
+    assert not rl.allow("k", 1.0).allowed
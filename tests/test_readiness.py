@@ -0,0 +1,77 @@
+import asyncio
+import os
+import signal
+
+import pytest
+
+from readiness import LoadMonitor
+
+
+async def _events(n, delay=0.0):
+    for i in range(n):
+        await asyncio.sleep(delay)
+        yield f"data: {i}\n\n"
+
+
+@pytest.mark.asyncio
+async def test_readiness_and_shedding_thresholds():
+    queued = [0]
+    m = LoadMonitor(max_streams=2, max_upstream=2, shed_factor=1.5, upstream_queued=lambda: queued[0])
+    assert m.not_ready_reasons() == ["starting"]
+    m.started = True
+    assert m.not_ready_reasons() == [] and m.shed_reason() is None
+
+    streams = [m.track_stream(_events(1)) for _ in range(2)]
+    for s in streams:
+        await s.__anext__()
+    assert m.streams == 2 and m.not_ready_reasons() == ["streams"]
+    assert m.shed_reason() is None  # 未达削峰阈值（2 * 1.5）
+    with m.turn(), m.turn():
+        queued[0] = 1
+        assert m.upstream == 3 and m.shed_reason() == "upstream"
+    for s in streams:
+        await s.aclose()
+    assert m.streams == 0 and m.turns == 0
+
+    m.loop_lag_ms, m.max_loop_lag_ms = 300, 200
+    assert "loop_lag" in m.not_ready_reasons()
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_streams():
+    m = LoadMonitor(drain_timeout_s=2)
+    received = []
+
+    async def consume():
+        async for e in m.track_stream(_events(3, delay=0.05)):
+            received.append(e)
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    assert await m.drain(poll_s=0.01)
+    assert len(received) == 3 and m.shed_reason() == "draining" and "draining" in m.not_ready_reasons()
+    await task
+
+    slow = LoadMonitor(drain_timeout_s=0.05)
+    with slow.turn():
+        assert not await slow.drain(poll_s=0.01)
+
+
+@pytest.mark.asyncio
+async def test_sigterm_drains_before_previous_handler():
+    calls = []
+    original = signal.signal(signal.SIGTERM, lambda sig, frame: calls.append(sig))
+    try:
+        m = LoadMonitor(drain_timeout_s=2)
+        assert m.install_drain_handler()
+        stream = m.track_stream(_events(2, delay=0.05))
+        await stream.__anext__()
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.sleep(0.02)
+        assert m.draining and calls == []  # 在途流未结束，尚未交还
+        async for _ in stream:
+            pass
+        await asyncio.sleep(0.3)
+        assert calls == [signal.SIGTERM]
+    finally:
+        signal.signal(signal.SIGTERM, original)
@@ -0,0 +1,34 @@
+from replay_cache import BucketedNonceCache, RotatingBloomNonceCache
+
+
+def test_bucketed_cache_rejects_replay_and_expires_buckets():
+    cache = BucketedNonceCache(bucket_s=10, max_entries=100)
+    assert cache.check_and_add("k:n1", expires_at=125, now=100)
+    assert not cache.check_and_add("k:n1", expires_at=125, now=110)
+    assert cache.check_and_add("k:n2", expires_at=135, now=110)
+    assert cache.stats()["entries"] == 2
+    # 过期后整桶丢弃
+    cache.check_and_add("k:n3", expires_at=200, now=131)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["buckets"] == 2
+
+
+def test_bucketed_cache_fails_closed_when_full():
+    cache = BucketedNonceCache(bucket_s=10, max_entries=2)
+    assert cache.check_and_add("a", 50, now=0)
+    assert cache.check_and_add("b", 50, now=0)
+    assert not cache.check_and_add("c", 50, now=0)
+    assert cache.stats()["rejected_full"] == 1
+
+
+def test_bloom_cache_rejects_replay_with_bounded_memory():
+    cache = RotatingBloomNonceCache(window_s=360, capacity_per_window=10_000, fp_rate=1e-6, bucket_s=30)
+    accepted = sum(cache.check_and_add(f"n{i}", expires_at=1000, now=900) for i in range(800))
+    assert accepted == 800
+    assert not cache.check_and_add("n5", expires_at=1000, now=950)
+    size = cache.stats()["bytes"]
+    for i in range(800, 1600):
+        cache.check_and_add(f"n{i}", expires_at=1010, now=950)
+    assert cache.stats()["bytes"] <= 2 * size
+    cache.check_and_add("late", expires_at=2000, now=1500)
+    assert cache.stats()["buckets"] == 1
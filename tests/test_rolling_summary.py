@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from rolling_summary import RollingSummarizer, turns_after
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+
+
+class SummaryFakeChain(FakeChain):
+    """记录收到的摘要；摘要为已折叠轮次的用户消息拼接。"""
+
+    def __init__(self):
+        self.seen = []
+        self.summarized = []
+
+    async def process_message(self, message, history, recalled=None, knowledge=None, summary=None):
+        self.seen.append((summary, [m["user_message"] for m in turns_after(history, summary)]))
+        return f"回声: {message}"
+
+    async def summarize(self, summary, turns, max_chars):
+        self.summarized.append(len(turns))
+        return "|".join(filter(None, [summary] + [m["user_message"] for m in turns]))
+
+
+def _fill(sm, session_id, n):
+    for i in range(n):
+        sm.add_message(session_id, f"q{i}", f"a{i}")
+
+
+@pytest.mark.asyncio
+async def test_compacts_in_background_and_keeps_recent_turns():
+    sm = SessionManager(max_history_length=20)
+    chain = SummaryFakeChain()
+    summarizer = RollingSummarizer(chain.summarize, trigger_turns=4, keep_turns=2)
+    _fill(sm, "s", 3)
+    assert summarizer.maybe_compact(sm, "s") is None
+    _fill(sm, "s", 1)
+    task = summarizer.maybe_compact(sm, "s")
+    assert summarizer.maybe_compact(sm, "s") is None  # 同一会话同时只有一个折叠任务
+    assert await task
+    summary = sm.get_summary("s")
+    assert summary == {"text": "q0|q1", "upto_seq": 1, "turns": 2}
+    assert [m["seq"] for m in turns_after(sm.get_history("s"), summary)] == [2, 3]
+
+    # 再次达到阈值时与已有摘要合并
+    _fill(sm, "s", 2)
+    await summarizer.maybe_compact(sm, "s")
+    assert sm.get_summary("s")["turns"] == 4 and chain.summarized == [2, 2]
+    assert summarizer.stats()["compactions"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failure_keeps_summary_and_clear_cancels():
+    sm = SessionManager(max_history_length=20)
+    calls = []
+
+    async def flaky(summary, turns, max_chars):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("upstream down")
+        await asyncio.sleep(10)
+
+    summarizer = RollingSummarizer(flaky, trigger_turns=3, keep_turns=1)
+    _fill(sm, "s", 3)
+    assert not await summarizer.maybe_compact(sm, "s")
+    assert sm.get_summary("s") is None and summarizer.failures == 1
+    task = summarizer.maybe_compact(sm, "s")  # 下一次写入后重试
+    await asyncio.sleep(0)
+    sm.clear_session("s")
+    summarizer.forget("s")
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert sm.get_summary("s") is None and not summarizer.running
+
+
+def test_format_history_sends_summary_and_recent_turns():
+    from chat_chain import ChatChain
+
+    history = [{"seq": i, "user_message": f"q{i}", "bot_message": f"a{i}"} for i in range(5)]
+    summary = {"text": "用户在问 q0~q2", "upto_seq": 2, "turns": 3}
+    messages = ChatChain()._format_history({"raw_history": history, "summary": summary})
+    assert messages[0].content.endswith("用户在问 q0~q2")
+    assert [m.content for m in messages[1:]] == ["q3", "a3", "q4", "a4"]
+
+
+@pytest.mark.asyncio
+async def test_chat_uses_summary_and_reports_savings(monkeypatch):
+    main.chat_chain = chain = SummaryFakeChain()
+    main.session_manager = SessionManager(max_history_length=10)
+    summarizer = RollingSummarizer(main._summarize, trigger_turns=4, keep_turns=2)
+    monkeypatch.setattr(main, "rolling_summarizer", summarizer)
+    monkeypatch.setattr(main.settings, "admin_api_key", "admin")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for i in range(4):
+            r = await client.post("/chat", json={"message": f"很长的问题{i}" * 20, "session_id": "long"})
+            assert r.status_code == 200
+        await asyncio.gather(*summarizer.running.values())
+        r = await client.post("/chat", json={"message": "下一个问题", "session_id": "long"})
+        assert r.status_code == 200
+        summary, recent = chain.seen[-1]
+        assert summary["upto_seq"] == 1 and len(recent) == 2
+        stats = (await client.get("/admin/sessions", headers={"X-Admin-Key": "admin"})).json()
+    assert stats["summary"]["prompts_with_summary"] == 1
+    assert stats["summary"]["prompt_tokens_saved"] > 0
+    assert stats["tiers"]["summaries"] == 1
@@ -0,0 +1,75 @@
+import numpy as np
+
+from embeddings import HashingEmbedder, normalize_text, top_k
+from semantic_cache import SemanticCache
+
+
+def test_normalize_and_embed_near_duplicates():
+    assert normalize_text("你能做什么") == normalize_text("你可以做什么？")
+    assert normalize_text("你能做什么呢啊？") == "你能做什么"
+    # 词中的语气词用字保留，不同问题不会归一到同一串
+    assert normalize_text("酒吧在哪") == "酒吧在哪" != normalize_text("酒在哪")
+    assert normalize_text("我想去酒吧") == "我想去酒吧" != normalize_text("我想去酒")
+    assert normalize_text("你在干嘛？") == "你在干嘛"
+    assert normalize_text("嘛呢，哪里买") == "嘛呢哪里买"
+    emb = HashingEmbedder(dim=512)
+    a, b = emb.embed("你能做什么"), emb.embed("今天上海天气怎么样")
+    assert abs(float(np.linalg.norm(a)) - 1.0) < 1e-5
+    assert float(a @ b) < 0.5
+
+
+def test_top_k_orders_by_score():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    assert top_k(scores, 2).tolist() == [1, 3]
+
+
+def test_cache_hit_miss_and_threshold():
+    cache = SemanticCache(capacity=8, threshold=0.9)
+    cache.store("你能做什么", "我可以回答问题", now=100)
+    assert cache.lookup("你可以做什么？", now=101) == "我可以回答问题"
+    assert cache.lookup("你能做什么运动", now=101) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_cache_ttl_and_lru_eviction():
+    cache = SemanticCache(capacity=2, threshold=0.9, ttl_s=50)
+    cache.store("问题一", "答一", now=100)
+    cache.store("问题二", "答二", now=100)
+    cache.lookup("问题一", now=110)
+    cache.store("问题三", "答三", now=120)  # 满：淘汰最久未命中的“问题二”
+    assert len(cache) == 2
+    assert cache.lookup("问题二", now=121) is None
+    assert cache.lookup("问题一", now=121) == "答一"
+    assert cache.lookup("问题一", now=151) is None  # 过期
+
+
+def test_cache_persists_to_memmap(tmp_path):
+    path = str(tmp_path / "cache")
+    cache = SemanticCache(capacity=4, threshold=0.9, path=path)
+    cache.store("你能做什么", "我可以回答问题")
+    cache.close()
+
+    reloaded = SemanticCache(capacity=4, threshold=0.9, path=path)
+    assert isinstance(reloaded.vectors, np.memmap)
+    assert reloaded.lookup("您可以做什么呢") == "我可以回答问题"
+    # 同一路径已被占用时不持久化
+    assert SemanticCache(capacity=4, threshold=0.9, path=path).path is None
+    reloaded.close()
+
+
+def test_cache_snapshot_consistent_after_crash(tmp_path):
+    path = str(tmp_path / "cache")
+    cache = SemanticCache(capacity=1, threshold=0.5, path=path)
+    cache.store("退货流程是什么", "七天内可退货", now=100)
+    cache.flush()
+    cache.store("发票怎么开", "在订单页申请发票", now=101)  # 淘汰并覆盖唯一槽位，未落盘
+    cache._lock_file.close()  # 模拟进程被杀：不经过 close()
+
+    reloaded = SemanticCache(capacity=1, threshold=0.5, path=path)
+    assert reloaded.lookup("发票怎么开", now=102) is None
+    assert reloaded.lookup("退货流程是什么", now=102) == "七天内可退货"
+    reloaded.close()
+
+    # 两次替换之间崩溃：向量已是新快照、元数据仍是旧的，CRC 不符时整体丢弃
+    np.ones((1, reloaded.dim), dtype=np.float32).tofile(path + ".f32")
+    assert len(SemanticCache(capacity=1, threshold=0.5, path=path)) == 0
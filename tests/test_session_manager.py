@@ -0,0 +1,99 @@
+from session_manager import SessionManager
+
+
+def make_manager(tmp_path):
+    return SessionManager(
+        max_history_length=3,
+        hot_idle_s=60,
+        warm_idle_s=600,
+        cold_store_path=str(tmp_path / "sessions.db"),
+    )
+
+
+def test_truncates_history_in_place():
+    sm = SessionManager(max_history_length=2)
+    history = sm.get_history("s")
+    for i in range(4):
+        sm.add_message("s", f"q{i}", f"a{i}")
+    assert [m["user_message"] for m in sm.get_history("s")] == ["q2", "q3"]
+    assert sm.demote_idle() == {"warm": 0, "cold": 0}
+    assert history == []  # 未知会话返回的空列表不会被登记为会话
+
+
+def test_idle_sessions_move_through_tiers_and_promote(tmp_path):
+    sm = make_manager(tmp_path)
+    for sid in ("a", "b", "c"):
+        sm.add_message(sid, f"{sid}-问", f"{sid}-答")
+    now = sm.last_activity["c"]
+    sm.last_activity["a"] = now - 1000
+    sm.last_activity["b"] = now - 100
+
+    assert sm.demote_idle(now) == {"warm": 2, "cold": 1}
+    tiers = sm.tier_stats()
+    assert tiers["hot"]["sessions"] == 1
+    assert tiers["warm"]["sessions"] == 1 and tiers["warm"]["bytes"] > 0
+    assert tiers["cold"] == {"sessions": 1, "messages": 1}
+    assert sm.get_session_stats()["total_sessions"] == 3
+
+    # 访问时透明提升回热层
+    assert sm.get_history("a")[0]["bot_message"] == "a-答"
+    sm.add_message("b", "b-问2", "b-答2")
+    assert len(sm.get_history("b")) == 2
+    tiers = sm.tier_stats()
+    assert tiers["hot"]["sessions"] == 3 and tiers["warm"]["sessions"] == 0 and tiers["cold"]["sessions"] == 0
+    assert tiers["promotions"] == {"warm": 1, "cold": 1}
+
+
+def test_clear_and_clean_cover_all_tiers(tmp_path):
+    sm = make_manager(tmp_path)
+    for sid in ("a", "b"):
+        sm.add_message(sid, "问", "答")
+    now = sm.last_activity["b"]
+    sm.last_activity["a"] = now - 100_000
+    sm.last_activity["b"] = now - 100
+    sm.demote_idle(now)
+    sm.clear_session("b")
+    assert sm.tier_stats()["warm"]["sessions"] == 0
+    assert sm.clean_inactive_sessions(timeout_hours=1) == 1
+    assert sm.get_history("a") == []
+
+
+def test_demote_respects_batch_limit():
+    sm = SessionManager(hot_idle_s=60)
+    for i in range(5):
+        sm.add_message(f"s{i}", "问", "答")
+    now = max(sm.last_activity.values()) + 120
+    assert sm.demote_idle(now, limit=2) == {"warm": 2, "cold": 0}
+    assert list(sm.warm) == ["s0", "s1"]
+    assert sm.demote_idle(now) == {"warm": 3, "cold": 0}
+
+
+def test_peek_history_does_not_promote_or_touch(tmp_path):
+    sm = make_manager(tmp_path)
+    sm.add_message("a", "问", "答")
+    now = sm.last_activity["a"] + 100
+    sm.demote_idle(now)
+    ts = sm.last_activity["a"]
+    assert sm.peek_history("a")[0]["seq"] == 0
+    assert "a" in sm.warm and sm.last_activity["a"] == ts
+    assert sm.peek_history("missing") == []
+
+
+def test_summary_moves_with_session_through_tiers(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "sessions.db"
+    # 旧版冷层库（无 summary 列）可直接沿用
+    sqlite3.connect(path).execute(
+        "CREATE TABLE sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, messages INTEGER NOT NULL, last_activity REAL NOT NULL)"
+    )
+    sm = SessionManager(hot_idle_s=60, warm_idle_s=600, cold_store_path=str(path))
+    sm.add_message("a", "问", "答")
+    summary = {"text": "摘要", "upto_seq": 0, "turns": 1}
+    assert sm.set_summary("a", summary) and not sm.set_summary("missing", summary)
+    sm.demote_idle(sm.last_activity["a"] + 1000)
+    assert sm.tier_stats()["cold"]["sessions"] == 1 and sm.get_summary("a") is None
+    assert sm.get_history("a")[0]["user_message"] == "问"
+    assert sm.get_summary("a") == summary
+    sm.clear_session("a")
+    assert sm.get_summary("a") is None
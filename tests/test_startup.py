@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from langchain_core.language_models.fake import FakeListLLM
+
+import chat_chain as chat_chain_module
+from chat_chain import ChatChain
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_main_defers_heavy_modules():
+    # 新进程中检查：导入 main 不加载 LangChain / dashscope / numpy（可选组件默认关闭）
+    code = (
+        "import sys, main\n"
+        "heavy = [m for m in ('chat_chain', 'langchain_core', 'langchain_community', 'dashscope', 'numpy') "
+        "if m in sys.modules]\n"
+        "print(','.join(heavy))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+@pytest.mark.asyncio
+async def test_chain_built_once_and_warmed(monkeypatch):
+    built = []
+
+    def fake_llm(**kw):
+        built.append(kw)
+        return FakeListLLM(responses=["好的"])
+
+    monkeypatch.setattr(chat_chain_module, "Tongyi", fake_llm)
+    chain = ChatChain()
+    await chain.initialize()
+    await chain.initialize()
+    assert len(built) == 1
+    prompt = await chain.render.ainvoke(
+        {"message": "你好", "raw_history": [], "recalled": None, "knowledge": None}
+    )
+    assert prompt.to_messages()[-1].content == "你好"
+    assert await chain.process_message("你好", []) == "好的"
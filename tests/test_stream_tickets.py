@@ -0,0 +1,21 @@
+from stream_tickets import TicketStore
+
+
+def test_ticket_single_use_and_ttl():
+    store = TicketStore(ttl_s=10)
+    tid, _ = store.issue("你好", "s1", "kid:a", now=100)
+    assert store.peek(tid, now=105)
+    assert store.redeem(tid, now=105).message == "你好"
+    assert store.redeem(tid, now=105) is None
+
+    tid, _ = store.issue("你好", "s1", "kid:a", now=100)
+    assert not store.peek(tid, now=111)
+    assert store.redeem(tid, now=111) is None
+
+
+def test_ticket_store_is_bounded():
+    store = TicketStore(ttl_s=60, max_tickets=3)
+    ids = [store.issue(str(i), "s", "k", now=100 + i)[0] for i in range(5)]
+    assert len(store) == 3
+    assert store.redeem(ids[0], now=110) is None
+    assert store.redeem(ids[4], now=110).message == "4"
@@ -0,0 +1,115 @@
+import hashlib
+
+import pytest
+import pytest_asyncio
+import httpx
+
+import main
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+from token_quota import SlidingWindowCounter, TokenQuotaManager, count_tokens, estimate_prompt_tokens
+
+
+def test_count_tokens_mixed_text():
+    assert count_tokens("") == 0
+    assert count_tokens("你好") == 2
+    assert count_tokens("hello world!") == 3
+    history = [{"user_message": "你好", "bot_message": "您好"}] * 20
+    assert estimate_prompt_tokens("问", history, turns=10) < estimate_prompt_tokens("问", history, turns=20)
+
+
+def test_sliding_window_expires_old_buckets():
+    w = SlidingWindowCounter(window_s=60, buckets=6)
+    w.add(10, 0.0)
+    w.add(5, 30.0)
+    assert w.used(59.0) == 15
+    assert w.used(61.0) == 5
+    assert w.used(200.0) == 0
+    assert len(w.slots) == 0
+
+
+def test_quota_per_key_override_and_cost():
+    q = TokenQuotaManager(limit=100, window_s=60, limits={"kid:big": 1000}, prompt_price_1k=1.0, completion_price_1k=2.0)
+    q.charge("kid:small", "s1", prompt_tokens=60, completion_tokens=30, request=True, now=1.0)
+    assert not q.check("kid:small", 20, now=2.0)
+    assert q.check("kid:big", 500, now=2.0)
+    report = q.key_report("kid:small", now=2.0)
+    assert report["total_tokens"] == 90 and report["remaining"] == 10
+    assert report["cost"] == pytest.approx(0.06 + 0.06)
+    assert q.session_report("s1")["requests"] == 1
+
+
+@pytest_asyncio.fixture
+async def quota_client(monkeypatch):
+    monkeypatch.setattr(main.settings, "token_quota_enabled", True)
+    monkeypatch.setattr(main, "token_quota", TokenQuotaManager(limit=200, window_s=3600))
+    monkeypatch.setattr(main.settings, "internal_api_keys", ["tenant-a", "tenant-b", "tenant-c"])
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        main.chat_chain = FakeChain()
+        main.session_manager = SessionManager(max_history_length=5)
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_chat_rejected_when_budget_spent(quota_client):
+    headers = {"X-API-Key": "tenant-a"}
+    r = await quota_client.post("/chat", json={"message": "你好", "session_id": "q1"}, headers=headers)
+    assert r.status_code == 200
+    usage = (await quota_client.get("/usage", headers=headers)).json()
+    assert usage["requests"] == 1 and usage["completion_tokens"] == count_tokens("回声: 你好")
+
+    main.token_quota.charge(usage["key"], None, prompt_tokens=usage["remaining"])
+    r = await quota_client.post("/chat", json={"message": "你好", "session_id": "q1"}, headers=headers)
+    assert r.status_code == 429
+    # 其他 Key 不受影响
+    r = await quota_client.post("/chat", json={"message": "你好", "session_id": "q2"}, headers={"X-API-Key": "tenant-b"})
+    assert r.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_when_budget_exhausted(quota_client):
+    headers = {"X-API-Key": "tenant-c"}
+    prompt = estimate_prompt_tokens("流式", [], main.settings.prompt_history_turns)
+    # 预算只够提示词与第一个分片
+    usage_key = "ak:" + hashlib.sha256(b"tenant-c").hexdigest()[:16]
+    main.token_quota.limits[usage_key] = prompt + count_tokens("片段1")
+    lines = []
+    async with quota_client.stream("POST", "/chat/stream", json={"message": "流式", "session_id": "q3"}, headers=headers) as r:
+        assert r.status_code == 200
+        async for line in r.aiter_lines():
+            lines.append(line)
+    data = [l for l in lines if l.startswith("data: ")]
+    assert data[0] == "data: 片段1"
+    assert "event: error" in lines
+    assert "data: 片段2" not in data
+    history = main.session_manager.get_history("q3")
+    assert history[0]["bot_message"] == "片段1"
+    usage = (await quota_client.get("/sessions/q3/usage")).json()
+    assert usage["completion_tokens"] == count_tokens("片段1")
+
+
+@pytest.mark.asyncio
+async def test_unknown_api_key_does_not_get_new_bucket(quota_client):
+    # 鉴权关闭时，随意构造的 X-API-Key 与不带头的请求共用客户端 IP 的配额
+    usage = (await quota_client.get("/usage", headers={"X-API-Key": "junk-1"})).json()
+    assert usage["key"].startswith("ip:")
+    main.token_quota.charge(usage["key"], None, prompt_tokens=usage["remaining"])
+    for junk in ("junk-2", "junk-3"):
+        r = await quota_client.post("/chat", json={"message": "你好", "session_id": "q4"}, headers={"X-API-Key": junk})
+        assert r.status_code == 429
+    r = await quota_client.post("/chat", json={"message": "你好", "session_id": "q4"}, headers={"X-API-Key": "tenant-a"})
+    assert r.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_stream_completes_when_budget_spent_by_last_chunk(quota_client):
+    headers = {"X-API-Key": "tenant-b"}
+    prompt = estimate_prompt_tokens("恰好", [], main.settings.prompt_history_turns)
+    usage_key = "ak:" + hashlib.sha256(b"tenant-b").hexdigest()[:16]
+    main.token_quota.limits[usage_key] = prompt + count_tokens("片段1片段2片段3")
+    async with quota_client.stream("POST", "/chat/stream", json={"message": "恰好", "session_id": "q5"}, headers=headers) as r:
+        lines = [line async for line in r.aiter_lines()]
+    assert "event: error" not in lines
+    assert [l for l in lines if l.startswith("data: 片段")] == ["data: 片段1", "data: 片段2", "data: 片段3"]
+    assert main.session_manager.get_history("q5")[0]["bot_message"] == "片段1片段2片段3"
@@ -0,0 +1,94 @@
+import json
+import pytest
+import pytest_asyncio
+import httpx
+from langchain_core.language_models.fake import FakeListLLM
+
+import main
+import chat_chain as chat_chain_module
+from chat_chain import ChatChain
+from session_manager import SessionManager
+from tests.test_api import FakeChain
+from tracing import (
+    FileSpanExporter,
+    InMemorySpanExporter,
+    RatioSampler,
+    Tracer,
+    langchain_callbacks,
+    parse_traceparent,
+)
+
+
+@pytest_asyncio.fixture
+async def traced_client():
+    exporter = InMemorySpanExporter()
+    old_tracer = main.tracer
+    main.tracer = Tracer(exporter=exporter)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        main.chat_chain = FakeChain()
+        main.session_manager = SessionManager(max_history_length=5)
+        yield client, exporter
+    main.tracer = old_tracer
+
+
+@pytest.mark.asyncio
+async def test_request_span_propagates_traceparent(traced_client):
+    client, exporter = traced_client
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    headers = {"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"}
+    r = await client.post("/chat", json={"message": "你好", "session_id": "t1"}, headers=headers)
+    assert r.status_code == 200
+    assert parse_traceparent(r.headers["traceparent"])[0] == trace_id
+
+    names = {s["name"]: s for s in exporter.spans}
+    root = names["POST /chat"]
+    assert root["parent_id"] == "00f067aa0ba902b7"
+    assert names["session.get_history"]["parent_id"] == root["span_id"]
+    assert names["session.add_message"]["parent_id"] == root["span_id"]
+    assert all(s["trace_id"] == trace_id for s in exporter.spans)
+
+
+@pytest.mark.asyncio
+async def test_unsampled_request_records_nothing(traced_client):
+    client, exporter = traced_client
+    main.tracer.sampler = RatioSampler(0.0)
+    r = await client.post("/chat", json={"message": "你好", "session_id": "t2"})
+    assert r.status_code == 200
+    assert r.headers["traceparent"].endswith("-00")
+    assert exporter.spans == []
+
+
+@pytest.mark.asyncio
+async def test_chain_stages_become_child_spans(monkeypatch):
+    monkeypatch.setattr(chat_chain_module, "Tongyi", lambda **kw: FakeListLLM(responses=["好的"]))
+    chain = ChatChain()
+    await chain.initialize()
+
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter=exporter)
+    root = tracer.start_request_span("test")
+    with tracer.activate(root):
+        assert langchain_callbacks()
+        reply = await chain.process_message("你好", [{"user_message": "hi", "bot_message": "hello"}])
+    root.end()
+    assert reply == "好的"
+
+    names = {s["name"] for s in exporter.spans}
+    assert {"prompt.ChatPromptTemplate", "llm.FakeListLLM", "parser.StrOutputParser"} <= names
+    assert any(n.endswith("_format_history") for n in names)
+    span_ids = {s["span_id"] for s in exporter.spans}
+    assert all(s["parent_id"] in span_ids for s in exporter.spans if s["name"] != "test")
+
+
+def test_file_exporter_writes_batches(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = FileSpanExporter(str(path), batch_size=2, flush_interval_s=60, max_queue=3)
+    tracer = Tracer(exporter=exporter)
+    for i in range(5):
+        tracer.start_request_span(f"s{i}").end()
+    exporter.shutdown()
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert 3 <= len(rows) + exporter.dropped <= 5
+    assert len(rows) + exporter.dropped == 5
+    assert rows[0]["name"] == "s0"
@@ -0,0 +1,200 @@
+"""LLM Token 计量与配额：按 API Key 的滑动窗口预算 + 按 Key/会话的用量与成本统计。
+
+- Token 数为离线近似估算（中文每字约 1 token，其余字符约 4 个 1 token），
+  调用前估算提示词 token，流式输出时逐片累计补全 token。
+- 配额使用分桶滑动窗口：每个 Key 最多保留 `buckets` 个桶，判定与记账均为摊还 O(1)。
+- Key 表与会话表按 LRU 设上限，避免无限增长。
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+_CJK_PAT = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# 系统提示词与消息包装的固定开销（近似值）
+SYSTEM_PROMPT_TOKENS = 80
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """近似 token 数：CJK 字符各算 1，其余字符按 4 个折 1。"""
+    if not text:
+        return 0
+    other = len(_CJK_PAT.sub("", text))
+    cjk = len(text) - other
+    return cjk + (other + 3) // 4
+
+
+def estimate_prompt_tokens(
+    message: str, history: List[Dict], turns: int, recalled: Optional[List[Dict]] = None
+) -> int:
+    """估算一次调用的提示词 token：系统提示 + 召回的早期轮次 + 最近 `turns` 轮历史 + 当前消息。"""
+    total = SYSTEM_PROMPT_TOKENS + count_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+    for msg in (recalled or []) + (history[-turns:] if turns else []):
+        total += count_tokens(msg.get("user_message")) + count_tokens(msg.get("bot_message"))
+        total += 2 * MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+class SlidingWindowCounter:
+    """分桶滑动窗口计数器。"""
+
+    __slots__ = ("bucket_s", "buckets", "slots", "total")
+
+    def __init__(self, window_s: float, buckets: int = 60):
+        self.bucket_s = window_s / buckets
+        self.buckets = buckets
+        self.slots: Deque[List[int]] = deque()  # [桶序号, 计数]
+        self.total = 0
+
+    def _expire(self, now: float) -> int:
+        idx = int(now // self.bucket_s)
+        slots = self.slots
+        while slots and slots[0][0] <= idx - self.buckets:
+            self.total -= slots.popleft()[1]
+        return idx
+
+    def add(self, n: int, now: float) -> None:
+        idx = self._expire(now)
+        if self.slots and self.slots[-1][0] == idx:
+            self.slots[-1][1] += n
+        else:
+            self.slots.append([idx, n])
+        self.total += n
+
+    def used(self, now: float) -> int:
+        self._expire(now)
+        return self.total
+
+
+class Usage:
+    """累计用量。"""
+
+    __slots__ = ("requests", "prompt_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def to_dict(self, prompt_price_1k: float, completion_price_1k: float) -> Dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "cost": round(
+                self.prompt_tokens / 1000 * prompt_price_1k
+                + self.completion_tokens / 1000 * completion_price_1k,
+                6,
+            ),
+        }
+
+
+class TokenQuotaManager:
+    def __init__(
+        self,
+        limit: int,
+        window_s: float,
+        limits: Optional[Dict[str, int]] = None,
+        prompt_price_1k: float = 0.0,
+        completion_price_1k: float = 0.0,
+        max_keys: int = 100_000,
+        max_sessions: int = 100_000,
+    ):
+        self.limit = limit
+        self.window_s = window_s
+        self.limits = dict(limits or {})
+        self.prompt_price_1k = prompt_price_1k
+        self.completion_price_1k = completion_price_1k
+        self.max_keys = max_keys
+        self.max_sessions = max_sessions
+        self.windows: "OrderedDict[str, SlidingWindowCounter]" = OrderedDict()
+        self.key_usage: "OrderedDict[str, Usage]" = OrderedDict()
+        self.session_usage: "OrderedDict[str, Usage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def limit_for(self, key: str) -> int:
+        return self.limits.get(key, self.limit)
+
+    def _lru_get(self, table: OrderedDict, key: str, factory, cap: int):
+        item = table.get(key)
+        if item is None:
+            item = factory()
+            table[key] = item
+            if len(table) > cap:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return item
+
+    def remaining(self, key: str, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            window = self.windows.get(key)
+            used = window.used(now) if window is not None else 0
+        return self.limit_for(key) - used
+
+    def check(self, key: str, estimate: int, now: Optional[float] = None) -> bool:
+        """调用前判定：窗口内已用 + 预估提示词 token 不超过预算。"""
+        return self.remaining(key, now) >= estimate
+
+    def charge(
+        self,
+        key: str,
+        session_id: Optional[str],
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        request: bool = False,
+        now: Optional[float] = None,
+    ) -> int:
+        """记账并返回该 Key 的剩余预算（可能为负）。流式输出时可多次调用。"""
+        now = time.time() if now is None else now
+        n = prompt_tokens + completion_tokens
+        with self._lock:
+            window = self._lru_get(
+                self.windows, key, lambda: SlidingWindowCounter(self.window_s), self.max_keys
+            )
+            window.add(n, now)
+            targets = [self._lru_get(self.key_usage, key, Usage, self.max_keys)]
+            if session_id is not None:
+                targets.append(self._lru_get(self.session_usage, session_id, Usage, self.max_sessions))
+            for usage in targets:
+                usage.requests += int(request)
+                usage.prompt_tokens += prompt_tokens
+                usage.completion_tokens += completion_tokens
+            return self.limit_for(key) - window.total
+
+    def key_report(self, key: str, now: Optional[float] = None) -> Dict:
+        usage = self.key_usage.get(key) or Usage()
+        out = usage.to_dict(self.prompt_price_1k, self.completion_price_1k)
+        out.update({"key": key, "limit": self.limit_for(key), "window_s": self.window_s})
+        out["remaining"] = max(0, self.remaining(key, now))
+        return out
+
+    def session_report(self, session_id: str) -> Dict:
+        usage = self.session_usage.get(session_id) or Usage()
+        return usage.to_dict(self.prompt_price_1k, self.completion_price_1k)
+
+    def all_keys_report(self) -> List[Dict]:
+        return [self.key_report(k) for k in list(self.key_usage)]
+
+    def forget_session(self, session_id: str) -> None:
+        with self._lock:
+            self.session_usage.pop(session_id, None)
+
+
+def build_token_quota(s) -> TokenQuotaManager:
+    return TokenQuotaManager(
+        limit=s.token_quota_limit,
+        window_s=s.token_quota_window_s,
+        limits=s.token_quota_limits,
+        prompt_price_1k=s.token_price_prompt_per_1k,
+        completion_price_1k=s.token_price_completion_per_1k,
+        max_sessions=s.token_usage_max_sessions,
+    )
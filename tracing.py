@@ -0,0 +1,341 @@
+"""轻量链路追踪：请求级 Span、链路阶段子 Span、可插拔导出器与采样器。
+
+设计要点：
+- 每个 HTTP 请求一个根 Span，会话读写与 ChatChain 各阶段（历史格式化、提示渲染、
+  LLM 调用、输出解析）作为子 Span；当前 Span 通过 contextvars 在协程间传递。
+- 兼容 W3C `traceparent` 请求头：沿用上游 trace id 与采样标记，响应中回写。
+- 采样器决定是否记录；未采样的请求只保留 trace id，不创建子 Span、不挂 LangChain 回调。
+- 导出器可插拔；`FileSpanExporter` 在后台线程批量写入 JSONL，队列有界，满则丢弃并计数。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.tracers.base import BaseTracer
+
+logger = logging.getLogger("app.tracing")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+_TRACEPARENT_PAT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str, bool]]:
+    """解析 `traceparent`，返回 (trace_id, parent_span_id, sampled)；非法时返回 None。"""
+    if not value:
+        return None
+    m = _TRACEPARENT_PAT.match(value.strip().lower())
+    if not m:
+        return None
+    trace_id, parent_id, flags = m.groups()
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 0x01)
+
+
+class Span:
+    """单个 Span；`recording=False` 表示未采样，仅携带 trace id 用于透传。"""
+
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status",
+        "recording",
+    )
+
+    def __init__(
+        self,
+        tracer: Optional["Tracer"],
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        recording: bool = True,
+        start_ns: Optional[int] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "ok"
+        self.recording = recording
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.recording:
+            self.attributes[key] = value
+
+    def record_error(self, exc: BaseException) -> None:
+        if self.recording:
+            self.status = "error"
+            self.attributes["error.type"] = type(exc).__name__
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.recording and self.tracer is not None:
+            self.tracer._on_end(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.recording else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(((self.end_ns or self.start_ns) - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+# ---------- 采样器 ----------
+class Sampler:
+    def should_sample(self, trace_id: str) -> bool:
+        raise NotImplementedError
+
+
+class AlwaysOnSampler(Sampler):
+    def should_sample(self, trace_id: str) -> bool:
+        return True
+
+
+class AlwaysOffSampler(Sampler):
+    def should_sample(self, trace_id: str) -> bool:
+        return False
+
+
+class RatioSampler(Sampler):
+    """按 trace id 低 64 位确定性采样，同一 trace 在各副本上的判定一致。"""
+
+    def __init__(self, ratio: float):
+        self.ratio = max(0.0, min(1.0, ratio))
+        self._bound = int(self.ratio * (1 << 64))
+
+    def should_sample(self, trace_id: str) -> bool:
+        if self.ratio >= 1.0:
+            return True
+        if self.ratio <= 0.0:
+            return False
+        return int(trace_id[-16:], 16) < self._bound
+
+
+# ---------- 导出器 ----------
+class SpanExporter:
+    """导出器接口：`export` 在请求路径上被调用，实现需保证开销可控。"""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        return None
+
+    def shutdown(self) -> None:
+        self.flush()
+
+
+class InMemorySpanExporter(SpanExporter):
+    """内存导出器（测试/调试用）。"""
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span.to_dict())
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class FileSpanExporter(SpanExporter):
+    """批量写入本地 JSONL 文件，每行一个 Span，便于离线分析。
+
+    请求路径只做一次 deque 追加；后台线程按 `flush_interval_s` 或攒满 `batch_size`
+    时落盘。队列超过 `max_queue` 时丢弃新 Span 并累计 `dropped`。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 256,
+        flush_interval_s: float = 5.0,
+        max_queue: int = 10000,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue: Deque[Span] = deque()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._worker.start()
+
+    def export(self, span: Span) -> None:
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(span)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval_s)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._write_lock:
+            if not self._queue:
+                return
+            lines = []
+            while self._queue:
+                try:
+                    span = self._queue.popleft()
+                except IndexError:
+                    break
+                lines.append(json.dumps(span.to_dict(), ensure_ascii=False))
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError as e:
+                logger.warning("span export failed: %s", e)
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        self._worker.join(timeout=self.flush_interval_s + 1)
+        self.flush()
+
+
+# ---------- Tracer ----------
+class Tracer:
+    def __init__(self, exporter: Optional[SpanExporter] = None, sampler: Optional[Sampler] = None):
+        self.exporter = exporter
+        self.sampler = sampler or AlwaysOnSampler()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_request_span(self, name: str, traceparent: Optional[str] = None) -> Span:
+        """创建请求根 Span；上游携带 `traceparent` 时沿用其 trace id 与采样标记。"""
+        parsed = parse_traceparent(traceparent)
+        if parsed:
+            trace_id, parent_id, sampled = parsed
+        else:
+            trace_id, parent_id = _new_trace_id(), None
+            sampled = self.sampler.should_sample(trace_id)
+        return Span(self, name, trace_id, parent_id=parent_id, recording=sampled and self.enabled)
+
+    @contextmanager
+    def activate(self, span: Span) -> Iterator[Span]:
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def _on_end(self, span: Span) -> None:
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:  # 导出失败不影响业务
+            logger.warning("span export failed: %s", e)
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """在当前 Span 下开启子 Span；无活动或未采样时为空操作。"""
+    parent = _current_span.get()
+    if parent is None or not parent.recording:
+        yield None
+        return
+    child = Span(parent.tracer, name, parent.trace_id, parent_id=parent.span_id)
+    child.attributes.update(attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def langchain_callbacks() -> List["BaseTracer"]:
+    """返回挂在当前 Span 下的 LangChain 回调；未采样时返回空列表（零额外开销）。"""
+    parent = _current_span.get()
+    if parent is None or not parent.recording:
+        return []
+    # LangChain 依赖较重，仅在采样到的请求首次调用链路时导入
+    from langchain_tracing import LangChainSpanHandler
+
+    return [LangChainSpanHandler(parent)]
+
+
+def build_tracer(s) -> Tracer:
+    """依据配置构建 Tracer；未启用时返回不导出的 Tracer。"""
+    if not s.tracing_enabled:
+        return Tracer()
+    if s.tracing_exporter == "file":
+        exporter: SpanExporter = FileSpanExporter(
+            s.tracing_file_path,
+            batch_size=s.tracing_batch_size,
+            flush_interval_s=s.tracing_flush_interval_s,
+            max_queue=s.tracing_max_queue,
+        )
+    else:
+        exporter = InMemorySpanExporter()
+    return Tracer(exporter=exporter, sampler=RatioSampler(s.tracing_sample_ratio))